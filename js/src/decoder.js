@@ -0,0 +1,274 @@
+import { dequantize, interleave_xy, to_float32 } from './utils';
+
+// Payloads smaller than this are decoded on the main thread, which is
+// quicker than a round trip to the worker
+const WORKER_MIN_BYTES = 256 * 1024;
+
+/**
+ * Body of the decoding worker. It is started from its source text, so it
+ * must not refer to anything outside of itself; its jobs mirror
+ * `dequantize`, `to_float32` and `interleave_xy` of `utils`.
+ *
+ * @param {DedicatedWorkerGlobalScope} scope
+ */
+function decode_worker(scope) {
+    const TYPES = {
+        f4: Float32Array,
+        f8: Float64Array,
+        i1: Int8Array,
+        i2: Int16Array,
+        i4: Int32Array,
+        u1: Uint8Array,
+        u2: Uint16Array,
+        u4: Uint32Array,
+    };
+    if (scope.BigInt64Array !== undefined) {
+        TYPES.i8 = scope.BigInt64Array;
+    }
+    const view = (buffer, dtype) => {
+        if (dtype === 'i8' && TYPES.i8 === undefined) {
+            // 64-bit integers as numbers, from their 32-bit halves
+            const data = new DataView(buffer);
+            const values = new Float64Array(buffer.byteLength / 8);
+            for (let i = 0; i < values.length; i++) {
+                values[i] =
+                    data.getInt32(8 * i + 4, true) * 4294967296 +
+                    data.getUint32(8 * i, true);
+            }
+            return values;
+        }
+        return new TYPES[dtype](buffer);
+    };
+    const output = (out, length) =>
+        out && out.byteLength === 4 * length
+            ? new Float32Array(out)
+            : new Float32Array(length);
+    const jobs = {
+        dequantize(buffers, { scale, offset }, out) {
+            const quantized = new Int16Array(buffers[0]);
+            const samples = output(out, quantized.length);
+            for (let i = 0; i < quantized.length; i++) {
+                samples[i] = quantized[i] * scale + offset;
+            }
+            return samples;
+        },
+        to_float32(buffers, { dtype }, out) {
+            const values = view(buffers[0], dtype);
+            const samples = output(out, values.length);
+            if (TYPES.i8 !== undefined && values instanceof TYPES.i8) {
+                for (let i = 0; i < values.length; i++) {
+                    samples[i] = Number(values[i]);
+                }
+            } else {
+                samples.set(values);
+            }
+            return samples;
+        },
+        interleave_xy(buffers, { dtypes }) {
+            const xs = view(buffers[0], dtypes[0]);
+            const ys = view(buffers[1], dtypes[1]);
+            const points = new Float64Array(2 * ys.length);
+            for (let i = 0; i < ys.length; i++) {
+                points[2 * i] = Number(xs[i]);
+                points[2 * i + 1] = Number(ys[i]);
+            }
+            return points;
+        },
+    };
+    scope.onmessage = function (event) {
+        const { id, job, buffers, params, out } = event.data;
+        const result = jobs[job](buffers, params, out);
+        scope.postMessage({ id: id, result: result.buffer }, [result.buffer]);
+    };
+}
+
+let shared_decoder;
+
+/**
+ * Decodes large binary payloads in a Web Worker, off the main thread;
+ * buffers are transferred to and from the worker, not copied
+ */
+export class Decoder {
+    /**
+     * The decoder shared by all plots of the page
+     *
+     * @returns {Decoder}
+     */
+    static shared() {
+        if (!shared_decoder) {
+            shared_decoder = new Decoder();
+        }
+        return shared_decoder;
+    }
+
+    constructor() {
+        // Callbacks of the jobs sent to the worker, by id
+        this.jobs = {};
+        this.next_id = 0;
+        this.worker = undefined;
+    }
+
+    /**
+     * Whether payloads are worth decoding in the worker, and the worker runs
+     *
+     * @param {...DataView} payloads    Payloads, as received from the kernel,
+     *                                  decoded together
+     * @returns {boolean}
+     */
+    accepts(...payloads) {
+        const bytes = payloads.reduce((sum, data) => sum + data.byteLength, 0);
+        return bytes >= WORKER_MIN_BYTES && this._start() !== null;
+    }
+
+    /**
+     * Expands 16-bit quantized samples in the worker; see `dequantize`
+     *
+     * @param {DataView} data   Little-endian int16 samples, as received
+     * @param {number} scale    Size of one quantization step
+     * @param {number} offset   Value of the quantized sample 0
+     * @param {Float32Array} [out]  Array spanning its whole buffer to expand
+     *                              the samples into, if it has the right
+     *                              length; the buffer is transferred to the
+     *                              worker and back, so it must not be in use
+     *                              meanwhile, and only the array resolved
+     *                              views it afterwards
+     * @returns {Promise<Float32Array>}
+     */
+    dequantize(data, scale, offset, out) {
+        return this._run(
+            'dequantize',
+            [data],
+            { scale, offset },
+            Float32Array,
+            out,
+            (out) => dequantize(data, scale, offset, out)
+        );
+    }
+
+    /**
+     * Copies or converts samples to float32 in the worker; see `to_float32`
+     *
+     * @param {DataView} data   Samples, as received
+     * @param {string} dtype    Numpy dtype string of the samples without the
+     *                          byte order, e.g., 'f4'
+     * @param {Float32Array} [out]  As for `dequantize`
+     * @returns {Promise<Float32Array>}
+     */
+    to_float32(data, dtype, out) {
+        return this._run(
+            'to_float32',
+            [data],
+            { dtype },
+            Float32Array,
+            out,
+            (out) => to_float32(data, dtype, out)
+        );
+    }
+
+    /**
+     * Interleaves abscissas and ordinates in the worker; see
+     * `interleave_xy`
+     *
+     * @param {DataView} x      Abscissas, as received
+     * @param {DataView} y      Ordinates, as received
+     * @param {array} dtypes    Numpy dtype strings of `x` and `y` without
+     *                          the byte order
+     * @returns {Promise<Float64Array>}
+     */
+    interleave_xy(x, y, dtypes) {
+        return this._run(
+            'interleave_xy',
+            [x, y],
+            { dtypes },
+            Float64Array,
+            undefined,
+            () => interleave_xy(x, y, dtypes)
+        );
+    }
+
+    /**
+     * Runs a job of the worker, or `fallback` on the main thread if the
+     * worker is unavailable or fails
+     *
+     * @param {string} job          Name of the job, see `decode_worker`
+     * @param {array} payloads      DataViews the job reads
+     * @param {object} params       Other arguments of the job
+     * @param {function} Type       Typed array constructor of the result
+     * @param {Float32Array} [out]  Array to decode into, see `dequantize`
+     * @param {function} fallback   Called with `out`, or with nothing once
+     *                              `out` is lost to a failed worker
+     * @returns {Promise<TypedArray>}
+     * @private
+     */
+    _run(job, payloads, params, Type, out, fallback) {
+        const worker = this._start();
+        if (worker === null) {
+            return Promise.resolve(fallback(out));
+        }
+        // Other views of the model, and views rendered later, still need the
+        // payloads, so the worker gets copies, which are also aligned
+        const buffers = payloads.map((data) =>
+            data.buffer.slice(
+                data.byteOffset,
+                data.byteOffset + data.byteLength
+            )
+        );
+        const id = this.next_id++;
+        const out_buffer = out ? out.buffer : undefined;
+        const transfer = out ? [...buffers, out_buffer] : buffers;
+        return new Promise((resolve, reject) => {
+            this.jobs[id] = { resolve, reject, Type };
+            worker.postMessage(
+                { id, job, buffers, params, out: out_buffer },
+                transfer
+            );
+        }).catch(() => fallback());
+    }
+
+    /**
+     * The worker, started on first use, or null if workers are unavailable
+     *
+     * @returns {Worker|null}
+     * @private
+     */
+    _start() {
+        if (this.worker !== undefined) {
+            return this.worker;
+        }
+        this.worker = null;
+        if (typeof Worker === 'undefined' || typeof Blob === 'undefined') {
+            return null;
+        }
+        try {
+            const url = URL.createObjectURL(
+                new Blob([`(${decode_worker.toString()})(self);`], {
+                    type: 'application/javascript',
+                })
+            );
+            this.worker = new Worker(url);
+            URL.revokeObjectURL(url);
+        } catch (error) {
+            // E.g., a content security policy forbidding blob: workers
+            console.debug(`Decoding on the main thread: ${error}`);
+            return null;
+        }
+        this.worker.onmessage = (event) => {
+            const { id, result } = event.data;
+            const job = this.jobs[id];
+            delete this.jobs[id];
+            if (job) {
+                job.resolve(new job.Type(result));
+            }
+        };
+        this.worker.onerror = (event) => {
+            // Decode on the main thread from now on
+            console.debug(`Decoding worker failed: ${event.message}`);
+            const jobs = this.jobs;
+            this.jobs = {};
+            this.worker.terminate();
+            this.worker = null;
+            Object.values(jobs).forEach((job) => job.reject(event));
+        };
+        return this.worker;
+    }
+}
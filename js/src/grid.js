@@ -0,0 +1,139 @@
+import { DOMWidgetModel, DOMWidgetView } from '@jupyter-widgets/base';
+import { version } from '../package';
+import { PlotPanel } from './panel';
+import { save_snapshot } from './snapshots';
+
+export class SigPlotGridModel extends DOMWidgetModel {
+    defaults() {
+        return {
+            ...super.defaults(),
+            _model_name: 'SigPlotGridModel',
+            _view_name: 'SigPlotGridView',
+            _model_module: 'jupyter_sigplot',
+            _view_module: 'jupyter_sigplot',
+            _model_module_version: version,
+            _view_module_version: version,
+            rows: 1,
+            cols: 1,
+            panel_height: 200,
+            panel_options: [],
+            commands: {},
+        };
+    }
+}
+
+/**
+ * Many sigplot plots behind one widget: a CSS grid of panels, each a
+ * `PlotPanel`, updated by batches of commands addressed to them by index
+ */
+export class SigPlotGridView extends DOMWidgetView {
+    render() {
+        this.uuid = this.model.get('uuid');
+        this.el.style.display = 'grid';
+        const cols = this.model.get('cols');
+        this.el.style.gridTemplateColumns = `repeat(${cols}, 1fr)`;
+        this.el.style.width = '100%';
+
+        const height = `${this.model.get('panel_height')}px`;
+        this.panels = this.model.get('panel_options').map((options) => {
+            const el = document.createElement('div');
+            el.style.height = height;
+            el.style.minWidth = '0';
+            this.el.appendChild(el);
+            return new PlotPanel(el, options);
+        });
+
+        this.listenTo(this.model, 'change:commands', this.handle_commands);
+
+        // Wait for element to be added to the DOM
+        const self = this;
+        window.setTimeout(function () {
+            self.panels.forEach((panel) => panel.plot.checkresize());
+        }, 0);
+    }
+
+    /**
+     * Applies a batch of commands, routing each to its panel, then saves
+     * one snapshot of the whole grid
+     */
+    handle_commands() {
+        const { commands = [] } = this.model.get('commands');
+        const traced = {};
+        const handled = commands.map((cmd_and_args) => {
+            const panel = this.panels[cmd_and_args.panel];
+            if (!panel) {
+                console.debug(`Unknown panel ${cmd_and_args.panel}.`);
+                return undefined;
+            }
+            if (cmd_and_args.trace !== undefined) {
+                traced[cmd_and_args.panel] = cmd_and_args.trace;
+            }
+            return panel.handle(cmd_and_args);
+        });
+        Promise.all(handled).then(() => this._save_snapshot(traced));
+    }
+
+    /**
+     * Sends the spans recorded so far to the kernel, per panel
+     *
+     * @private
+     */
+    _flush_trace() {
+        this.panels.forEach((panel, index) => {
+            const spans = panel.take_spans();
+            if (spans.length) {
+                this.send({
+                    event: 'trace',
+                    panel: index,
+                    view: `${this.cid}/${index}`,
+                    spans: spans,
+                });
+            }
+        });
+    }
+
+    /**
+     * Saves a screenshot of all panels, composed on one canvas, into the
+     * placeholder output
+     *
+     * @param {object} traced   Ids of the traced commands, by panel index
+     * @private
+     */
+    _save_snapshot(traced) {
+        const self = this;
+        window.setTimeout(function () {
+            const bounds = self.el.getBoundingClientRect();
+            if (!bounds.width || !bounds.height) {
+                self._flush_trace();
+                return;
+            }
+            const composite = document.createElement('canvas');
+            composite.width = bounds.width;
+            composite.height = bounds.height;
+            const context = composite.getContext('2d');
+            self.panels.forEach((panel, index) => {
+                panel.traced(traced[index], 'snapshot', () => {
+                    const canvas = panel.canvas();
+                    const rect = canvas.getBoundingClientRect();
+                    context.drawImage(
+                        canvas,
+                        rect.left - bounds.left,
+                        rect.top - bounds.top,
+                        rect.width,
+                        rect.height
+                    );
+                });
+            });
+            const image_data = composite.toDataURL('image/png');
+            self._flush_trace();
+            save_snapshot(self, 'SigPlot grid', image_data);
+        }, 10);
+    }
+
+    remove() {
+        window.clearTimeout(this.snapshot_timer);
+        this.panels.forEach((panel) => panel.destroy());
+        this.panels = [];
+        super.remove();
+    }
+}
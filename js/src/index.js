@@ -1,3 +1,4 @@
 // Export widget models and views, and the npm package version number.
 export * from './sigplot_ext.js';
+export * from './grid.js';
 export { version } from '../package.json';
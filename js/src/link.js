@@ -0,0 +1,79 @@
+// Views of linked plots, by link group
+const groups = {};
+
+// Ranges waiting to be applied to the other views of their group, by group
+const pending = {};
+
+/**
+ * Current axis ranges of a `sigplot.Plot`
+ *
+ * @param {Plot} plot
+ * @returns {{xmin: number, xmax: number, ymin: number, ymax: number,
+ *            level: number}}
+ */
+export function plot_range(plot) {
+    const level = plot._Gx.level;
+    const { xmin, xmax, ymin, ymax } = plot._Gx.stk[level];
+    return { xmin, xmax, ymin, ymax, level };
+}
+
+/**
+ * Adds `view` to the group named in `link`, leaving the group it was in
+ *
+ * @param {object} view     A view with a `follow(range, axes)` method
+ * @param {object} link     The `link` of the view's model
+ * @param {string} [link.group]     Name of the group; none to unlink
+ * @param {string} [link.axes]      Linked axes: 'x', 'y' or 'xy'
+ */
+export function link_view(view, link) {
+    unlink_view(view);
+    if (!link || !link.group) {
+        return;
+    }
+    view.link = link;
+    (groups[link.group] = groups[link.group] || new Set()).add(view);
+}
+
+/**
+ * Removes `view` from its group
+ *
+ * @param {object} view
+ */
+export function unlink_view(view) {
+    const link = view.link;
+    view.link = undefined;
+    if (link && groups[link.group]) {
+        groups[link.group].delete(view);
+        if (!groups[link.group].size) {
+            delete groups[link.group];
+        }
+    }
+}
+
+/**
+ * Has the other views of the group of `view` follow its new `range`, at
+ * the next animation frame; ranges set meanwhile supersede it
+ *
+ * @param {object} view
+ * @param {object} range    See `plot_range`
+ */
+export function propagate(view, range) {
+    const link = view.link;
+    if (!link) {
+        return;
+    }
+    const scheduled = link.group in pending;
+    pending[link.group] = { source: view, range: range };
+    if (scheduled) {
+        return;
+    }
+    window.requestAnimationFrame(() => {
+        const { source, range } = pending[link.group];
+        delete pending[link.group];
+        (groups[link.group] || []).forEach((other) => {
+            if (other !== source) {
+                other.follow(range, link.axes);
+            }
+        });
+    });
+}
@@ -0,0 +1,678 @@
+import { Plot, plugins } from 'sigplot';
+import { Decoder } from './decoder';
+import { BufferPool } from './pool';
+import {
+    decode_markers,
+    dequantize,
+    dtype_view,
+    interleave_xy,
+    to_float32,
+    trace_clock,
+    typed_view,
+} from './utils';
+
+// Commands whose first argument is sent as binary float32 samples
+const BINARY_COMMANDS = ['overlay_array', 'reload', 'push'];
+
+// Commands updating live layers, whose samples are decoded into arrays
+// reused from one update to the next
+const POOLED_COMMANDS = ['reload', 'push'];
+
+// Commands that take the index of an existing layer as first argument
+const LAYER_COMMANDS = ['reload', 'push', 'remove_layer'];
+
+// Commands implemented by the panel rather than by `sigplot.Plot`
+const VIEW_COMMANDS = ['add_markers', 'clear_markers'];
+
+// Text drawn for markers without a label
+const DEFAULT_MARKER = '\u2022';
+
+/**
+ * A sigplot plot driven by commands from the kernel; shared by the views of
+ * a `Plot` and the panels of a `PlotGrid`
+ */
+export class PlotPanel {
+    /**
+     * @param {HTMLElement} el      Element to draw the plot in
+     * @param {object} plot_options     Options of `sigplot.Plot`
+     */
+    constructor(el, plot_options) {
+        this.el = el;
+        this.plot = new Plot(el, plot_options);
+
+        // Layers the kernel addresses again by id (e.g., for `reload`)
+        this.layers = {};
+
+        // Spans of traced commands not yet sent to the kernel
+        this.trace_spans = [];
+
+        // Decodes large payloads off the main thread; while it does, later
+        // commands wait for the command being decoded, in `pending`
+        this.decoder = Decoder.shared();
+        this.pending = null;
+
+        // Arrays live layers are decoded into, and the array sigplot draws
+        // for each, by layer id
+        this.pool = new BufferPool();
+        this.fronts = {};
+    }
+
+    /**
+     * Applies a command sent by the kernel
+     *
+     * @param {object} cmd_and_args     The command/arg combo
+     * @param {string} cmd_and_args.command     Command from {overlay_*, change_settings}
+     * @param {array} cmd_and_args.arguments    Arguments for respective sigplot.Plot functions
+     * @param {number} [cmd_and_args.layer]     Kernel-side id of the layer created or updated
+     * @param {object} [cmd_and_args.quantized]  Scale and offset of 16-bit binary samples
+     * @param {array} [cmd_and_args.traces]      Layer options of each trace in a multi-trace `overlay_array`
+     * @param {array} [cmd_and_args.layers]      Kernel-side ids of those traces, or of those columns
+     * @param {array} [cmd_and_args.columns]     Name and dtype of each column of an `overlay_table`
+     * @param {array} [cmd_and_args.dtypes]      Dtypes of the x and y buffers of an `overlay_xy`
+     * @param {number} [cmd_and_args.trace]      Id of the command, if it is traced
+     * @returns {Promise}   Settled once the command is applied
+     */
+    handle(cmd_and_args) {
+        const trace_id = cmd_and_args.trace;
+        // Decoding starts at once, even if an earlier command is pending
+        const start = trace_clock();
+        let decoded = this._offload(cmd_and_args);
+        if (decoded === undefined && this.pending === null) {
+            this._handle(cmd_and_args);
+            return Promise.resolve();
+        }
+
+        if (decoded !== undefined) {
+            decoded = decoded.then((samples) => {
+                if (trace_id !== undefined) {
+                    this.trace_spans.push({
+                        name: 'decode',
+                        id: trace_id,
+                        ts: start,
+                        dur: trace_clock() - start,
+                    });
+                }
+                return samples;
+            });
+        }
+        const done = (this.pending || Promise.resolve())
+            .then(() => decoded)
+            .then((samples) => this._handle(cmd_and_args, samples))
+            .catch((error) => console.error(error))
+            .then(() => {
+                if (this.pending === done) {
+                    this.pending = null;
+                }
+            });
+        this.pending = done;
+        return done;
+    }
+
+    /**
+     * Starts decoding the binary payloads of a command in the worker, if
+     * they need converting and are large enough; float32 payloads are
+     * drawn as they are, without copying
+     *
+     * @param {object} cmd_and_args     See `handle`
+     * @returns {Promise|undefined}     Resolves to what `_handle` takes as
+     *                                  decoded: the samples, the converted
+     *                                  columns of an `overlay_table`, or the
+     *                                  points of an `overlay_xy`; undefined
+     *                                  if decoded on the main thread
+     * @private
+     */
+    _offload(cmd_and_args) {
+        const {
+            command,
+            arguments: model_args,
+            layer: layer_id,
+            quantized,
+            columns,
+            dtypes,
+        } = cmd_and_args;
+        const decoder = this.decoder;
+
+        if (columns) {
+            // float32 columns are viewed without copying
+            const offloaded = columns.map(
+                ({ dtype }, i) =>
+                    dtype.slice(1) !== 'f4' && decoder.accepts(model_args[0][i])
+            );
+            if (!offloaded.includes(true)) {
+                return undefined;
+            }
+            return Promise.all(
+                columns.map(({ dtype }, i) =>
+                    offloaded[i]
+                        ? decoder.to_float32(model_args[0][i], dtype.slice(1))
+                        : undefined
+                )
+            );
+        }
+        if (dtypes) {
+            const [x, y] = model_args;
+            return decoder.accepts(x, y)
+                ? decoder.interleave_xy(x, y, dtypes.map((d) => d.slice(1)))
+                : undefined;
+        }
+        // float32 samples are viewed without copying, or copied into a
+        // pooled array, on the main thread; only quantized ones need work
+        if (
+            !BINARY_COMMANDS.includes(command) ||
+            !quantized ||
+            !decoder.accepts(model_args[0])
+        ) {
+            return undefined;
+        }
+
+        const data = model_args[0];
+        // Into a spare array, since the array sigplot draws cannot be lent
+        // to the worker
+        const out = this._is_pooled(cmd_and_args)
+            ? this.pool.acquire(layer_id, data.byteLength / 2)
+            : undefined;
+        const decoded = decoder.dequantize(
+            data,
+            quantized.scale,
+            quantized.offset,
+            out
+        );
+        return out
+            ? decoded.then((samples) => this.pool.adopt(samples))
+            : decoded;
+    }
+
+    /**
+     * Destroys the sigplot instance: removes its layers, dropping their
+     * typed arrays, and its canvases; later commands are ignored
+     */
+    destroy() {
+        if (!this.plot) {
+            return;
+        }
+        this.plot.deoverlay();
+        if (typeof this.plot.destroy === 'function') {
+            this.plot.destroy();
+        }
+        this.el.replaceChildren();
+        this.plot = null;
+        this.layers = {};
+        this.pool.clear();
+        this.fronts = {};
+        this.annotations = null;
+        this.trace_spans = [];
+        this.pending = null;
+    }
+
+    /**
+     * Applies a command, see `handle`
+     *
+     * @param {object} cmd_and_args
+     * @param {*} [decoded]     The binary arguments, already decoded; see
+     *                          `_offload`
+     * @private
+     */
+    _handle(cmd_and_args, decoded) {
+        if (!this.plot) {
+            // Destroyed while the command was decoded
+            return;
+        }
+        const {
+            command: new_command,
+            arguments: model_args,
+            layer: layer_id,
+            quantized,
+            traces,
+            layers: layer_ids,
+            columns,
+            dtypes,
+            trace: trace_id,
+        } = cmd_and_args;
+
+        this.trace_id = trace_id;
+        this._traced('receive', () => {
+            if (VIEW_COMMANDS.includes(new_command)) {
+                this._traced('render', () =>
+                    this[new_command].apply(this, model_args)
+                );
+            } else if (columns) {
+                this._overlay_table(model_args, columns, layer_ids, decoded);
+            } else if (dtypes) {
+                this._overlay_xy(model_args, dtypes, layer_id, decoded);
+            } else if (traces) {
+                this._overlay_traces(
+                    model_args,
+                    traces,
+                    layer_ids,
+                    quantized,
+                    decoded
+                );
+            } else {
+                this._apply_plot_command(
+                    new_command,
+                    model_args,
+                    layer_id,
+                    quantized,
+                    decoded
+                );
+            }
+        });
+        this.trace_id = undefined;
+    }
+
+    /**
+     * Runs `fn`, recording how long it took if the command is traced
+     *
+     * @param {number} [trace_id]   Id of the command, if it is traced
+     * @param {string} name         Name of the step
+     * @param {function} fn
+     * @returns {*}                 The result of `fn`
+     */
+    traced(trace_id, name, fn) {
+        if (trace_id === undefined) {
+            return fn();
+        }
+        const start = trace_clock();
+        try {
+            return fn();
+        } finally {
+            this.trace_spans.push({
+                name: name,
+                id: trace_id,
+                ts: start,
+                dur: trace_clock() - start,
+            });
+        }
+    }
+
+    /**
+     * Runs `fn` as a step of the command being handled, see `traced`
+     *
+     * @param {string} name     Name of the step
+     * @param {function} fn
+     * @returns {*}             The result of `fn`
+     * @private
+     */
+    _traced(name, fn) {
+        return this.traced(this.trace_id, name, fn);
+    }
+
+    /**
+     * Spans recorded since the last call, to send to the kernel's `Tracer`
+     *
+     * @returns {array}
+     */
+    take_spans() {
+        const spans = this.trace_spans;
+        this.trace_spans = [];
+        return spans;
+    }
+
+    /**
+     * The canvas sigplot draws the plot on
+     *
+     * @returns {HTMLCanvasElement}
+     */
+    canvas() {
+        return this.plot._Mx.active_canvas;
+    }
+
+    /**
+     * Calls a `sigplot.Plot` method on behalf of the kernel
+     *
+     * @param {string} command      Name of the sigplot.Plot method
+     * @param {array} model_args    Arguments, as received from the kernel
+     * @param {number} [layer_id]   Kernel-side id of the layer created or updated
+     * @param {object} [quantized]  Scale and offset of 16-bit binary samples
+     * @param {Float32Array} [samples]  The binary argument, already decoded
+     * @private
+     */
+    _apply_plot_command(command, model_args, layer_id, quantized, samples) {
+        // Every view of the model gets the same arguments; don't modify them
+        const args = model_args.slice();
+
+        // Since we're sending binary for `overlay_array`, `reload` and
+        // `push`, need to convert it to a Float32Array so we can plot it.
+        const pooled = this._is_pooled({ command, layer: layer_id });
+        if (BINARY_COMMANDS.includes(command)) {
+            args[0] =
+                samples ||
+                this._traced('decode', () =>
+                    pooled
+                        ? this._decode_pooled(
+                              command,
+                              layer_id,
+                              args[0],
+                              quantized
+                          )
+                        : quantized
+                        ? dequantize(
+                              args[0],
+                              quantized.scale,
+                              quantized.offset
+                          )
+                        : new Float32Array(args[0].buffer)
+                );
+        }
+
+        // `reload` and `push` update the data of a layer created earlier,
+        // `remove_layer` removes it
+        if (LAYER_COMMANDS.includes(command)) {
+            const index = this._layer_index(layer_id);
+            if (index < 0) {
+                console.debug(`Unknown layer ${layer_id}. Skipping...`);
+                return;
+            }
+            args.unshift(index);
+        }
+
+        // A file overlaid under the id of a layer that already exists
+        // replaces that layer, a coarse overview of the file, once loaded
+        if (command === 'overlay_href' && layer_id !== undefined) {
+            const self = this;
+            args[1] = function (hcb, index) {
+                self._replace_layer(layer_id, index);
+            };
+        }
+
+        // Call `command` providing `args`
+        const result = this._traced('render', () =>
+            this.plot[command].apply(this.plot, args)
+        );
+
+        // `overlay_array` and `overlay_pipe` return the index of the new
+        // layer; keep the layer itself, since indices shift as layers are
+        // removed
+        if (
+            layer_id !== undefined &&
+            result !== undefined &&
+            command.startsWith('overlay_')
+        ) {
+            this.layers[layer_id] = this.plot.get_layer(result);
+            this._forget_arrays(layer_id);
+        } else if (command === 'remove_layer') {
+            delete this.layers[layer_id];
+            this._forget_arrays(layer_id);
+        }
+
+        if (pooled && command === 'reload') {
+            // sigplot now draws the new array; the one it drew before, if
+            // other, is spare
+            const front = args[1];
+            if (this.fronts[layer_id] !== front) {
+                this.pool.release(layer_id, this.fronts[layer_id]);
+                this.fronts[layer_id] = front;
+            }
+        } else if (pooled) {
+            // sigplot copies pushed samples into the pipe's own buffer
+            this.pool.release(layer_id, args[1]);
+        }
+    }
+
+    /**
+     * Whether the samples of a command are decoded into pooled arrays
+     *
+     * @param {object} cmd_and_args
+     * @returns {boolean}
+     * @private
+     */
+    _is_pooled(cmd_and_args) {
+        return (
+            cmd_and_args.layer !== undefined &&
+            POOLED_COMMANDS.includes(cmd_and_args.command)
+        );
+    }
+
+    /**
+     * Decodes the samples of a `reload` or `push` of a live layer into a
+     * reused array: for `reload`, the array sigplot already draws, updated
+     * in place, if it has the same length
+     *
+     * @param {string} command
+     * @param {number} layer_id
+     * @param {DataView} data       The binary argument, as received
+     * @param {object} [quantized]  Scale and offset of 16-bit samples
+     * @returns {Float32Array}
+     * @private
+     */
+    _decode_pooled(command, layer_id, data, quantized) {
+        const Type = quantized ? Int16Array : Float32Array;
+        const length = data.byteLength / Type.BYTES_PER_ELEMENT;
+        const front = this.fronts[layer_id];
+        const out =
+            command === 'reload' &&
+            front &&
+            front.length === length &&
+            this.pool.owned.has(front)
+                ? front
+                : this.pool.acquire(layer_id, length);
+        if (quantized) {
+            return dequantize(data, quantized.scale, quantized.offset, out);
+        }
+        out.set(typed_view(Type, data.buffer, data.byteOffset, length));
+        return out;
+    }
+
+    /**
+     * Drops the arrays of a layer that was removed or replaced
+     *
+     * @param {number} layer_id
+     * @private
+     */
+    _forget_arrays(layer_id) {
+        delete this.fronts[layer_id];
+        this.pool.forget(layer_id);
+    }
+
+    /**
+     * Overlays each trace of a multi-trace `overlay_array` as a layer of
+     * its own; the traces are consecutive, equally long runs of one buffer,
+     * which each layer views without copying
+     *
+     * @param {array} model_args    [samples, overrides, layer_options]
+     * @param {array} traces        Layer options of each trace
+     * @param {array} layer_ids     Kernel-side id of each trace
+     * @param {object} [quantized]  Scale and offset of 16-bit samples
+     * @param {Float32Array} [decoded]  The samples, already decoded
+     * @private
+     */
+    _overlay_traces(model_args, traces, layer_ids, quantized, decoded) {
+        const [data, overrides, layer_options] = model_args;
+        const samples =
+            decoded ||
+            this._traced('decode', () =>
+                quantized
+                    ? dequantize(data, quantized.scale, quantized.offset)
+                    : typed_view(
+                          Float32Array,
+                          data.buffer,
+                          data.byteOffset,
+                          data.byteLength / Float32Array.BYTES_PER_ELEMENT
+                      )
+            );
+        const length = samples.length / traces.length;
+        this._traced('render', () => {
+            traces.forEach((options, i) => {
+                const index = this.plot.overlay_array(
+                    samples.subarray(i * length, (i + 1) * length),
+                    overrides,
+                    { ...layer_options, ...options }
+                );
+                this.layers[layer_ids[i]] = this.plot.get_layer(index);
+            });
+        });
+    }
+
+    /**
+     * Overlays each column of an `overlay_table` as a layer of its own;
+     * float32 columns are viewed without copying, others are converted
+     *
+     * @param {array} model_args    [buffers, overrides, layer_options]
+     * @param {array} columns       Name and numpy dtype string of each column
+     * @param {array} layer_ids     Kernel-side id of each column
+     * @param {array} [decoded]     Columns already converted, by index
+     * @private
+     */
+    _overlay_table(model_args, columns, layer_ids, decoded) {
+        const [buffers, overrides, layer_options] = model_args;
+        const samples = this._traced('decode', () =>
+            columns.map(({ dtype }, i) => {
+                if (decoded && decoded[i]) {
+                    return decoded[i];
+                }
+                return dtype.slice(1) === 'f4'
+                    ? dtype_view(buffers[i], 'f4')
+                    : to_float32(buffers[i], dtype.slice(1));
+            })
+        );
+        this._traced('render', () => {
+            columns.forEach(({ name }, i) => {
+                const index = this.plot.overlay_array(samples[i], overrides, {
+                    name: name,
+                    ...layer_options,
+                });
+                this.layers[layer_ids[i]] = this.plot.get_layer(index);
+            });
+        });
+    }
+
+    /**
+     * Overlays points at abscissas of their own, as complex samples drawn
+     * in sigplot's 'IR' mode: real part (x) against imaginary part (y).
+     * The mode is an option of the layer only, so other layers keep the
+     * plot's `cmode`
+     *
+     * @param {array} model_args    [x, y, overrides, layer_options]
+     * @param {array} dtypes        Numpy dtype strings of x and y
+     * @param {number} [layer_id]   Kernel-side id of the layer
+     * @param {Float64Array} [decoded]  The points, already interleaved
+     * @private
+     */
+    _overlay_xy(model_args, dtypes, layer_id, decoded) {
+        const [x, y, overrides, layer_options] = model_args;
+        const points =
+            decoded ||
+            this._traced('decode', () =>
+                interleave_xy(x, y, dtypes.map((dtype) => dtype.slice(1)))
+            );
+        this._traced('render', () => {
+            const index = this.plot.overlay_array(
+                points,
+                { ...overrides, format: 'CD' },
+                { ...layer_options, cmode: 'IR' }
+            );
+            if (layer_id !== undefined) {
+                this.layers[layer_id] = this.plot.get_layer(index);
+            }
+        });
+    }
+
+    /**
+     * Makes a newly loaded layer the one the kernel knows by `layer_id`,
+     * removing the layer that had that id
+     *
+     * @param {number} layer_id     Kernel-side id of the layer
+     * @param {number} index        Index of the new layer
+     * @private
+     */
+    _replace_layer(layer_id, index) {
+        const old_index = this._layer_index(layer_id);
+        this.layers[layer_id] = this.plot.get_layer(index);
+        this._forget_arrays(layer_id);
+        if (old_index >= 0) {
+            this.plot.remove_layer(old_index);
+        }
+    }
+
+    /**
+     * Adds a batch of markers, sent as one columnar buffer, with one redraw
+     *
+     * @param {object} meta             Marker metadata, see `jupyter_sigplot/markers.py`
+     * @param {number} meta.count       Number of markers
+     * @param {array} meta.styles       Table of sigplot annotation options
+     * @param {boolean} meta.labels     Whether markers have labels
+     * @param {string} meta.group       Group the markers belong to
+     * @param {boolean} meta.replace    Whether to first remove the group's markers
+     * @param {DataView} data           The columnar buffer
+     */
+    add_markers(meta, data) {
+        const plugin = this._annotation_plugin();
+        if (meta.replace) {
+            this._remove_markers(meta.group);
+        }
+
+        const columns = decode_markers(meta.count, data);
+        const decoder = new TextDecoder();
+        const annotations = plugin.annotations;
+        for (let i = 0; i < meta.count; i++) {
+            const label = meta.labels
+                ? decoder.decode(
+                      columns.label_bytes.subarray(
+                          columns.label_offsets[i],
+                          columns.label_offsets[i + 1]
+                      )
+                  )
+                : DEFAULT_MARKER;
+            annotations.push({
+                ...meta.styles[columns.style_index[i]],
+                x: columns.x[i],
+                y: columns.y[i],
+                value: label,
+                group: meta.group,
+            });
+        }
+        this.plot.redraw();
+    }
+
+    /**
+     * Removes markers, with one redraw
+     *
+     * @param {string} [group]  Group to remove; all markers if null
+     */
+    clear_markers(group) {
+        if (this.annotations) {
+            this._remove_markers(group);
+            this.plot.redraw();
+        }
+    }
+
+    /**
+     * Removes markers without redrawing
+     *
+     * @param {string} [group]  Group to remove; all markers if null
+     * @private
+     */
+    _remove_markers(group) {
+        const plugin = this._annotation_plugin();
+        plugin.annotations =
+            group === null || group === undefined
+                ? []
+                : plugin.annotations.filter((a) => a.group !== group);
+    }
+
+    /**
+     * The annotation plugin holding markers, added on first use
+     *
+     * @returns {plugins.AnnotationPlugin}
+     * @private
+     */
+    _annotation_plugin() {
+        if (!this.annotations) {
+            this.annotations = new plugins.AnnotationPlugin();
+            this.plot.add_plugin(this.annotations, 1);
+        }
+        return this.annotations;
+    }
+
+    /**
+     * Current sigplot layer index of a layer the kernel created
+     *
+     * @param {number} layer_id     Kernel-side id of the layer
+     * @returns {number}            The layer index, or -1 if it is gone
+     * @private
+     */
+    _layer_index(layer_id) {
+        const layer = this.layers[layer_id];
+        return layer ? this.plot._Gx.lyr.indexOf(layer) : -1;
+    }
+}
@@ -0,0 +1,79 @@
+// Spare arrays kept per layer; a steady stream alternates between the array
+// sigplot draws and one spare
+const MAX_FREE = 2;
+
+/**
+ * Reusable sample arrays of the layers of a plot, so updates of live layers
+ * are decoded into arrays allocated once rather than into new ones
+ */
+export class BufferPool {
+    constructor() {
+        // Spare arrays, by kernel-side layer id
+        this.free = new Map();
+
+        // Arrays the pool handed out, which it may take back
+        this.owned = new WeakSet();
+    }
+
+    /**
+     * A spare array of `length` samples for layer `layer_id`, or a new one
+     *
+     * @param {number} layer_id
+     * @param {number} length
+     * @returns {Float32Array}
+     */
+    acquire(layer_id, length) {
+        const free = this.free.get(layer_id) || [];
+        const index = free.findIndex((array) => array.length === length);
+        if (index >= 0) {
+            return free.splice(index, 1)[0];
+        }
+        return this.adopt(new Float32Array(length));
+    }
+
+    /**
+     * Lets the pool take `array` back once released, e.g., once a worker
+     * returns an acquired array's buffer in a new array
+     *
+     * @param {Float32Array} array
+     * @returns {Float32Array}  `array`
+     */
+    adopt(array) {
+        this.owned.add(array);
+        return array;
+    }
+
+    /**
+     * Gives an array back once sigplot no longer draws it; arrays the pool
+     * did not hand out, e.g., views of kernel messages, are left alone
+     *
+     * @param {number} layer_id
+     * @param {Float32Array} [array]
+     */
+    release(layer_id, array) {
+        if (!array || !this.owned.has(array)) {
+            return;
+        }
+        const free = this.free.get(layer_id) || [];
+        if (free.length < MAX_FREE && !free.includes(array)) {
+            free.push(array);
+            this.free.set(layer_id, free);
+        }
+    }
+
+    /**
+     * Drops the spare arrays of a removed layer
+     *
+     * @param {number} layer_id
+     */
+    forget(layer_id) {
+        this.free.delete(layer_id);
+    }
+
+    /**
+     * Drops all spare arrays
+     */
+    clear() {
+        this.free.clear();
+    }
+}
@@ -1,7 +1,12 @@
 import { DOMWidgetModel, DOMWidgetView } from '@jupyter-widgets/base';
-import { Plot } from 'sigplot';
 import { version } from '../package';
-import { find_output_cell } from './utils';
+import { link_view, plot_range, propagate, unlink_view } from './link';
+import { PlotPanel } from './panel';
+import { forget_snapshot, save_snapshot } from './snapshots';
+
+// Milliseconds without zooming or panning before the kernel is told the
+// new axis ranges
+const VIEW_NOTIFY_DELAY = 250;
 
 export class SigPlotModel extends DOMWidgetModel {
     defaults() {
@@ -16,12 +21,22 @@ export class SigPlotModel extends DOMWidgetModel {
             command_and_arguments: [],
             progress: 0,
             done: false,
+            link: {},
         };
     }
 
     initialize(attributes, options) {
         super.initialize(attributes, options);
 
+        // Commands a view rendered later replays to catch up, e.g., once
+        // `Plot.get_or_create` displays the plot again; `seq` numbers them.
+        // It holds one payload per layer, see `_record`
+        this.scene = [];
+        this.seq = 0;
+
+        // Whether a view asked the kernel for the scene, see `_record`
+        this.scene_requested = false;
+
         this.on(
             'change:command_and_arguments',
             this.handle_command_args_change.bind(this)
@@ -33,17 +48,175 @@ export class SigPlotModel extends DOMWidgetModel {
     handle_command_args_change() {
         const prev_cmd_and_args = this.previous('command_and_arguments');
         const cmd_and_args = this.get('command_and_arguments');
+        const seq = ++this.seq;
+        this._record(cmd_and_args);
         this._for_each_view((view) => {
-            view.handle_command_args_change(prev_cmd_and_args, cmd_and_args);
+            view.handle_command_args_change(
+                prev_cmd_and_args,
+                cmd_and_args,
+                seq
+            );
         });
     }
 
+    /**
+     * Adds a command to `scene`, dropping the commands it makes obsolete
+     *
+     * @param {object} cmd_and_args     See `SigPlotView.handle_command_args_change`
+     * @private
+     */
+    _record(cmd_and_args) {
+        const { command, layer } = cmd_and_args;
+        // Replaying is not traced
+        const entry = { ...cmd_and_args, trace: undefined };
+        const of_layer = (e) => layer !== undefined && e.layer === layer;
+
+        if (command === 'scene') {
+            // The kernel's compacted scene, for a model restored without
+            // the plot's history, e.g., after a page refresh; a model that
+            // has the history keeps it, at full resolution
+            if (this.scene_requested) {
+                this.scene_requested = false;
+                this.scene = cmd_and_args.arguments[0].slice();
+            }
+            return;
+        }
+        if (command === 'remove_layer') {
+            this.scene = this.scene.filter((e) => !of_layer(e));
+            const traces = this.scene.find(
+                (e) => e.layers && e.layers.includes(layer)
+            );
+            if (traces) {
+                // One trace of a multi-trace overlay; drop the overlay once
+                // all of its traces are removed
+                this.scene.push(entry);
+                const removed = this.scene
+                    .filter((e) => e.command === 'remove_layer')
+                    .map((e) => e.layer);
+                if (traces.layers.every((id) => removed.includes(id))) {
+                    this.scene = this.scene.filter(
+                        (e) =>
+                            e !== traces &&
+                            !(
+                                e.command === 'remove_layer' &&
+                                traces.layers.includes(e.layer)
+                            )
+                    );
+                }
+            }
+            return;
+        }
+        if (command.startsWith('overlay_')) {
+            // A file replacing the overview shown while it downloaded
+            this.scene = this.scene.filter((e) => !of_layer(e));
+        } else if (command === 'reload') {
+            this.scene = this.scene.filter(
+                (e) =>
+                    !(of_layer(e) && ['reload', 'push'].includes(e.command))
+            );
+            // The layer's overlay takes the new samples, so the scene holds
+            // one payload per layer
+            const index = this.scene.findIndex(
+                (e) => of_layer(e) && e.command === 'overlay_array'
+            );
+            if (index >= 0) {
+                const overlay = this.scene[index];
+                const [samples, overrides] = cmd_and_args.arguments;
+                this.scene[index] = {
+                    ...overlay,
+                    arguments: [
+                        samples,
+                        overrides || overlay.arguments[1],
+                        ...overlay.arguments.slice(2),
+                    ],
+                    quantized: cmd_and_args.quantized,
+                };
+                return;
+            }
+        } else if (command === 'push') {
+            this.scene.push(entry);
+            this._trim_pushes(layer);
+            return;
+        } else if (command === 'change_settings') {
+            // Successive settings merge into one command
+            const last = this.scene[this.scene.length - 1];
+            if (last && last.command === 'change_settings') {
+                this.scene[this.scene.length - 1] = {
+                    ...last,
+                    arguments: [
+                        { ...last.arguments[0], ...cmd_and_args.arguments[0] },
+                    ],
+                };
+                return;
+            }
+        } else if (command === 'clear_markers') {
+            const [group] = cmd_and_args.arguments;
+            this.scene = this.scene.filter(
+                (e) =>
+                    e.command !== 'add_markers' ||
+                    (group !== null &&
+                        group !== undefined &&
+                        e.arguments[0].group !== group)
+            );
+            return;
+        } else if (
+            command === 'add_markers' &&
+            cmd_and_args.arguments[0].replace
+        ) {
+            const { group } = cmd_and_args.arguments[0];
+            this.scene = this.scene.filter(
+                (e) =>
+                    e.command !== 'add_markers' ||
+                    e.arguments[0].group !== group
+            );
+        }
+        this.scene.push(entry);
+    }
+
+    /**
+     * Drops the oldest `push`es of a layer that newer ones have scrolled
+     * out of its pipe, keeping about one frame of samples
+     *
+     * @param {number} layer    Kernel-side id of the layer
+     * @private
+     */
+    _trim_pushes(layer) {
+        const pipe = this.scene.find(
+            (e) => e.layer === layer && e.command === 'overlay_pipe'
+        );
+        const framesize = pipe ? pipe.arguments[1].framesize || 0 : 0;
+        const dropped = new Set();
+        let samples = 0;
+        for (let i = this.scene.length - 1; i >= 0; i--) {
+            const e = this.scene[i];
+            if (e.layer !== layer || e.command !== 'push') {
+                continue;
+            }
+            if (samples >= framesize) {
+                dropped.add(e);
+            } else {
+                samples += e.arguments[0].byteLength / (e.quantized ? 2 : 4);
+            }
+        }
+        if (dropped.size) {
+            this.scene = this.scene.filter((e) => !dropped.has(e));
+        }
+    }
+
     handle_progress_change() {
         console.log('Progress change');
     }
 
+    /**
+     * Handles the kernel closing the plot: no more commands will come, so
+     * views rendered later have nothing to catch up with
+     */
     handle_done() {
-        console.log('Handle done...');
+        if (this.get('done')) {
+            forget_snapshot(this.get('uuid'));
+            this.remove();
+            this._for_each_view((view) => view.handle_done());
+        }
     }
 
     /**
@@ -60,8 +233,17 @@ export class SigPlotModel extends DOMWidgetModel {
         }
     }
 
+    /**
+     * Releases the commands kept for views rendered later, and their
+     * binary payloads
+     */
     remove() {
-        console.log('Removing');
+        this.scene = [];
+    }
+
+    close(comm_closed) {
+        this.remove();
+        return super.close(comm_closed);
     }
 }
 
@@ -69,9 +251,35 @@ export class SigPlotView extends DOMWidgetView {
     render() {
         // Instantiate a new plot and attach to the element provided in `this.el`
         const plot_options = this.model.get('plot_options');
-        this.plot = new Plot(this.el, plot_options);
+        this.panel = new PlotPanel(this.el, plot_options);
+        this.plot = this.panel.plot;
         this.uuid = this.model.get('uuid');
 
+        // Catch up with the commands other views were sent before, or, if
+        // this model has none, e.g., after a page refresh, with the scene
+        // the kernel compacts the plot's history into
+        this.model.scene.forEach((cmd_and_args) =>
+            this.panel.handle(cmd_and_args)
+        );
+        this.seq = this.model.seq;
+        this.awaiting_scene =
+            this.seq === 0 &&
+            Object.keys(this.model.get('command_and_arguments')).length > 0;
+        if (this.awaiting_scene) {
+            this.model.scene_requested = true;
+            this.send({ event: 'scene' });
+        }
+
+        // Zooming and panning, to share with linked views and the kernel
+        const on_range_change = this._on_range_change.bind(this);
+        ['zoom', 'unzoom', 'pan'].forEach((event) =>
+            this.plot.addListener(event, on_range_change)
+        );
+        link_view(this, this.model.get('link'));
+        this.listenTo(this.model, 'change:link', () =>
+            link_view(this, this.model.get('link'))
+        );
+
         // Wait for element to be added to the DOM
         const self = this;
         window.setTimeout(function () {
@@ -91,51 +299,154 @@ export class SigPlotView extends DOMWidgetView {
      * @param new_cmd_and_args {object}     The new command/arg combo
      * @param {string} new_cmd_and_args.command     Command from {overlay_*, change_settings}
      * @param {array} new_cmd_and_args.arguments    Arguments for respective sigplot.Plot functions
+     * @param {number} [new_cmd_and_args.layer]     Kernel-side id of the layer created or updated
+     * @param {object} [new_cmd_and_args.quantized]  Scale and offset of 16-bit binary samples
+     * @param {array} [new_cmd_and_args.traces]      Layer options of each trace in a multi-trace `overlay_array`
+     * @param {array} [new_cmd_and_args.layers]      Kernel-side ids of those traces
+     * @param {number} [new_cmd_and_args.trace]      Id of the command, if it is traced
+     * @param {number} seq      Number of the command, see `SigPlotModel.scene`
+     */
+    handle_command_args_change(prev_cmd_and_args, new_cmd_and_args, seq) {
+        console.debug(`new_command=${new_cmd_and_args.command}`);
+
+        // Check that the commands and arguments are different, that the
+        // view did not replay the command when it was rendered, and that
+        // it was not destroyed
+        if (
+            prev_cmd_and_args === new_cmd_and_args ||
+            seq <= this.seq ||
+            !this.panel
+        ) {
+            return;
+        }
+        this.seq = seq;
+
+        if (new_cmd_and_args.command === 'scene') {
+            // Only for views that asked for it; others are up to date
+            if (this.awaiting_scene) {
+                this.awaiting_scene = false;
+                this._apply_scene(
+                    new_cmd_and_args.arguments[0],
+                    new_cmd_and_args.trace
+                );
+            }
+            return;
+        }
+
+        this.panel
+            .handle(new_cmd_and_args)
+            .then(() => this._save_snapshot(new_cmd_and_args.trace));
+    }
+
+    /**
+     * Applies the commands of a scene sent by the kernel, in order, with
+     * one snapshot once all are applied
+     *
+     * @param {array} commands      See `handle_command_args_change`
+     * @param {number} [trace_id]   Id of the scene, if it is traced
+     * @private
      */
-    handle_command_args_change(prev_cmd_and_args, new_cmd_and_args) {
-        const { command: new_command, arguments: new_args } = new_cmd_and_args;
-        console.debug(`new_command=${new_command}`);
+    _apply_scene(commands, trace_id) {
+        Promise.all(
+            commands.map((cmd_and_args) =>
+                this.panel.handle({ ...cmd_and_args, trace: trace_id })
+            )
+        ).then(() => this._save_snapshot(trace_id));
+    }
 
-        // Check that the commands and arguments are different
-        if (prev_cmd_and_args === new_cmd_and_args) {
+    /**
+     * Shares the new axis ranges after a zoom or pan: with linked views at
+     * once, unless they follow another view, and with the kernel once the
+     * ranges settle
+     *
+     * @private
+     */
+    _on_range_change() {
+        if (!this.plot) {
             return;
         }
+        const range = plot_range(this.plot);
+        if (!this.following) {
+            propagate(this, range);
+        }
+        window.clearTimeout(this.notify_timer);
+        this.notify_timer = window.setTimeout(() => {
+            this.send({ event: 'view', ...range });
+        }, VIEW_NOTIFY_DELAY);
+    }
 
-        // Since we're sending binary for `overlay_array`,
-        // need to convert it to a Float32Array so we can plot it.
-        if (new_command === 'overlay_array') {
-            new_args[0] = new Float32Array(new_args[0].buffer);
+    /**
+     * Zooms to the ranges of a linked view, along the linked axes
+     *
+     * @param {object} range    See `plot_range`
+     * @param {string} axes     'x', 'y' or 'xy'
+     */
+    follow(range, axes) {
+        const plot = this.plot;
+        if (!plot) {
+            return;
         }
+        const current = plot_range(plot);
+        const x = axes.includes('x') ? range : current;
+        const y = axes.includes('y') ? range : current;
+        this.following = true;
+        try {
+            if (range.level === 0 && (axes === 'xy' || current.level === 0)) {
+                plot.unzoom();
+            } else {
+                // Replace the current zoom level, if any, rather than
+                // stacking a level per update
+                plot.zoom(
+                    { x: x.xmin, y: y.ymax },
+                    { x: x.xmax, y: y.ymin },
+                    current.level > 0
+                );
+            }
+        } finally {
+            this.following = false;
+        }
+    }
 
-        // Call `new_command` providing `new_args`
-        this.plot[new_command].apply(this.plot, new_args);
+    /**
+     * Sends the spans recorded so far to the kernel's `Tracer`
+     *
+     * @private
+     */
+    _flush_trace() {
+        const spans = this.panel.take_spans();
+        if (spans.length) {
+            this.send({
+                event: 'trace',
+                view: this.cid,
+                spans: spans,
+            });
+        }
+    }
 
+    /**
+     * Saves a screenshot of the plot into the placeholder output, so the
+     * notebook shows the plot when exported or reopened
+     *
+     * @param {number} [trace_id]   Id of the command, if it is traced
+     * @private
+     */
+    _save_snapshot(trace_id) {
         const self = this;
         window.setTimeout(function () {
+            if (!self.panel) {
+                // Destroyed meanwhile
+                return;
+            }
             // Save a screenshot of the current plot
-            const image_data = self.plot._Mx.active_canvas.toDataURL(
-                'image/png'
+            const image_data = self.panel.traced(trace_id, 'snapshot', () =>
+                self.panel.canvas().toDataURL('image/png')
             );
+            self._flush_trace();
             if (image_data === 'data:,') {
                 console.debug('Empty `image_data`. Skipping...');
                 return;
             }
-
-            // Find the current cell's output area
-            if (window.IPython && !self.cell_info) {
-                console.debug('IPython in namespace, finding output cell...');
-                self.cell_info = find_output_cell(
-                    `<div id="${self.uuid}"></div>`
-                );
-            }
-
-            // Save the screenshot to the output cell
-            if (self.cell_info) {
-                console.debug(self.cell_info);
-                self.cell_info[1][
-                    'text/html'
-                ] = `<img alt="SigPlot plot" src="${image_data}" width="100%">`;
-            }
+            save_snapshot(self, 'SigPlot plot', image_data);
         }, 10);
     }
 
@@ -160,8 +471,26 @@ export class SigPlotView extends DOMWidgetView {
      * Handles plot closing
      */
     handle_done() {
-        console.log('Done!');
+        this._destroy();
     }
 
-    remove() {}
+    /**
+     * Destroys the sigplot instance, dropping its layers' typed arrays
+     *
+     * @private
+     */
+    _destroy() {
+        if (this.panel) {
+            this.panel.destroy();
+            this.panel = this.plot = null;
+        }
+    }
+
+    remove() {
+        unlink_view(this);
+        window.clearTimeout(this.notify_timer);
+        window.clearTimeout(this.snapshot_timer);
+        this._destroy();
+        super.remove();
+    }
 }
@@ -0,0 +1,97 @@
+/*global IPython*/
+
+// Mimebundles of the placeholder outputs of plots, by plot uuid
+const targets = new Map();
+
+// HTML of a placeholder output, as displayed by the kernel
+const PLACEHOLDER = /^<div id="([^"]+)"><\/div>$/;
+
+// Milliseconds without a new snapshot before one is sent to the kernel
+const KERNEL_SNAPSHOT_DELAY = 1000;
+
+/**
+ * Registers placeholder outputs as the classic notebook adds them
+ */
+function listen() {
+    if (!window.IPython || !IPython.notebook || !IPython.notebook.events) {
+        return;
+    }
+    IPython.notebook.events.on('output_added.OutputArea', (event, data) => {
+        const bundle = data.output.data || data.output;
+        const html = bundle['text/html'];
+        const match = typeof html === 'string' && html.match(PLACEHOLDER);
+        if (match) {
+            targets.set(match[1], bundle);
+        }
+    });
+}
+listen();
+
+/**
+ * The mimebundle of the placeholder output of plot `uuid` in the classic
+ * notebook, found through the cell holding it, e.g., for placeholders
+ * added before this module was loaded
+ *
+ * @param {string} uuid
+ * @returns {object|undefined}
+ */
+function locate(uuid) {
+    const element = document.getElementById(uuid);
+    if (!element || !window.jQuery) {
+        return undefined;
+    }
+    const cell = window.jQuery(element).closest('.cell').data('cell');
+    if (!cell || !cell.output_area) {
+        return undefined;
+    }
+    const html = `<div id="${uuid}"></div>`;
+    for (const output of cell.output_area.outputs) {
+        const bundle = output.data || output;
+        if (bundle['text/html'] === html) {
+            return bundle;
+        }
+    }
+    return undefined;
+}
+
+/**
+ * Shows a snapshot of a plot in its placeholder output, so the notebook
+ * shows the plot once exported or reopened
+ *
+ * In the classic notebook, the placeholder's output is updated at once.
+ * Elsewhere, e.g., in JupyterLab, the snapshot is sent to the kernel, which
+ * updates the placeholder through its display id, once snapshots settle.
+ *
+ * @param {DOMWidgetView} view  View of the plot; its `uuid` names the plot
+ * @param {string} alt          Alternative text of the image
+ * @param {string} image_data   The snapshot, as a PNG data URL
+ */
+export function save_snapshot(view, alt, image_data) {
+    let bundle = targets.get(view.uuid);
+    if (!bundle && window.IPython) {
+        bundle = locate(view.uuid);
+        if (bundle) {
+            targets.set(view.uuid, bundle);
+        }
+    }
+    if (bundle) {
+        bundle[
+            'text/html'
+        ] = `<img alt="${alt}" src="${image_data}" width="100%">`;
+        return;
+    }
+
+    window.clearTimeout(view.snapshot_timer);
+    view.snapshot_timer = window.setTimeout(() => {
+        view.send({ event: 'snapshot', image: image_data });
+    }, KERNEL_SNAPSHOT_DELAY);
+}
+
+/**
+ * Forgets the placeholder output of plot `uuid`, once closed
+ *
+ * @param {string} uuid
+ */
+export function forget_snapshot(uuid) {
+    targets.delete(uuid);
+}
@@ -1,34 +1,183 @@
-/*global IPython*/
-
-/**
- * Return the cell and output element which can be found *uniquely* in the notebook.
- *
- * Note: This is a bit hacky, but it is done because the "notebook_saving.Notebook"
- * IPython event is triggered only after the cells have been serialised, which for
- * our purposes (turning an active figure into a static one), is too late.
- *
- * Taken from matplotlib's mpl.js
- *
- * @param {string} html_output
- * @returns {(*|number)[]}
- */
-export function find_output_cell(html_output) {
-    const cells = IPython.notebook.get_cells();
-    for (let i = 0; i < cells.length; i++) {
-        const cell = cells[i];
-        if (cell.cell_type === 'code') {
-            for (let j = 0; j < cell.output_area.outputs.length; j++) {
-                let data = cell.output_area.outputs[j];
-                if (data.data) {
-                    // IPython >= 3 moved mimebundle to data attribute of output
-                    data = data.data;
-                }
-                console.log(`cell_index=${i}`);
-                console.log(data);
-                if (data['text/html'] === html_output) {
-                    return [cell, data, j];
-                }
-            }
+// Typed arrays of numpy dtypes, by dtype string without the byte order
+export const DTYPES = {
+    f4: Float32Array,
+    f8: Float64Array,
+    i1: Int8Array,
+    i2: Int16Array,
+    i4: Int32Array,
+    u1: Uint8Array,
+    u2: Uint16Array,
+    u4: Uint32Array,
+};
+// Browsers without BigInt read 64-bit integers as numbers, see `dtype_view`
+if (typeof self !== 'undefined' && self.BigInt64Array !== undefined) {
+    DTYPES.i8 = self.BigInt64Array;
+}
+
+/**
+ * Typed array over `length` elements of `buffer` from `byte_offset`; a view
+ * when the offset is suitably aligned, a copy otherwise.
+ *
+ * @param {function} Type       A typed array constructor, e.g. Float64Array
+ * @param {ArrayBuffer} buffer
+ * @param {number} byte_offset
+ * @param {number} length
+ * @returns {TypedArray}
+ */
+export function typed_view(Type, buffer, byte_offset, length) {
+    if (byte_offset % Type.BYTES_PER_ELEMENT === 0) {
+        return new Type(buffer, byte_offset, length);
+    }
+    return new Type(
+        buffer.slice(byte_offset, byte_offset + length * Type.BYTES_PER_ELEMENT)
+    );
+}
+
+/**
+ * Split a columnar marker buffer into its columns without copying.
+ * The layout is documented in `jupyter_sigplot/markers.py`.
+ *
+ * @param {number} count    Number of markers
+ * @param {DataView} data   The buffer, as received from the kernel
+ * @returns {{x: Float64Array, y: Float64Array, label_offsets: Uint32Array,
+ *            style_index: Uint16Array, label_bytes: Uint8Array}}
+ */
+export function decode_markers(count, data) {
+    const buffer = data.buffer;
+    let offset = data.byteOffset;
+    const column = (Type, length) => {
+        const view = typed_view(Type, buffer, offset, length);
+        offset += length * Type.BYTES_PER_ELEMENT;
+        return view;
+    };
+
+    const x = column(Float64Array, count);
+    const y = column(Float64Array, count);
+    const label_offsets = column(Uint32Array, count + 1);
+    const style_index = column(Uint16Array, count);
+    const label_bytes = column(Uint8Array, label_offsets[count]);
+    return { x, y, label_offsets, style_index, label_bytes };
+}
+
+/**
+ * Expand 16-bit quantized samples, as sent by `Plot.overlay_array` to fit a
+ * memory budget, back to floating point
+ *
+ * @param {DataView} data   Little-endian int16 samples, as received
+ * @param {number} scale    Size of one quantization step
+ * @param {number} offset   Value of the quantized sample 0
+ * @param {Float32Array} [out]  Array to expand the samples into, if it has
+ *                              the right length
+ * @returns {Float32Array}
+ */
+export function dequantize(data, scale, offset, out) {
+    const quantized = typed_view(
+        Int16Array,
+        data.buffer,
+        data.byteOffset,
+        data.byteLength / Int16Array.BYTES_PER_ELEMENT
+    );
+    const samples =
+        out && out.length === quantized.length
+            ? out
+            : new Float32Array(quantized.length);
+    for (let i = 0; i < quantized.length; i++) {
+        samples[i] = quantized[i] * scale + offset;
+    }
+    return samples;
+}
+
+/**
+ * Typed array over the elements of binary data of a numpy dtype; 64-bit
+ * integers are copied to 64-bit floats where the browser has no BigInt
+ *
+ * @param {DataView} data   The data, as received from the kernel
+ * @param {string} dtype    Numpy dtype string without the byte order
+ * @returns {TypedArray}
+ */
+export function dtype_view(data, dtype) {
+    if (dtype === 'i8' && DTYPES.i8 === undefined) {
+        return int64_to_float64(data);
+    }
+    const Type = DTYPES[dtype];
+    return typed_view(
+        Type,
+        data.buffer,
+        data.byteOffset,
+        data.byteLength / Type.BYTES_PER_ELEMENT
+    );
+}
+
+/**
+ * Convert little-endian 64-bit integers to 64-bit floats, from their 32-bit
+ * halves; exact up to 2^53
+ *
+ * @param {DataView} data   The integers, as received from the kernel
+ * @returns {Float64Array}
+ */
+export function int64_to_float64(data) {
+    const length = data.byteLength / 8;
+    const values = new Float64Array(length);
+    for (let i = 0; i < length; i++) {
+        values[i] =
+            data.getInt32(8 * i + 4, true) * 4294967296 +
+            data.getUint32(8 * i, true);
+    }
+    return values;
+}
+
+/**
+ * Copy or convert samples of a numpy dtype to float32, as sigplot draws
+ *
+ * @param {DataView} data   Samples, as received from the kernel
+ * @param {string} dtype    Numpy dtype string without the byte order, e.g.,
+ *                          'i4'
+ * @param {Float32Array} [out]  Array to convert the samples into, if it has
+ *                              the right length
+ * @returns {Float32Array}
+ */
+export function to_float32(data, dtype, out) {
+    const values = dtype_view(data, dtype);
+    const samples =
+        out && out.length === values.length
+            ? out
+            : new Float32Array(values.length);
+    if (DTYPES.i8 !== undefined && values instanceof DTYPES.i8) {
+        for (let i = 0; i < values.length; i++) {
+            samples[i] = Number(values[i]);
         }
+    } else {
+        samples.set(values);
     }
+    return samples;
+}
+
+/**
+ * Interleave abscissas and ordinates as complex doubles, as sent by
+ * `Plot.overlay_xy`; 64-bit integer timestamps are exact up to 2^53
+ *
+ * @param {DataView} x      Abscissas, as received from the kernel
+ * @param {DataView} y      Ordinates, as received
+ * @param {array} dtypes    Numpy dtype strings of `x` and `y` without the
+ *                          byte order
+ * @returns {Float64Array}
+ */
+export function interleave_xy(x, y, dtypes) {
+    const xs = dtype_view(x, dtypes[0]);
+    const ys = dtype_view(y, dtypes[1]);
+    const points = new Float64Array(2 * ys.length);
+    for (let i = 0; i < ys.length; i++) {
+        points[2 * i] = Number(xs[i]);
+        points[2 * i + 1] = Number(ys[i]);
+    }
+    return points;
+}
+
+/**
+ * Microseconds since the epoch, the clock of the kernel's `Tracer`
+ *
+ * @returns {number}
+ */
+export function trace_clock() {
+    return (performance.timeOrigin + performance.now()) * 1000;
 }
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+"""Minimal reader and writer for X-Midas BLUE files, the native format of
+SigPlot.
+
+Only the fixed 512-byte header and the data segment are understood; the
+extended header, if present, is ignored, and is never written.
+"""
+from __future__ import absolute_import, print_function
+import os
+import struct
+
+import numpy as np
+
+
+"""Size in bytes of the fixed BLUE header"""
+HEADER_SIZE = 512
+
+"""Second character of a BLUE format code -> numpy scalar type"""
+_TYPE_CODES = {
+    "B": np.int8,
+    "I": np.int16,
+    "L": np.int32,
+    "X": np.int64,
+    "F": np.float32,
+    "D": np.float64,
+}
+
+"""numpy scalar type -> second character of a BLUE format code"""
+_DTYPE_CODES = dict((np.dtype(v), k) for k, v in _TYPE_CODES.items())
+
+"""First character of a BLUE format code -> number of elements per sample"""
+_MODE_CODES = {
+    "S": 1,
+    "C": 2,
+    "V": 3,
+    "Q": 4,
+    "M": 9,
+    "T": 16,
+}
+
+
+def read_header(path):
+    """Read the fixed header of the BLUE file at ``path``
+
+    :param path: Path to a BLUE file
+    :type path: str
+
+    :return: The header fields needed to interpret the data segment:
+             ``type``, ``format``, ``data_rep``, ``data_start``,
+             ``data_size``, ``xstart``, ``xdelta`` and ``subsize``
+    :rtype: dict
+
+    :raises ValueError: if ``path`` is not a BLUE file
+    """
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    return parse_header(raw)
+
+
+def parse_header(raw):
+    """Parse the fixed header of a BLUE file from its first 512 bytes
+
+    :param raw: At least the first 512 bytes of a BLUE file
+    :type raw: bytes
+
+    :return: See ``read_header``
+    :rtype: dict
+
+    :raises ValueError: if ``raw`` is not a BLUE header
+    """
+    if len(raw) < HEADER_SIZE or raw[:4] != b"BLUE":
+        raise ValueError("Not a BLUE file header")
+
+    # 'EEEI' is little-endian, 'IEEE' is big-endian
+    endian = "<" if raw[4:8] == b"EEEI" else ">"
+    data_start, data_size, file_type, fmt = struct.unpack(
+        endian + "ddi2s", raw[32:54]
+    )
+    xstart, xdelta = struct.unpack(endian + "dd", raw[256:272])
+    subsize = 0
+    if file_type // 1000 == 2:
+        subsize, = struct.unpack(endian + "i", raw[276:280])
+
+    return {
+        "type": file_type,
+        "format": fmt.decode("ascii"),
+        "data_rep": raw[8:12].decode("ascii"),
+        "data_start": int(data_start),
+        "data_size": int(data_size),
+        "xstart": xstart,
+        "xdelta": xdelta or 1.0,
+        "subsize": subsize,
+    }
+
+
+def dtype_for_format(fmt, data_rep="EEEI"):
+    """Return the numpy dtype of one element of a BLUE format code
+
+    :param fmt: Two character BLUE format code, e.g., 'SF' or 'CD'
+    :type fmt: str
+
+    :param data_rep: Data representation, 'EEEI' (little-endian)
+                     or 'IEEE' (big-endian)
+    :type data_rep: str
+
+    :return: A tuple (dtype, elements) where ``elements`` is the number of
+             ``dtype`` values that make up one sample
+    :rtype: Tuple[numpy.dtype, int]
+
+    :raises ValueError: if ``fmt`` is not supported
+    """
+    if len(fmt) != 2 or fmt[0] not in _MODE_CODES or \
+            fmt[1] not in _TYPE_CODES:
+        raise ValueError("Unsupported BLUE format %r" % fmt)
+    dtype = np.dtype(_TYPE_CODES[fmt[1]])
+    dtype = dtype.newbyteorder("<" if data_rep == "EEEI" else ">")
+    return dtype, _MODE_CODES[fmt[0]]
+
+
+def read_data(path, header=None):
+    """Memory-map the data segment of the BLUE file at ``path``
+
+    Complex floating-point formats are returned as complex arrays; other
+    multi-element formats are returned with one row per sample. Samples the
+    header promises but the file does not hold yet, e.g., while it is being
+    downloaded or recorded, are left out.
+
+    :param path: Path to a BLUE file
+    :type path: str
+
+    :param header: The result of ``read_header(path)``, if already known
+    :type header: Optional[dict]
+
+    :return: The data segment, without copying it into memory
+    :rtype: numpy.ndarray
+    """
+    if header is None:
+        header = read_header(path)
+    dtype, elements = dtype_for_format(header["format"], header["data_rep"])
+
+    sample_size = dtype.itemsize * elements
+    count = min(
+        header["data_size"] // sample_size,
+        max(0, os.path.getsize(path) - header["data_start"]) // sample_size,
+    )
+    if count == 0:
+        return np.zeros(0, dtype=dtype)
+
+    data = np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=header["data_start"],
+        shape=(count * elements,),
+    )
+    if header["format"][0] == "C" and dtype.kind == "f":
+        complex_dtype = np.dtype("c%d" % (2 * dtype.itemsize))
+        return data.view(complex_dtype.newbyteorder(dtype.byteorder))
+    if elements > 1:
+        return data.reshape(count, elements)
+    return data
+
+
+def format_for_dtype(dtype):
+    """Return the BLUE format code that stores samples of type ``dtype``
+
+    :param dtype: A numpy dtype
+    :type dtype: numpy.dtype
+
+    :return: Two character BLUE format code, e.g., 'SF' or 'CD'
+    :rtype: str
+
+    :raises ValueError: if ``dtype`` has no BLUE equivalent
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == "c":
+        return "C" + _DTYPE_CODES[np.dtype("f%d" % (dtype.itemsize // 2))]
+    try:
+        return "S" + _DTYPE_CODES[dtype.newbyteorder("=")]
+    except KeyError:
+        raise ValueError("No BLUE format for dtype %s" % dtype)
+
+
+def write(path, data, xstart=0.0, xdelta=1.0, xunits=0, subsize=0,
+          ystart=0.0, ydelta=1.0, yunits=0):
+    """Write ``data`` to a new BLUE file at ``path``
+
+    A type 1000 file is written unless ``subsize`` is given, in which case
+    ``data`` is stored as a type 2000 file with rows of ``subsize`` samples.
+
+    :param path: Path of the file to write
+    :type path: str
+
+    :param data: Samples to store; the BLUE format is chosen from its dtype
+    :type data: numpy.ndarray
+
+    :param xstart: Abscissa of the first sample
+    :type xstart: float
+
+    :param xdelta: Abscissa spacing between samples
+    :type xdelta: float
+
+    :param xunits: BLUE units code of the abscissa
+    :type xunits: int
+
+    :param subsize: Number of samples per row of a type 2000 file
+    :type subsize: int
+
+    :param ystart: Ordinate of the first row of a type 2000 file
+    :type ystart: float
+
+    :param ydelta: Ordinate spacing between rows of a type 2000 file
+    :type ydelta: float
+
+    :param yunits: BLUE units code of the ordinate
+    :type yunits: int
+    """
+    data = np.asarray(data)
+    fmt = format_for_dtype(data.dtype)
+    # Always write little-endian ('EEEI')
+    if data.dtype.kind == "c":
+        elem_dtype = np.dtype("<c%d" % data.dtype.itemsize)
+    else:
+        elem_dtype = data.dtype.newbyteorder("<")
+    data = np.ascontiguousarray(data, dtype=elem_dtype)
+
+    header = bytearray(HEADER_SIZE)
+    header[0:12] = b"BLUEEEEIEEEI"
+    struct.pack_into(
+        "<ddi2s", header, 32,
+        float(HEADER_SIZE), float(data.nbytes),
+        2000 if subsize else 1000, fmt.encode("ascii"),
+    )
+    struct.pack_into("<ddi", header, 256, xstart, xdelta, xunits)
+    if subsize:
+        struct.pack_into(
+            "<iddi", header, 276, subsize, ystart, ydelta, yunits
+        )
+
+    with open(path, "wb") as f:
+        f.write(header)
+        data.tofile(f)
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""Kernel-local HTTP server for the files prepared under a ``data_dir``.
+
+By default the client fetches overlaid files through the notebook server's
+file handler, which only works when the kernel shares a filesystem with
+the notebook server and always transfers whole files. A ``DataServer``
+runs in the kernel instead and supports byte ranges, so the client can
+fetch only the parts of a file it needs, and conditional requests, so
+unchanged files are not fetched twice.
+
+Files are only served by their name under the root directory; links placed
+there by ``_prepare_file_input`` are followed. Each server has a random
+token in its URLs, so other users of the host cannot read the files without
+being told the URL.
+"""
+from __future__ import absolute_import, print_function
+from email.utils import formatdate, parsedate_tz, mktime_tz
+import os
+import re
+import socket
+import threading
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import quote, unquote, urlsplit
+except ImportError:
+    # Python 2.x
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urllib import quote, unquote
+    from urlparse import urlsplit
+
+
+"""Size of the blocks in which files are sent"""
+_BLOCK_SIZE = 64 * 1024
+
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+"""Running servers, by (root, host, port) as given to ``serve``"""
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def serve(root, host="127.0.0.1", port=0):
+    """Return a running ``DataServer`` for ``root``, starting one unless
+    one was already started with the same arguments.
+
+    :rtype: DataServer
+    """
+    key = (os.path.abspath(root or "."), host, port)
+    with _servers_lock:
+        server = _servers.get(key)
+        if server is None or not server.running:
+            server = _servers[key] = DataServer(root, host, port)
+            server.start()
+    return server
+
+
+def _parse_range(header, size):
+    """Return the (start, stop) byte range requested by a Range ``header``
+    for a file of ``size`` bytes, None to send the whole file, or raise
+    ValueError if the range cannot be satisfied"""
+    match = _RANGE.match(header.strip())
+    if match is None:
+        # Multiple ranges or other units; sending everything is allowed
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # A suffix: the last ``last`` bytes; none at all, e.g., "bytes=-0"
+        # or any suffix of an empty file, cannot be satisfied
+        start, stop = max(0, size - int(last)), size
+    else:
+        start = int(first)
+        stop = size if not last else min(int(last) + 1, size)
+    if start >= size or stop <= start:
+        raise ValueError("Range %r not satisfiable" % header)
+    return start, stop
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serves GET, HEAD and CORS preflight requests for the files under
+    ``server.root``"""
+
+    def log_message(self, format, *args):
+        # Quiet; the default writes every request to stderr, i.e., into
+        # the notebook
+        pass
+
+    def end_headers(self):
+        # The notebook page is served from another origin
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header(
+            "Access-Control-Expose-Headers",
+            "Accept-Ranges, Content-Length, Content-Range, ETag"
+        )
+        BaseHTTPRequestHandler.end_headers(self)
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self.send_header("Access-Control-Allow-Methods", "GET, HEAD")
+        self.send_header(
+            "Access-Control-Allow-Headers",
+            "Range, If-Range, If-None-Match, If-Modified-Since"
+        )
+        self.send_header("Access-Control-Max-Age", "86400")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_HEAD(self):
+        self._send(body=False)
+
+    def do_GET(self):
+        self._send(body=True)
+
+    def _path(self):
+        """The local path requested, or None if it is not served"""
+        parts = urlsplit(self.path).path.split("/")
+        if len(parts) < 3 or parts[0] or parts[1] != self.server.token:
+            return None
+        names = [unquote(part) for part in parts[2:]]
+        if any(n in ("", ".", "..") or os.sep in n for n in names):
+            return None
+        return os.path.join(self.server.root, *names)
+
+    def _send(self, body):
+        path = self._path()
+        try:
+            if path is None:
+                raise IOError("Not served")
+            f = open(path, "rb")
+        except (IOError, OSError):
+            self.send_error(404)
+            return
+
+        with f:
+            st = os.fstat(f.fileno())
+            size = st.st_size
+            etag = '"%x-%x-%x"' % (st.st_ino, int(st.st_mtime * 1e6), size)
+            if self._not_modified(etag, st.st_mtime):
+                self.send_response(304)
+                self._send_validators(etag, st.st_mtime)
+                self.end_headers()
+                return
+
+            byte_range = None
+            if_range = self.headers.get("If-Range")
+            if "Range" in self.headers and if_range in (None, etag):
+                try:
+                    byte_range = _parse_range(self.headers["Range"], size)
+                except ValueError:
+                    self.send_response(416)
+                    self.send_header("Content-Range", "bytes */%d" % size)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+            if byte_range is None:
+                start, stop = 0, size
+                self.send_response(200)
+            else:
+                start, stop = byte_range
+                self.send_response(206)
+                self.send_header(
+                    "Content-Range", "bytes %d-%d/%d" % (start, stop - 1, size)
+                )
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(stop - start))
+            self.send_header("Accept-Ranges", "bytes")
+            self._send_validators(etag, st.st_mtime)
+            self.end_headers()
+
+            if body:
+                f.seek(start)
+                remaining = stop - start
+                while remaining > 0:
+                    block = f.read(min(_BLOCK_SIZE, remaining))
+                    if not block:
+                        break
+                    self.wfile.write(block)
+                    remaining -= len(block)
+
+    def _send_validators(self, etag, mtime):
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+        # Files may grow or be replaced, so caches must check every time;
+        # with the validators above, that costs a 304 when nothing changed
+        self.send_header("Cache-Control", "no-cache")
+
+    def _not_modified(self, etag, mtime):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(",")]
+            return etag in tags or "*" in tags
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since is not None:
+            parsed = parsedate_tz(if_modified_since)
+            if parsed is not None:
+                return int(mtime) <= mktime_tz(parsed)
+        return False
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class DataServer(object):
+    """HTTP server, running in a background thread of the kernel, for the
+    files under ``root``
+
+    :param root: Directory whose files are served, e.g., a ``data_dir``
+    :type root: str
+
+    :param host: Interface to listen on; the default only accepts
+                 connections from this host
+    :type host: str
+
+    :param port: Port to listen on; 0 picks a free port
+    :type port: int
+
+    :Example:
+    >>> server = DataServer('data')
+    >>> server.start()
+    >>> server.url_for('data/sin.tmp')  # doctest: +SKIP
+    'http://127.0.0.1:49152/5c0c.../sin.tmp'
+    >>> server.stop()
+    """
+
+    def __init__(self, root, host="127.0.0.1", port=0):
+        self.root = os.path.abspath(root or ".")
+        self.host = host
+        self.port = port
+        self.token = uuid.uuid4().hex
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def running(self):
+        """Whether the server is accepting requests"""
+        return self._httpd is not None
+
+    def start(self):
+        """Start serving in a daemon thread"""
+        if self.running:
+            return
+        httpd = _ThreadingHTTPServer((self.host, self.port), _Handler)
+        httpd.root = self.root
+        httpd.token = self.token
+        self.port = httpd.server_address[1]
+        self._thread = threading.Thread(target=httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._httpd = httpd
+
+    def stop(self):
+        """Stop serving and release the port"""
+        if not self.running:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        self._httpd = self._thread = None
+
+    def url_for(self, path):
+        """Return the URL of the file at ``path``
+
+        :param path: Path, in the kernel's filesystem, of a file under
+                     ``root``
+        :type path: str
+
+        :rtype: str
+
+        :raises ValueError: if ``path`` is not under ``root``
+        """
+        relative = os.path.relpath(os.path.abspath(path), self.root)
+        names = relative.split(os.sep)
+        if names[0] in (os.pardir, "") or os.path.isabs(relative):
+            raise ValueError("%r is not under %r" % (path, self.root))
+        host = self.host
+        if host in ("", "0.0.0.0"):
+            # Listening on every interface; name one the client can reach
+            host = socket.getfqdn()
+        return "http://%s:%d/%s/%s" % (
+            host, self.port, self.token,
+            "/".join(quote(name) for name in names),
+        )
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""Extrema-preserving decimation of sample vectors.
+
+Reducing a vector to the minimum and maximum of each of ``n`` contiguous
+blocks keeps every peak and every dropout visible once it is drawn at a
+resolution of ``n`` pixel columns, which plain striding does not.
+"""
+from __future__ import absolute_import, print_function
+
+import numpy as np
+
+
+def minmax(y, n):
+    """Reduce ``y`` to the minimum and maximum of ``n`` contiguous blocks
+
+    :param y: Samples to reduce
+    :type y: numpy.ndarray
+
+    :param n: Number of blocks
+    :type n: int
+
+    :return: A tuple (lo, hi) of arrays of length ``min(n, len(y))``;
+             if ``y`` already has no more than ``n`` samples, it is returned
+             as both ``lo`` and ``hi``
+    :rtype: Tuple[numpy.ndarray, numpy.ndarray]
+
+    :Example:
+    >>> minmax(np.array([1, 5, 2, 0, 3, 3]), 3)
+    (array([1, 0, 3]), array([5, 2, 3]))
+    """
+    return envelope(y, y, n)
+
+
+def envelope(lo, hi, n):
+    """Reduce an existing (lo, hi) envelope to ``n`` blocks
+
+    NaNs are ignored unless a whole block is NaN.
+
+    :param lo: Block minima
+    :type lo: numpy.ndarray
+
+    :param hi: Block maxima, the same length as ``lo``
+    :type hi: numpy.ndarray
+
+    :param n: Number of blocks
+    :type n: int
+
+    :return: A tuple (lo, hi) of arrays of length ``min(n, len(lo))``
+    :rtype: Tuple[numpy.ndarray, numpy.ndarray]
+    """
+    if n < 1:
+        raise ValueError("Number of blocks must be positive (got %r)" % n)
+    length = len(lo)
+    if length <= n:
+        return lo, hi
+    # Block boundaries are strictly increasing because length > n
+    edges = (np.arange(n) * length) // n
+    return np.fmin.reduceat(lo, edges), np.fmax.reduceat(hi, edges)
+
+
+def strips(y, n, width=64):
+    """Approximate the ``minmax`` reduction of ``y`` to ``n`` blocks from
+    the first ``width`` samples of each block only
+
+    Only ``n * width`` samples are read, so for a memory-mapped ``y`` the
+    cost does not depend on its length, at the price of missing extrema
+    outside the strips.
+
+    :param y: Samples to reduce
+    :type y: numpy.ndarray
+
+    :param n: Number of blocks
+    :type n: int
+
+    :param width: Number of samples read per block
+    :type width: int
+
+    :return: See ``minmax``
+    :rtype: Tuple[numpy.ndarray, numpy.ndarray]
+    """
+    length = len(y)
+    if length <= n * width:
+        return minmax(y, n)
+    starts = (np.arange(n) * length) // n
+    samples = y[starts[:, np.newaxis] + np.arange(width)]
+    return np.fmin.reduce(samples, axis=1), np.fmax.reduce(samples, axis=1)
+
+
+def xranges(x, n):
+    """Split points sorted by ``x`` into ``n`` equal ranges of x
+
+    :param x: Abscissas of the points, non-decreasing
+    :type x: numpy.ndarray
+
+    :param n: Number of ranges
+    :type n: int
+
+    :return: ``n + 1`` indices: range ``i`` holds points ``bounds[i]`` to
+             ``bounds[i + 1]``, which is empty if they are equal
+    :rtype: numpy.ndarray
+    """
+    if n < 1:
+        raise ValueError("Number of ranges must be positive (got %r)" % n)
+    length = len(x)
+    if not length:
+        return np.zeros(n + 1, dtype=np.intp)
+    if x.dtype.kind in "iu":
+        # Offsets of 64-bit integer timestamps are exact in floating point,
+        # unlike the timestamps themselves
+        x = x.astype(np.int64) - np.int64(x[0])
+        edges = np.arange(1, n) * (float(x[-1]) / n)
+    else:
+        edges = x[0] + np.arange(1, n) * ((x[-1] - x[0]) / float(n))
+    return np.concatenate((
+        [0], np.searchsorted(x, edges, side="left"), [length]
+    )).astype(np.intp)
+
+
+def xminmax(x, y, n):
+    """Select the points holding the minimum and maximum ``y`` of each of
+    ``n`` equal ranges of ``x``
+
+    Unlike ``minmax``, blocks span equal ranges of abscissas rather than
+    equal numbers of points, so irregularly sampled data keep every peak
+    and every dropout at the abscissa where it happened. NaNs are ignored
+    unless a whole range is NaN.
+
+    :param x: Abscissas of the points, non-decreasing
+    :type x: numpy.ndarray
+
+    :param y: Ordinates of the points, the same length as ``x``
+    :type y: numpy.ndarray
+
+    :param n: Number of ranges
+    :type n: int
+
+    :return: Increasing indices of the selected points, at most ``2 * n``;
+             if there are no more than ``2 * n`` points, all of them
+    :rtype: numpy.ndarray
+
+    :Example:
+    >>> xminmax(np.array([0, 1, 2, 9, 10]), np.array([3, 1, 2, 0, 5]), 2)
+    array([0, 1, 3, 4])
+    """
+    length = len(y)
+    if length <= 2 * n:
+        return np.arange(length)
+    bounds = xranges(x, n)
+    full = bounds[:-1] < bounds[1:]
+    starts, ends = bounds[:-1][full], bounds[1:][full]
+    lo = np.fmin.reduceat(y, starts)
+    hi = np.fmax.reduceat(y, starts)
+    return np.unique(np.concatenate((
+        _first_equal(y, lo, starts, ends), _first_equal(y, hi, starts, ends)
+    )))
+
+
+def _first_equal(y, values, starts, ends):
+    """Index of the first point of each block equal to the block's value,
+    or of its first point if there is none (e.g., for NaNs)"""
+    hits = np.flatnonzero(y == np.repeat(values, ends - starts))
+    if not len(hits):
+        return starts
+    pos = np.searchsorted(hits, starts)
+    first = hits[np.minimum(pos, len(hits) - 1)]
+    return np.where((pos < len(hits)) & (first < ends), first, starts)
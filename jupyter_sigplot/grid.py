@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+"""Many plots behind a single widget.
+
+Every ``Plot`` is a widget of its own, with its own comm, its own view and
+a placeholder output for its snapshot, which makes notebooks with dozens of
+plots slow to open. A ``PlotGrid`` lays out any number of panels in one
+widget instead: each panel takes the same commands as a ``Plot``, and the
+commands of all panels travel together over the grid's comm, addressed by
+panel index, and are applied by the view in one go.
+"""
+from __future__ import absolute_import, print_function
+from contextlib import contextmanager
+import threading
+import uuid
+
+from IPython.display import display, HTML
+import ipywidgets as widgets
+from traitlets import Dict, Int, List, Unicode
+
+from ._version import __version__ as version_string
+from .sigplot import _PlotBase, _show_snapshot
+
+
+class Panel(_PlotBase):
+    """One plot of a ``PlotGrid``; see ``Plot`` for its methods
+
+    Panels have no placeholder output of their own, so ``render_static``
+    only returns the image.
+    """
+
+    """Download progress of the file being overlaid"""
+    progress = 0.0
+
+    def __init__(self, grid, index, data_dir, plot_options):
+        self.grid = grid
+        self.index = index
+        self.plot_options = self._init_plot(data_dir, dict(plot_options))
+        self._placeholder = None
+        # The last command sent, as for ``Plot``
+        self.command_and_arguments = {}
+
+    def _send_message(self, command_and_arguments):
+        self.command_and_arguments = command_and_arguments
+        self.grid._queue(self.index, command_and_arguments)
+
+
+class PlotGrid(widgets.DOMWidget):
+    """A grid of ``rows`` by ``cols`` plot panels sharing one widget
+
+    Outside of a ``batch``, every command is sent as it is made, as for a
+    ``Plot``; within one, the commands of all panels are sent together
+    when the batch ends.
+
+    :param rows: Number of rows of panels
+    :type rows: int
+
+    :param cols: Number of columns of panels
+    :type cols: int
+
+    :param data_dir: Directory of the files the panels overlay, see ``Plot``
+    :type data_dir: str
+
+    :param panel_height: Height of each panel, in pixels
+    :type panel_height: int
+
+    :param plot_options: Options of sigplot.js's ``sigplot.Plot``, and
+                         of ``Plot``, common to all panels
+    :type plot_options: dict
+
+    :Example:
+    >>> grid = PlotGrid(8, 8)
+    >>> with grid.batch():
+    ...     for panel, samples in zip(grid, channels):
+    ...         panel.overlay_array(samples)
+    """
+
+    _view_module_version = Unicode(version_string)
+    _view_name = Unicode("SigPlotGridView").tag(sync=True)
+    _model_name = Unicode("SigPlotGridModel").tag(sync=True)
+    _view_module = Unicode("jupyter_sigplot").tag(sync=True)
+    _model_module = Unicode("jupyter_sigplot").tag(sync=True)
+
+    rows = Int(1).tag(sync=True)
+    cols = Int(1).tag(sync=True)
+    panel_height = Int(200).tag(sync=True)
+
+    """The sigplot.js ``plot_options`` of each panel"""
+    panel_options = List().tag(sync=True)
+
+    """The last batch of commands sent: ``seq``, which numbers the batches,
+    and ``commands``, each the message of a ``Plot`` with the ``panel`` it
+    is addressed to"""
+    commands = Dict().tag(sync=True)
+
+    """Unique identifier of the grid, for its placeholder output"""
+    uuid = Unicode().tag(sync=True)
+
+    def __init__(self, rows, cols, data_dir="", panel_height=200,
+                 **plot_options):
+        if rows < 1 or cols < 1:
+            raise ValueError(
+                "A grid needs at least one row and one column (got %r x %r)"
+                % (rows, cols)
+            )
+        super(PlotGrid, self).__init__()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._depth = 0
+        self._seq = 0
+
+        self.panels = [
+            Panel(self, index, data_dir, plot_options)
+            for index in range(rows * cols)
+        ]
+        self.rows = rows
+        self.cols = cols
+        self.panel_height = panel_height
+        self.panel_options = [panel.plot_options for panel in self.panels]
+        self.uuid = str(uuid.uuid4())
+        self.on_msg(self._handle_custom_msg)
+
+        display(self)
+        # One placeholder for the snapshot of the whole grid
+        self._placeholder = display(
+            HTML("<div id=\"%s\"></div>" % self.uuid), display_id=True
+        )
+
+    def close(self):
+        """Close the grid and its panels; see ``Plot.close``"""
+        if self.comm is None:
+            return
+        for panel in self.panels:
+            panel._release()
+        with self._lock:
+            self._pending = []
+        if self._placeholder is not None:
+            self._placeholder.update(HTML(""))
+            self._placeholder = None
+        super(PlotGrid, self).close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def __len__(self):
+        return len(self.panels)
+
+    def __iter__(self):
+        return iter(self.panels)
+
+    def __getitem__(self, key):
+        """The panel at index ``key``, counting row by row, or at
+        ``key = (row, col)``
+
+        :rtype: Panel
+        """
+        if isinstance(key, tuple):
+            row, col = key
+            if not (0 <= row < self.rows and 0 <= col < self.cols):
+                raise IndexError("No panel at %r" % (key,))
+            key = row * self.cols + col
+        return self.panels[key]
+
+    @contextmanager
+    def batch(self):
+        """Send the commands made within the ``with`` block as one message
+
+        Batches may be nested; the commands are sent when the outermost
+        one ends.
+        """
+        with self._lock:
+            self._depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._depth -= 1
+            self.flush()
+
+    def flush(self):
+        """Send the commands queued so far, unless within a ``batch``"""
+        with self._lock:
+            if self._depth or not self._pending:
+                return
+            pending, self._pending = self._pending, []
+            self._seq += 1
+            seq = self._seq
+        self.commands = {"seq": seq, "commands": pending}
+
+    def _queue(self, index, command_and_arguments):
+        with self._lock:
+            self._pending.append(dict(command_and_arguments, panel=index))
+        self.flush()
+
+    def _handle_custom_msg(self, _, content, buffers):
+        """Handle messages from views, sent with ``model.send``"""
+        if content.get("event") == "snapshot":
+            _show_snapshot(self._placeholder, "SigPlot grid",
+                           content.get("image"))
+            return
+        if content.get("event") != "trace":
+            return
+        try:
+            panel = self.panels[content["panel"]]
+        except (KeyError, IndexError, TypeError):
+            return
+        if panel.tracer is not None:
+            panel.tracer.add_view_spans(
+                content.get("view", ""), content.get("spans", [])
+            )
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+"""Reduction of local capture files to plottable layers.
+
+Everything here is a module-level function of picklable arguments, so that
+``Plot.overlay_files`` can run it in worker processes.
+"""
+from __future__ import absolute_import, print_function
+
+import numpy as np
+
+from . import bluefile
+from .decimate import minmax
+from .pyramid import Pyramid
+
+
+"""Segments transformed at once by ``psd``, bounding its memory use"""
+_PSD_BATCH = 256
+
+
+def reduce_minmax(data, header, size):
+    """Reduce ``data`` to the extrema of ``size`` blocks, interleaved as
+    (lo, hi) pairs so that the layer draws as an envelope.
+
+    Complex data are reduced to magnitude.
+
+    :return: A tuple (samples, overrides)
+    :rtype: Tuple[numpy.ndarray, dict]
+    """
+    if np.iscomplexobj(data):
+        data = np.abs(data)
+    lo, hi = minmax(data, size)
+    return interleave(lo, hi, header, 0, len(data) / float(len(lo) or 1))
+
+
+def interleave(lo, hi, header, first, per_bin):
+    """Lay out (lo, hi) bins as one layer that draws as their envelope
+
+    :param lo: Bin minima
+    :type lo: numpy.ndarray
+
+    :param hi: Bin maxima
+    :type hi: numpy.ndarray
+
+    :param header: Header of the file the bins reduce
+    :type header: dict
+
+    :param first: Index of the first sample of the first bin
+    :type first: int
+
+    :param per_bin: Number of samples per bin; with 1 or fewer, ``lo`` is
+                    taken to be the samples themselves
+    :type per_bin: float
+
+    :return: A tuple (samples, overrides)
+    :rtype: Tuple[numpy.ndarray, dict]
+    """
+    xstart = header["xstart"] + first * header["xdelta"]
+    if per_bin <= 1:
+        # Short enough to plot as is
+        return np.asarray(lo, dtype=np.float32), {
+            "xstart": xstart, "xdelta": header["xdelta"],
+        }
+    samples = np.empty(2 * len(lo), dtype=np.float32)
+    samples[0::2] = lo
+    samples[1::2] = hi
+    return samples, {
+        "xstart": xstart, "xdelta": header["xdelta"] * per_bin / 2.0,
+    }
+
+
+def reduce_psd(data, header, size):
+    """Reduce ``data`` to its average power spectrum, in dB, over
+    Hann-windowed segments of ``size`` samples.
+
+    Real data give the spectrum from 0 to half the sample rate; complex
+    data give the full, centered spectrum.
+
+    :return: A tuple (samples, overrides)
+    :rtype: Tuple[numpy.ndarray, dict]
+    """
+    nfft = min(size, len(data))
+    if nfft == 0:
+        return np.zeros(0, dtype=np.float32), {}
+    nseg = len(data) // nfft
+    window = np.hanning(nfft)
+    is_complex = np.iscomplexobj(data)
+
+    power = 0.0
+    for start in range(0, nseg, _PSD_BATCH):
+        stop = min(start + _PSD_BATCH, nseg)
+        segments = data[start * nfft:stop * nfft].reshape(-1, nfft) * window
+        if is_complex:
+            spectra = np.fft.fft(segments)
+        else:
+            spectra = np.fft.rfft(segments)
+        power = power + (np.abs(spectra) ** 2).sum(axis=0)
+    power = power / (nseg * (window ** 2).sum())
+
+    sample_rate = 1.0 / header["xdelta"]
+    overrides = {"xstart": 0.0, "xdelta": sample_rate / nfft}
+    if is_complex:
+        power = np.fft.fftshift(power)
+        overrides["xstart"] = -sample_rate / 2
+    db = 10 * np.log10(np.maximum(power, np.finfo(np.float64).tiny))
+    return db.astype(np.float32), overrides
+
+
+def reduce_none(data, header, size):
+    """Load ``data`` in full, keeping the file's framing.
+
+    :return: A tuple (samples, overrides)
+    :rtype: Tuple[numpy.ndarray, dict]
+    """
+    overrides = {"xstart": header["xstart"], "xdelta": header["xdelta"]}
+    if header["subsize"]:
+        overrides["subsize"] = header["subsize"]
+    return np.array(data), overrides
+
+
+"""Reductions available by name to ``reduce_file``"""
+REDUCERS = {
+    "minmax": reduce_minmax,
+    "psd": reduce_psd,
+    None: reduce_none,
+}
+
+
+def reduce_file(path, reduce="minmax", size=4096, pyramid=False):
+    """Read the BLUE file at ``path`` and reduce it to one layer
+
+    :param path: Path to a BLUE file
+    :type path: str
+
+    :param reduce: Name of a reduction in ``REDUCERS``, or a callable
+                   ``reduce(data, header, size)`` returning a tuple
+                   (samples, overrides); it must be picklable, i.e., defined
+                   at module level, to be run in a worker process
+    :type reduce: Optional[Union[str, function]]
+
+    :param size: Resolution of the reduction, e.g., the number of min/max
+                 blocks or the FFT size
+    :type size: int
+
+    :param pyramid: For 'minmax' reductions of type 1000 files, read the
+                    extrema from the file's ``pyramid.Pyramid`` sidecar,
+                    creating or extending it first if needed, rather than
+                    scanning the file
+    :type pyramid: bool
+
+    :return: A tuple (samples, overrides), ready for ``overlay_array``
+    :rtype: Tuple[numpy.ndarray, dict]
+    """
+    if not callable(reduce):
+        try:
+            reduce = REDUCERS[reduce]
+        except KeyError:
+            raise ValueError("Unknown reduction %r" % (reduce,))
+
+    header = bluefile.read_header(path)
+    if pyramid and reduce is reduce_minmax and not header["subsize"]:
+        lo, hi, first, per_bin = Pyramid.open(path).envelope(bins=size)
+        return interleave(lo, hi, header, first, per_bin)
+
+    data = bluefile.read_data(path, header)
+    if data.ndim > 1:
+        # Vector formats: use the first element of each sample
+        data = data[:, 0]
+    return reduce(data, header, size)
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""Columnar binary encoding of plot markers.
+
+Markers are sent to the client as a single buffer holding one column per
+field, so thousands of markers cost one message and one redraw. The layout
+of the buffer, for ``n`` markers, is::
+
+    x              float64[n]
+    y              float64[n]
+    label offsets  uint32[n + 1]   (byte offsets into the label bytes)
+    style indices  uint16[n]       (indices into the style table)
+    label bytes    UTF-8
+
+All values are little-endian. The style table, and everything else that is
+not per-marker, travels alongside the buffer as a JSON-able dict.
+"""
+from __future__ import absolute_import, print_function
+import json
+
+import numpy as np
+import six
+
+
+"""Largest number of distinct styles that fit a uint16 style index"""
+MAX_STYLES = 2 ** 16
+
+
+def _style_column(styles, count):
+    """Return a (table, indices) pair for ``styles``, with one entry in the
+    table per distinct style"""
+    if styles is None or isinstance(styles, dict):
+        return [dict(styles or {})], np.zeros(count, dtype=np.uint16)
+
+    if len(styles) != count:
+        raise ValueError("Got %d styles for %d markers" % (len(styles), count))
+    table = []
+    seen = {}
+    indices = np.empty(count, dtype=np.uint16)
+    for i, style in enumerate(styles):
+        key = json.dumps(style, sort_keys=True)
+        index = seen.get(key)
+        if index is None:
+            if len(table) == MAX_STYLES:
+                raise ValueError(
+                    "At most %d distinct marker styles are supported" %
+                    MAX_STYLES
+                )
+            index = seen[key] = len(table)
+            table.append(style)
+        indices[i] = index
+    return table, indices
+
+
+def _label_column(labels, count):
+    """Return a (offsets, blob) pair for ``labels``"""
+    if labels is None:
+        return np.zeros(count + 1, dtype=np.uint32), b""
+    if isinstance(labels, six.string_types):
+        labels = [labels] * count
+    if len(labels) != count:
+        raise ValueError("Got %d labels for %d markers" % (len(labels), count))
+
+    encoded = [six.text_type(label).encode("utf-8") for label in labels]
+    offsets = np.zeros(count + 1, dtype=np.uint32)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    return offsets, b"".join(encoded)
+
+
+def encode_markers(x, y, labels=None, styles=None):
+    """Encode markers as one columnar buffer
+
+    :param x: Marker abscissas
+    :type x: numpy.ndarray
+
+    :param y: Marker ordinates, the same length as ``x``
+    :type y: numpy.ndarray
+
+    :param labels: One label per marker, or a single label for all
+    :type labels: Optional[Union[str, Sequence[str]]]
+
+    :param styles: One dict of sigplot annotation options (e.g., ``color``,
+                   ``font``, ``popup``) per marker, or a single dict for all
+    :type styles: Optional[Union[dict, Sequence[dict]]]
+
+    :return: A tuple (meta, buffer); ``meta`` holds the marker ``count``,
+             the ``styles`` table and whether there are ``labels``
+    :rtype: Tuple[dict, numpy.ndarray]
+
+    :raises ValueError: if the columns have different lengths
+    """
+    x = np.asarray(x, dtype=np.float64).ravel()
+    y = np.asarray(y, dtype=np.float64).ravel()
+    count = len(x)
+    if len(y) != count:
+        raise ValueError("Got %d x values and %d y values" % (count, len(y)))
+
+    table, style_indices = _style_column(styles, count)
+    offsets, blob = _label_column(labels, count)
+
+    columns = [
+        (x, "<f8"),
+        (y, "<f8"),
+        (offsets, "<u4"),
+        (style_indices, "<u2"),
+        (np.frombuffer(blob, dtype=np.uint8), "u1"),
+    ]
+    size = sum(column.size * np.dtype(dtype).itemsize
+               for column, dtype in columns)
+    buffer = np.empty(size, dtype=np.uint8)
+    start = 0
+    for column, dtype in columns:
+        stop = start + column.size * np.dtype(dtype).itemsize
+        buffer[start:stop].view(dtype)[:] = column
+        start = stop
+
+    meta = {
+        "count": count,
+        "styles": table,
+        "labels": labels is not None,
+    }
+    return meta, buffer
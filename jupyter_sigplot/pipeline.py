@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+"""Lazily evaluated operator pipelines for derived layers.
+
+``Source(samples).pipe(bandpass(0.05, 0.1), mag_db())`` describes a derived
+layer without computing it. Overlaid on a ``Plot``, it is only evaluated over
+the range the plot shows, at the plot's resolution: block by block, with
+recently evaluated blocks cached, or, for ranges too long to evaluate in
+full, in evenly spaced strips. Changing a parameter of an operator, with
+``Operator.update``, only evaluates what is on screen again.
+
+Operators preserve the sample rate; reduction to the plot's resolution is
+done by the pipeline, with min/max decimation.
+
+A ``PyramidView`` is evaluated the same way, from the min/max pyramid of a
+file rather than from its samples.
+"""
+from __future__ import absolute_import, print_function
+from collections import OrderedDict
+
+import numpy as np
+
+from . import decimate, ingest
+
+
+class Operator(object):
+    """One step of a ``Pipeline``: a function of blocks of samples
+
+    :param function: Called as ``function(block, **params)``; returns as
+                     many samples as ``block`` has
+    :type function: Callable
+
+    :param margin: Number of samples on either side of a block that
+                   ``function`` needs to compute the block exactly (e.g.,
+                   half the length of a filter), or a function of
+                   ``params`` returning it
+    :type margin: Union[int, Callable]
+
+    :param params: Parameters of ``function``
+    :type params: dict
+    """
+
+    def __init__(self, function, margin=0, **params):
+        self.function = function
+        self._margin = margin
+        self.params = params
+        self._listeners = []
+        # Number of updates, by which pipelines tell their cache is stale
+        self._version = 0
+
+    @property
+    def margin(self):
+        if callable(self._margin):
+            return int(self._margin(**self.params))
+        return int(self._margin)
+
+    def __call__(self, block):
+        return self.function(block, **self.params)
+
+    def update(self, **params):
+        """Change parameters of the operator; plots showing pipelines that
+        use it evaluate what they show again
+
+        :Example:
+        >>> band = bandpass(0.05, 0.1)
+        >>> plot.overlay_array(Source(samples).pipe(band, mag_db()))
+        >>> band.update(low=0.06)
+        """
+        self.params.update(params)
+        self._version += 1
+        for listener in list(self._listeners):
+            listener()
+
+    def __repr__(self):
+        return "%s(%s)" % (
+            getattr(self.function, "__name__", "operator").lstrip("_"),
+            ", ".join("%s=%r" % item for item in sorted(self.params.items())),
+        )
+
+
+class Source(object):
+    """Samples that pipelines read from
+
+    :param samples: 1-D samples; e.g., a ``numpy.memmap`` of a file larger
+                    than memory, of which only what is shown is read
+    :type samples: numpy.ndarray
+
+    :param xstart: Abscissa of the first sample
+    :type xstart: float
+
+    :param xdelta: Abscissa spacing between samples
+    :type xdelta: float
+    """
+
+    def __init__(self, samples, xstart=0.0, xdelta=1.0):
+        if np.ndim(samples) != 1:
+            raise ValueError("Source samples must be 1-D")
+        self.samples = samples
+        self.xstart = float(xstart)
+        self.xdelta = float(xdelta)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def pipe(self, *operators):
+        """Return a pipeline applying ``operators`` to the samples, in order
+
+        :rtype: Pipeline
+        """
+        return Pipeline(self, operators)
+
+
+class Pipeline(object):
+    """Lazily evaluated chain of operators over a ``Source``; see
+    ``Source.pipe``
+
+    :param source: Samples the pipeline reads from
+    :type source: Source
+
+    :param operators: Operators applied, in order
+    :type operators: Sequence[Operator]
+    """
+
+    """Number of samples evaluated at once, and cached together"""
+    block_size = 65536
+
+    """Number of evaluated blocks kept"""
+    cache_blocks = 64
+
+    """Ranges of more samples than this are evaluated in strips, one per
+    bin, of ``max_samples // bins`` samples each"""
+    max_samples = 1 << 22
+
+    def __init__(self, source, operators):
+        self.source = source
+        self.operators = list(operators)
+        self._blocks = OrderedDict()
+        # ``Operator._version`` of each operator when the blocks cached
+        # were evaluated
+        self._versions = self._operator_versions()
+        self._listeners = []
+
+    def __len__(self):
+        return len(self.source)
+
+    def pipe(self, *operators):
+        """Return a pipeline that also applies ``operators``
+
+        :rtype: Pipeline
+        """
+        return Pipeline(self.source, self.operators + list(operators))
+
+    def on_change(self, callback):
+        """Call ``callback()`` whenever a parameter of an operator changes
+
+        :param callback: Called without arguments
+        :type callback: Callable
+        """
+        if not self._listeners:
+            for operator in self.operators:
+                operator._listeners.append(self._changed)
+        self._listeners.append(callback)
+
+    def off_change(self, callback):
+        """Stop calling ``callback``, see ``on_change``. Once no callback
+        is left, the operators no longer refer to the pipeline, and its
+        cached blocks are dropped.
+
+        :param callback: A callback given to ``on_change``
+        :type callback: Callable
+        """
+        self._listeners.remove(callback)
+        if not self._listeners:
+            for operator in self.operators:
+                operator._listeners.remove(self._changed)
+            self._blocks.clear()
+
+    def _changed(self):
+        for listener in list(self._listeners):
+            listener()
+
+    def _operator_versions(self):
+        return tuple(operator._version for operator in self.operators)
+
+    @property
+    def margin(self):
+        """Samples on either side of a range read to evaluate it"""
+        return sum(operator.margin for operator in self.operators)
+
+    def evaluate(self, xmin=None, xmax=None, bins=4096):
+        """Evaluate the pipeline over the samples between abscissas
+        ``xmin`` and ``xmax``, reduced to the minimum and maximum of
+        ``bins`` blocks if there are more samples than that
+
+        :param xmin: Smallest abscissa shown; the first sample if None
+        :type xmin: Optional[float]
+
+        :param xmax: Largest abscissa shown; the last sample if None
+        :type xmax: Optional[float]
+
+        :param bins: Resolution of the plot, in bins
+        :type bins: int
+
+        :return: A tuple (samples, overrides), as for ``overlay_array``;
+                 complex results are reduced to magnitude
+        :rtype: Tuple[numpy.ndarray, dict]
+        """
+        versions = self._operator_versions()
+        if versions != self._versions:
+            # An operator changed since the blocks were evaluated
+            self._blocks.clear()
+            self._versions = versions
+        xstart, xdelta = self.source.xstart, self.source.xdelta
+        first, stop = _sample_range(xmin, xmax, xstart, xdelta,
+                                    len(self.source))
+        count = stop - first
+
+        if count > self.max_samples and count > bins:
+            width = max(self.max_samples // bins, 1)
+            starts = first + (np.arange(bins) * count) // bins
+            strips = [
+                self._abs(self._evaluate(start, min(start + width, stop)))
+                for start in starts
+            ]
+            lo = np.array([np.fmin.reduce(strip) if len(strip) else np.nan
+                           for strip in strips])
+            hi = np.array([np.fmax.reduce(strip) if len(strip) else np.nan
+                           for strip in strips])
+        else:
+            lo, hi = decimate.minmax(
+                self._abs(self._range(first, stop)), bins
+            )
+        samples, overrides = ingest.interleave(
+            lo, hi, {"xstart": xstart, "xdelta": xdelta}, first,
+            count / float(max(len(lo), 1)),
+        )
+        return samples.astype(np.float32), overrides
+
+    @staticmethod
+    def _abs(samples):
+        return np.abs(samples) if np.iscomplexobj(samples) else samples
+
+    def _range(self, first, stop):
+        """Evaluate samples ``first`` to ``stop`` from cached blocks"""
+        size = self.block_size
+        blocks = [self._block(index)
+                  for index in range(first // size, (stop - 1) // size + 1)]
+        if not blocks:
+            return np.zeros(0, dtype=np.float32)
+        offset = first - first // size * size
+        return np.concatenate(blocks)[offset:offset + stop - first]
+
+    def _block(self, index):
+        """Evaluate block ``index``, or return it from the cache"""
+        block = self._blocks.pop(index, None)
+        if block is None:
+            start = index * self.block_size
+            block = self._evaluate(
+                start, min(start + self.block_size, len(self.source))
+            )
+        self._blocks[index] = block
+        while len(self._blocks) > self.cache_blocks:
+            self._blocks.popitem(last=False)
+        return block
+
+    def _evaluate(self, start, stop):
+        """Evaluate samples ``start`` to ``stop``, reading the margins the
+        operators need around them"""
+        margin = self.margin
+        lo = max(start - margin, 0)
+        hi = min(stop + margin, len(self.source))
+        samples = np.asarray(self.source.samples[lo:hi])
+        for operator in self.operators:
+            samples = np.asarray(operator(samples))
+        return samples[start - lo:stop - lo]
+
+
+class PyramidView(object):
+    """Min/max envelope of a type 1000 BLUE file, read from its
+    ``pyramid.Pyramid`` over the range the plot shows; overlaid like a
+    ``Pipeline``, it is read again at the plot's resolution as the plot
+    zooms
+
+    :param pyramid: Pyramid of the file
+    :type pyramid: pyramid.Pyramid
+    """
+
+    def __init__(self, pyramid):
+        self.pyramid = pyramid
+
+    def __len__(self):
+        return self.pyramid.samples
+
+    def on_change(self, callback):
+        """The pyramid does not change; ``callback`` is never called"""
+
+    def off_change(self, callback):
+        """See ``on_change``"""
+
+    def evaluate(self, xmin=None, xmax=None, bins=4096):
+        """Read the envelope of the samples between abscissas ``xmin`` and
+        ``xmax``; see ``Pipeline.evaluate``
+
+        :rtype: Tuple[numpy.ndarray, dict]
+        """
+        header = self.pyramid.header
+        first, stop = _sample_range(xmin, xmax, header["xstart"],
+                                    header["xdelta"], len(self))
+        lo, hi, first, per_bin = self.pyramid.envelope(first, stop, bins)
+        samples, overrides = ingest.interleave(lo, hi, header, first, per_bin)
+        return samples.astype(np.float32), overrides
+
+
+def _sample_range(xmin, xmax, xstart, xdelta, length):
+    """Indices (first, stop) of the samples between abscissas ``xmin`` and
+    ``xmax``, either of which may be None for no bound"""
+    first, stop = 0, length
+    if xmin is not None:
+        first = int(np.clip(np.floor((xmin - xstart) / xdelta), 0, length))
+    if xmax is not None:
+        stop = int(np.clip(np.ceil((xmax - xstart) / xdelta) + 1, first,
+                           length))
+    return first, stop
+
+
+def _bandpass(block, low, high, taps):
+    n = np.arange(taps) - (taps - 1) / 2.0
+    h = (2 * high * np.sinc(2 * high * n) - 2 * low * np.sinc(2 * low * n))
+    h *= np.hamming(taps)
+    delay = (taps - 1) // 2
+    return np.convolve(block, h)[delay:delay + len(block)]
+
+
+def bandpass(low, high, taps=129):
+    """Linear-phase FIR band-pass filter (a Hamming-windowed sinc)
+
+    :param low: Lower cutoff, in cycles per sample (0 for a low-pass)
+    :type low: float
+
+    :param high: Upper cutoff, in cycles per sample, up to 0.5
+    :type high: float
+
+    :param taps: Length of the filter; odd, so it delays no sample
+    :type taps: int
+
+    :rtype: Operator
+    """
+    return Operator(_bandpass, lambda taps, **_: taps // 2,
+                    low=low, high=high, taps=taps)
+
+
+def _magnitude(block):
+    return np.abs(block)
+
+
+def magnitude():
+    """Magnitude of the samples
+
+    :rtype: Operator
+    """
+    return Operator(_magnitude)
+
+
+def _mag_db(block, floor):
+    with np.errstate(divide="ignore"):
+        return np.maximum(20 * np.log10(np.abs(block)), floor)
+
+
+def mag_db(floor=-200.0):
+    """Magnitude of the samples, in dB
+
+    :param floor: Smallest value, e.g., for samples of 0
+    :type floor: float
+
+    :rtype: Operator
+    """
+    return Operator(_mag_db, floor=floor)
+
+
+def _detrend(block, window):
+    # Moving average over ``window`` samples, at the edges over those there
+    # are
+    padded = np.concatenate(([0], np.cumsum(block)))
+    index = np.arange(len(block))
+    lo = np.maximum(index - window // 2, 0)
+    hi = np.minimum(index + window // 2 + 1, len(block))
+    return block - (padded[hi] - padded[lo]) / (hi - lo)
+
+
+def detrend(window=1025):
+    """Remove the trend of the samples: their moving average over
+    ``window`` samples
+
+    :param window: Length of the moving average
+    :type window: int
+
+    :rtype: Operator
+    """
+    return Operator(_detrend, lambda window: window // 2, window=window)
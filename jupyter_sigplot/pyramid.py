@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+"""Multi-resolution min/max pyramids of BLUE files, kept as sidecar files.
+
+A pyramid holds the extrema of the file's samples over blocks of
+``BASE_FACTOR`` samples, then over blocks ``LEVEL_FACTOR`` times larger, and
+so on. Any range of the file can then be reduced to a few thousand (lo, hi)
+bins by reading only the coarsest level that still resolves it, instead of
+scanning the samples themselves.
+
+The sidecar is written next to the file, as ``<file>.pyr``, and records the
+file's mtime and size. When the file has grown since, only the new samples
+are scanned; when it has otherwise changed, the pyramid is rebuilt.
+"""
+from __future__ import absolute_import, print_function
+import json
+import os
+import struct
+import uuid
+
+import numpy as np
+
+from . import bluefile
+from .decimate import minmax
+
+
+"""Samples per bin in the finest level"""
+BASE_FACTOR = 64
+
+"""Ratio between the bin sizes of successive levels"""
+LEVEL_FACTOR = 8
+
+"""Levels are added until the coarsest has no more than this many bins"""
+MIN_BINS = 1024
+
+"""Extension of sidecar files"""
+SUFFIX = ".pyr"
+
+"""Samples scanned at once while building, bounding memory use"""
+_CHUNK = BASE_FACTOR * 2 ** 16
+
+_MAGIC = b"SIGPYR01"
+
+
+def sidecar_path(path):
+    """Return the path of the pyramid sidecar of ``path``"""
+    return path + SUFFIX
+
+
+def _samples(path, header):
+    """The file's samples as a flat, real, memory-mapped array"""
+    data = bluefile.read_data(path, header)
+    if data.ndim > 1:
+        # Vector formats: use the first element of each sample
+        data = data[:, 0]
+    return data
+
+
+def _scan(data, start, stop):
+    """Level-0 (lo, hi) bins of ``data[start:stop]``, which holds a whole
+    number of ``BASE_FACTOR`` blocks"""
+    bins = np.empty(((stop - start) // BASE_FACTOR, 2), dtype=np.float32)
+    for chunk_start in range(start, stop, _CHUNK):
+        chunk = data[chunk_start:min(chunk_start + _CHUNK, stop)]
+        if np.iscomplexobj(chunk):
+            chunk = np.abs(chunk)
+        blocks = chunk.reshape(-1, BASE_FACTOR)
+        first = (chunk_start - start) // BASE_FACTOR
+        bins[first:first + len(blocks), 0] = np.fmin.reduce(blocks, axis=1)
+        bins[first:first + len(blocks), 1] = np.fmax.reduce(blocks, axis=1)
+    return bins
+
+
+def _coarsen(bins):
+    """Reduce (lo, hi) bins by ``LEVEL_FACTOR``, dropping any remainder"""
+    count = len(bins) // LEVEL_FACTOR
+    blocks = bins[:count * LEVEL_FACTOR].reshape(count, LEVEL_FACTOR, 2)
+    coarse = np.empty((count, 2), dtype=np.float32)
+    coarse[:, 0] = np.fmin.reduce(blocks[:, :, 0], axis=1)
+    coarse[:, 1] = np.fmax.reduce(blocks[:, :, 1], axis=1)
+    return coarse
+
+
+def _build_levels(level0):
+    levels = [level0]
+    while len(levels[-1]) > MIN_BINS:
+        levels.append(_coarsen(levels[-1]))
+    return levels
+
+
+class Pyramid(object):
+    """Min/max pyramid of a type 1000 BLUE file
+
+    Use ``Pyramid.open`` rather than constructing one directly.
+
+    :param path: Path of the BLUE file
+    :type path: str
+
+    :param header: The file's header, from ``bluefile.read_header``
+    :type header: dict
+
+    :param levels: (lo, hi) bins of each level, finest first, each of shape
+                   (bins, 2); level ``i`` has ``BASE_FACTOR *
+                   LEVEL_FACTOR ** i`` samples per bin
+    :type levels: list(numpy.ndarray)
+
+    :param samples: Number of samples in the file
+    :type samples: int
+    """
+
+    def __init__(self, path, header, levels, samples):
+        self.path = path
+        self.header = header
+        self.levels = levels
+        self.samples = samples
+
+    @classmethod
+    def open(cls, path):
+        """Load the pyramid of the BLUE file at ``path`` from its sidecar,
+        bringing the sidecar up to date first if needed.
+
+        :param path: Path of the BLUE file
+        :type path: str
+
+        :rtype: Pyramid
+
+        :raises ValueError: if ``path`` is not a type 1000 BLUE file
+        """
+        header = bluefile.read_header(path)
+        if header["subsize"]:
+            raise ValueError("Pyramids need a type 1000 file")
+        data = _samples(path, header)
+        st = os.stat(path)
+
+        levels, meta = _read_sidecar(sidecar_path(path))
+        stale = (
+            meta is None or
+            meta["format"] != header["format"] or
+            meta["data_start"] != header["data_start"] or
+            meta["samples"] > len(data) or
+            (meta["samples"] == len(data) and
+             meta["mtime"] != st.st_mtime)
+        )
+        if stale:
+            level0 = _scan(data, 0, len(data) // BASE_FACTOR * BASE_FACTOR)
+        elif meta["mtime"] == st.st_mtime and meta["size"] == st.st_size:
+            return cls(path, header, levels, meta["samples"])
+        else:
+            # The file grew; only scan what was appended
+            covered = len(levels[0]) * BASE_FACTOR
+            end = len(data) // BASE_FACTOR * BASE_FACTOR
+            level0 = np.concatenate([levels[0], _scan(data, covered, end)])
+
+        levels = _build_levels(level0)
+        _write_sidecar(sidecar_path(path), levels, {
+            "format": header["format"],
+            "data_start": header["data_start"],
+            "samples": len(data),
+            "mtime": st.st_mtime,
+            "size": st.st_size,
+        })
+        return cls(path, header, levels, len(data))
+
+    def envelope(self, start=0, stop=None, bins=4096):
+        """Reduce samples ``start`` to ``stop`` to at most ``bins`` (lo, hi)
+        pairs, reading the coarsest level that resolves them.
+
+        Ranges too short for the finest level, and samples past the end of
+        the pyramid, are read from the file itself. The bins of the level
+        are reduced further to ``bins`` bins of equal width, over which
+        samples past the end of the pyramid count for what they span.
+
+        :param start: Index of the first sample
+        :type start: int
+
+        :param stop: Index past the last sample; defaults to the end
+        :type stop: Optional[int]
+
+        :param bins: Number of bins wanted
+        :type bins: int
+
+        :return: A tuple (lo, hi, first, per_bin): the bins, the index of the
+                 first sample they cover and the number of samples per bin,
+                 to within one bin of the level read
+        :rtype: Tuple[numpy.ndarray, numpy.ndarray, int, float]
+        """
+        stop = self.samples if stop is None else min(stop, self.samples)
+        start = max(0, min(start, stop))
+        span = stop - start
+
+        level = -1
+        while level + 1 < len(self.levels) and \
+                self._factor(level + 1) * bins <= span:
+            level += 1
+        if level < 0:
+            data = _samples(self.path, self.header)[start:stop]
+            if np.iscomplexobj(data):
+                data = np.abs(data)
+            lo, hi = minmax(data, bins)
+            return lo, hi, start, span / float(max(len(lo), 1))
+
+        factor = self._factor(level)
+        first, last = start // factor, -(-stop // factor)
+        pairs = self.levels[level][first:last]
+        lo, hi = pairs[:, 0], pairs[:, 1]
+        begin, end = first * factor, min(last, len(pairs) + first) * factor
+
+        covered = len(self.levels[level]) * factor
+        if stop > covered:
+            # The tail, shorter than one bin of this level
+            data = _samples(self.path, self.header)[covered:stop]
+            if np.iscomplexobj(data):
+                data = np.abs(data)
+            lo = np.append(lo, np.nanmin(data))
+            hi = np.append(hi, np.nanmax(data))
+            end = stop
+
+        # Bins of equal width in samples, each reducing the bins of the
+        # level that start within it; at least one bin of the level wide, so
+        # none is empty
+        count = min(bins, (end - begin) // factor)
+        edges = (np.arange(count) * (end - begin)) // count // factor
+        lo, hi = np.fmin.reduceat(lo, edges), np.fmax.reduceat(hi, edges)
+        return lo, hi, begin, (end - begin) / float(count)
+
+    @staticmethod
+    def _factor(level):
+        return BASE_FACTOR * LEVEL_FACTOR ** level
+
+
+def _read_sidecar(path):
+    """Return (levels, meta) from the sidecar at ``path``, or
+    (None, None) if there is no usable sidecar"""
+    try:
+        with open(path, "rb") as f:
+            prefix = f.read(len(_MAGIC) + 4)
+            if len(prefix) < len(_MAGIC) + 4 or \
+                    not prefix.startswith(_MAGIC):
+                return None, None
+            length, = struct.unpack("<I", prefix[len(_MAGIC):])
+            meta = json.loads(f.read(length).decode("utf-8"))
+    except (IOError, OSError, ValueError):
+        return None, None
+
+    levels = []
+    for offset, count in meta.pop("levels"):
+        levels.append(np.memmap(path, dtype="<f4", mode="r",
+                                offset=offset, shape=(count, 2)))
+    return levels, meta
+
+
+def _write_sidecar(path, levels, meta):
+    """Write a sidecar atomically: a magic string, the length of a JSON
+    header, the header, then each level's (lo, hi) bins as float32"""
+    # Lay out the levels after the header, which must therefore account for
+    # the width of its own offsets; reserve generously and pad
+    reserve = len(json.dumps(meta)) + 64 * (len(levels) + 1)
+    offset = len(_MAGIC) + 4 + reserve
+    layout = []
+    for level in levels:
+        layout.append([offset, len(level)])
+        offset += level.nbytes
+    encoded = json.dumps(dict(meta, levels=layout)).encode("utf-8")
+    encoded = encoded.ljust(reserve)
+
+    partial = "%s.%s.partial" % (path, uuid.uuid4().hex)
+    with open(partial, "wb") as f:
+        f.write(_MAGIC)
+        f.write(struct.pack("<I", len(encoded)))
+        f.write(encoded)
+        for level in levels:
+            np.ascontiguousarray(level, dtype="<f4").tofile(f)
+    try:
+        os.rename(partial, path)
+    except OSError:
+        # Windows won't rename over an existing file
+        os.remove(path)
+        os.rename(partial, path)
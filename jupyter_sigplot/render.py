@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+"""Kernel-side rasterization of plot layers to PNG.
+
+The browser normally screenshots its canvas into the notebook, which never
+happens when a notebook is executed headlessly (nbconvert, papermill). This
+module draws a static stand-in from min/max envelopes of each layer, so the
+cost of a render depends on the image size rather than on the data size.
+"""
+from __future__ import absolute_import, print_function
+from collections import namedtuple
+import struct
+import zlib
+
+import numpy as np
+
+from . import bluefile
+from .decimate import envelope, minmax, xranges
+from .pyramid import Pyramid
+
+
+"""Number of (lo, hi) bins retained per layer; more than any rendered
+width, so layers can be re-decimated to pixel columns later"""
+ENVELOPE_SIZE = 4096
+
+"""Colors, as RGB, of the background and of successive layers"""
+BACKGROUND = (0, 0, 0)
+LAYER_COLORS = [
+    (255, 255, 255),
+    (255, 0, 0),
+    (0, 255, 0),
+    (0, 128, 255),
+    (255, 255, 0),
+    (255, 0, 255),
+    (0, 255, 255),
+]
+
+"""Min/max envelope of a layer: bin ``i`` is at
+``xstart + i * xdelta`` and spans values ``lo[i]`` to ``hi[i]``"""
+Envelope = namedtuple("Envelope", ["xstart", "xdelta", "lo", "hi"])
+
+
+def layer_envelope(data, xstart=0.0, xdelta=1.0, subsize=0,
+                   size=ENVELOPE_SIZE):
+    """Compute the envelope of a layer's samples
+
+    :param data: Layer samples; complex samples are reduced to magnitude
+    :type data: numpy.ndarray
+
+    :param xstart: Abscissa of the first sample
+    :type xstart: float
+
+    :param xdelta: Abscissa spacing between samples
+    :type xdelta: float
+
+    :param subsize: If non-zero, ``data`` holds rows of ``subsize`` samples
+                    that are drawn over one another
+    :type subsize: int
+
+    :param size: Maximum number of bins in the envelope
+    :type size: int
+
+    :return: The envelope of ``data``
+    :rtype: Envelope
+    """
+    y = np.asarray(data)
+    if np.iscomplexobj(y):
+        y = np.abs(y)
+    y = y.ravel()
+
+    if subsize and y.size >= subsize:
+        rows = y[:y.size // subsize * subsize].reshape(-1, subsize)
+        lo, hi = envelope(
+            np.fmin.reduce(rows, axis=0), np.fmax.reduce(rows, axis=0), size
+        )
+        length = subsize
+    else:
+        lo, hi = minmax(y, size)
+        length = y.size
+
+    if len(lo):
+        xdelta = xdelta * length / float(len(lo))
+    return Envelope(float(xstart), float(xdelta), lo, hi)
+
+
+def xy_envelope(x, y, size=ENVELOPE_SIZE):
+    """Compute the envelope of a layer of points at abscissas ``x``
+
+    Bins span equal ranges of ``x``; bins without points are NaN.
+
+    :param x: Abscissas of the points, non-decreasing
+    :type x: numpy.ndarray
+
+    :param y: Ordinates of the points; complex ordinates are reduced to
+              magnitude
+    :type y: numpy.ndarray
+
+    :param size: Number of bins in the envelope
+    :type size: int
+
+    :return: The envelope of the points
+    :rtype: Envelope
+    """
+    y = np.asarray(y)
+    if np.iscomplexobj(y):
+        y = np.abs(y)
+    if not len(y):
+        return Envelope(0.0, 1.0, y, y)
+    bounds = xranges(x, size)
+    full = bounds[:-1] < bounds[1:]
+    lo = np.full(size, np.nan)
+    hi = np.full(size, np.nan)
+    lo[full] = np.fmin.reduceat(y, bounds[:-1][full])
+    hi[full] = np.fmax.reduceat(y, bounds[:-1][full])
+    span = float(x[-1] - x[0])
+    return Envelope(float(x[0]), span / size or 1.0, lo, hi)
+
+
+def file_envelope(path, size=ENVELOPE_SIZE, pyramid=False):
+    """Compute the envelope of the BLUE file at ``path``
+
+    :param path: Path to a BLUE file
+    :type path: str
+
+    :param size: Maximum number of bins in the envelope
+    :type size: int
+
+    :param pyramid: For type 1000 files, read the envelope from the file's
+                    ``pyramid.Pyramid`` sidecar, creating or extending it
+                    first if needed, rather than scanning the file
+    :type pyramid: bool
+
+    :return: The envelope of the file's data
+    :rtype: Envelope
+
+    :raises ValueError: if ``path`` is not a supported BLUE file
+    """
+    header = bluefile.read_header(path)
+    if pyramid and not header["subsize"]:
+        lo, hi, first, per_bin = Pyramid.open(path).envelope(bins=size)
+        return Envelope(
+            header["xstart"] + first * header["xdelta"],
+            header["xdelta"] * per_bin, lo, hi,
+        )
+
+    data = bluefile.read_data(path, header)
+    if data.ndim > 1:
+        # Vector formats: draw the first element of each sample
+        data = data[:, 0]
+    return layer_envelope(
+        data, header["xstart"], header["xdelta"], header["subsize"], size
+    )
+
+
+def _to_rows(values, vmin, vmax, height):
+    scale = (height - 1) / (vmax - vmin)
+    rows = np.round((vmax - values) * scale)
+    return np.clip(rows, 0, height - 1).astype(np.intp)
+
+
+def rasterize(envelopes, width, height,
+              xmin=None, xmax=None, ymin=None, ymax=None):
+    """Draw layer envelopes as an RGB image
+
+    Axis limits not given are fit to the data.
+
+    :param envelopes: Layers to draw, bottom-most first
+    :type envelopes: Sequence[Envelope]
+
+    :param width: Image width, in pixels
+    :type width: int
+
+    :param height: Image height, in pixels
+    :type height: int
+
+    :return: Image of shape (height, width, 3)
+    :rtype: numpy.ndarray
+    """
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[...] = BACKGROUND
+
+    envelopes = [e for e in envelopes if len(e.lo)]
+    if not envelopes:
+        return image
+
+    if xmin is None:
+        xmin = min(e.xstart for e in envelopes)
+    if xmax is None:
+        xmax = max(e.xstart + (len(e.lo) - 1) * e.xdelta for e in envelopes)
+    if ymin is None:
+        ymin = min(np.nanmin(e.lo) for e in envelopes)
+    if ymax is None:
+        ymax = max(np.nanmax(e.hi) for e in envelopes)
+    if not (np.isfinite(ymin) and np.isfinite(ymax)):
+        return image
+    if ymax <= ymin:
+        ymin, ymax = ymin - 1, ymin + 1
+    xspan = (xmax - xmin) or 1.0
+
+    rows = np.arange(height)[:, np.newaxis]
+    for index, e in enumerate(envelopes):
+        x = e.xstart + np.arange(len(e.lo)) * e.xdelta
+        cols = np.round((x - xmin) * (width - 1) / xspan)
+        keep = (cols >= 0) & (cols < width) & \
+            np.isfinite(e.lo) & np.isfinite(e.hi)
+        if not keep.any():
+            continue
+        cols = cols[keep].astype(np.intp)
+
+        # Smallest row (top) and largest row (bottom) hit in each column
+        top = np.full(width, height, dtype=np.intp)
+        bottom = np.full(width, -1, dtype=np.intp)
+        np.minimum.at(top, cols, _to_rows(e.hi[keep], ymin, ymax, height))
+        np.maximum.at(bottom, cols, _to_rows(e.lo[keep], ymin, ymax, height))
+
+        # Sparse layers leave columns empty between samples; interpolate them
+        c0, c1 = cols.min(), cols.max() + 1
+        top, bottom = top[c0:c1], bottom[c0:c1]
+        hit = bottom >= 0
+        if not hit.all():
+            span = np.arange(c1 - c0)
+            top = np.round(np.interp(span, span[hit], top[hit]))
+            bottom = np.round(np.interp(span, span[hit], bottom[hit]))
+
+        # Extend each column to meet its neighbor, so the trace is connected
+        connected_top = top.copy()
+        connected_bottom = bottom.copy()
+        connected_top[1:] = np.minimum(top[1:], bottom[:-1])
+        connected_bottom[1:] = np.maximum(bottom[1:], top[:-1])
+
+        mask = (rows >= connected_top) & (rows <= connected_bottom)
+        image[:, c0:c1][mask] = LAYER_COLORS[index % len(LAYER_COLORS)]
+
+    return image
+
+
+def _png_chunk(tag, data):
+    crc = zlib.crc32(tag + data) & 0xffffffff
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+
+def encode_png(image, level=6):
+    """Encode an RGB image as PNG
+
+    :param image: Image of shape (height, width, 3)
+    :type image: numpy.ndarray
+
+    :param level: zlib compression level
+    :type level: int
+
+    :return: The PNG file contents
+    :rtype: bytes
+    """
+    height, width, _ = image.shape
+    # Every scanline is prefixed with filter type 0 (None)
+    raw = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, width * 3)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", header),
+        _png_chunk(b"IDAT", zlib.compress(raw.tobytes(), level)),
+        _png_chunk(b"IEND", b""),
+    ])
+
+
+def render_png(envelopes, width, height, **limits):
+    """Rasterize layer envelopes and encode the result as PNG
+
+    :param envelopes: Layers to draw, bottom-most first
+    :type envelopes: Sequence[Envelope]
+
+    :param limits: Optional ``xmin``, ``xmax``, ``ymin``, ``ymax``
+                   axis limits
+
+    :return: The PNG file contents
+    :rtype: bytes
+    """
+    return encode_png(rasterize(envelopes, width, height, **limits))
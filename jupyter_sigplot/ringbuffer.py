@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""Preallocated, fixed-capacity sample buffer for streaming plots."""
+from __future__ import absolute_import, print_function
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """Fixed-capacity buffer of the most recent samples of a stream
+
+    Storage is allocated once. Every sample is stored twice, ``capacity``
+    apart, so any run of up to ``capacity`` retained samples is contiguous
+    in memory and can be returned as a view rather than a copy; writes cost
+    twice as much in exchange.
+
+    Views returned by ``latest`` and ``window`` alias the buffer, so they
+    change once the samples they cover are overwritten; copy them if they
+    must outlive later writes.
+
+    :param capacity: Number of samples retained
+    :type capacity: int
+
+    :param dtype: Sample type
+    :type dtype: numpy.dtype
+
+    :Example:
+    >>> rb = RingBuffer(4)
+    >>> rb.write([1, 2, 3])
+    >>> rb.write([4, 5])
+    >>> rb.latest()
+    array([2., 3., 4., 5.], dtype=float32)
+    """
+
+    def __init__(self, capacity, dtype=np.float32):
+        if capacity < 1:
+            raise ValueError("capacity must be positive (got %r)" % capacity)
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype)
+        self._buffer = np.zeros(2 * self.capacity, dtype=self.dtype)
+        # Total number of samples ever written
+        self.count = 0
+
+    def __len__(self):
+        """Number of samples retained"""
+        return min(self.count, self.capacity)
+
+    def clear(self):
+        """Forget all samples, keeping the storage"""
+        self.count = 0
+
+    def write(self, samples):
+        """Append ``samples``; only the last ``capacity`` are retained
+
+        :param samples: Samples to append, converted to ``dtype``
+        :type samples: numpy.ndarray
+        """
+        samples = np.asarray(samples).ravel()
+        n = len(samples)
+        if n > self.capacity:
+            self.count += n - self.capacity
+            samples = samples[n - self.capacity:]
+            n = self.capacity
+
+        start = self.count % self.capacity
+        head = min(n, self.capacity - start)
+        for offset in (0, self.capacity):
+            self._buffer[offset + start:offset + start + head] = \
+                samples[:head]
+            self._buffer[offset:offset + n - head] = samples[head:]
+        self.count += n
+
+    def window(self, start, n):
+        """Return ``n`` samples from absolute index ``start`` without
+        copying them
+
+        :param start: Absolute index of the first sample in the stream
+        :type start: int
+
+        :param n: Number of samples
+        :type n: int
+
+        :return: A read-only view of the samples
+        :rtype: numpy.ndarray
+
+        :raises IndexError: if any of the samples is not retained
+        """
+        if n < 0 or start < self.count - len(self) or start + n > self.count:
+            raise IndexError(
+                "Samples %d to %d are not retained (have %d to %d)" %
+                (start, start + n, self.count - len(self), self.count)
+            )
+        offset = start % self.capacity
+        view = self._buffer[offset:offset + n]
+        view.flags.writeable = False
+        return view
+
+    def latest(self, n=None):
+        """Return the ``n`` most recent samples without copying them
+
+        :param n: Number of samples; defaults to all retained samples
+        :type n: Optional[int]
+
+        :return: A read-only view of the samples, oldest first
+        :rtype: numpy.ndarray
+        """
+        if n is None:
+            n = len(self)
+        return self.window(self.count - n, n)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""Live streams shared between processes of one machine.
+
+A ``StreamProducer`` writes a stream into a named shared-memory ring buffer,
+which any number of ``StreamReader``s, e.g., through ``Plot.subscribe`` in
+the kernels of several notebooks, read without copying it.
+
+The shared memory holds a header of ``HEADER_SIZE`` bytes, then
+``2 * capacity`` samples: as in ``ringbuffer.RingBuffer``, every sample is
+stored twice, ``capacity`` apart, so any window of recent samples is
+contiguous. The producer first reserves the samples it is about to write,
+then writes them, then publishes them; readers check after reading a window
+that no reservation has reached it meanwhile.
+
+Requires Python 3.8 or later, for ``multiprocessing.shared_memory``.
+"""
+from __future__ import absolute_import, print_function
+import struct
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+"""Bytes before the samples in the shared memory"""
+HEADER_SIZE = 64
+
+_MAGIC = b"SPRB"
+_VERSION = 1
+# magic, version, dtype, capacity, xdelta
+_LAYOUT = struct.Struct("<4sI8sQd")
+# Offset, in uint64s, of the published and the reserved sample counts
+_COUNTS = 4
+
+
+def _require_shared_memory():
+    if shared_memory is None:
+        raise RuntimeError(
+            "Shared-memory streams need multiprocessing.shared_memory "
+            "(Python 3.8 or later)"
+        )
+
+
+class StreamProducer(object):
+    """Writes a stream into shared memory named ``name``, for readers in
+    other processes; see ``Plot.subscribe``
+
+    :param name: Name of the shared memory, unique on the machine
+    :type name: str
+
+    :param capacity: Number of most recent samples readers can see
+    :type capacity: int
+
+    :param dtype: Sample type
+    :type dtype: numpy.dtype
+
+    :param xdelta: Abscissa spacing between samples
+    :type xdelta: float
+
+    :Example:
+    >>> with StreamProducer('rx0', capacity=1 << 20, xdelta=1e-6) as stream:
+    ...     for chunk in acquisition:
+    ...         stream.write(chunk)
+    """
+
+    def __init__(self, name, capacity=1 << 20, dtype=np.float32,
+                 xdelta=1.0):
+        _require_shared_memory()
+        if capacity < 1:
+            raise ValueError("capacity must be positive (got %r)" % capacity)
+        self.name = name
+        self.capacity = int(capacity)
+        self.dtype = np.dtype(dtype).newbyteorder("<")
+        self.xdelta = float(xdelta)
+        self._shm = shared_memory.SharedMemory(
+            name=name, create=True,
+            size=HEADER_SIZE + 2 * self.capacity * self.dtype.itemsize,
+        )
+        _LAYOUT.pack_into(
+            self._shm.buf, 0, _MAGIC, _VERSION,
+            self.dtype.str.encode("ascii"), self.capacity, self.xdelta,
+        )
+        self._counts = np.ndarray(
+            2, dtype="<u8", buffer=self._shm.buf, offset=_COUNTS * 8
+        )
+        self._counts[:] = 0
+        self._samples = np.ndarray(
+            2 * self.capacity, dtype=self.dtype, buffer=self._shm.buf,
+            offset=HEADER_SIZE,
+        )
+
+    @property
+    def count(self):
+        """Total number of samples written"""
+        return int(self._counts[0])
+
+    def write(self, samples):
+        """Append ``samples`` to the stream
+
+        :param samples: Samples to append, converted to the stream's dtype
+        :type samples: numpy.ndarray
+        """
+        samples = np.asarray(samples).ravel()
+        count = self.count
+        n = len(samples)
+        if n > self.capacity:
+            count += n - self.capacity
+            samples = samples[n - self.capacity:]
+            n = self.capacity
+
+        self._counts[1] = count + n
+        start = count % self.capacity
+        head = min(n, self.capacity - start)
+        for offset in (0, self.capacity):
+            self._samples[offset + start:offset + start + head] = \
+                samples[:head]
+            self._samples[offset:offset + n - head] = samples[head:]
+        self._counts[0] = count + n
+
+    def close(self, unlink=True):
+        """Detach from the shared memory and, if ``unlink``, remove it;
+        readers attached to it keep their mapping"""
+        if self._shm is None:
+            return
+        self._counts = self._samples = None
+        _close(self._shm)
+        if unlink:
+            self._shm.unlink()
+        self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+class StreamReader(object):
+    """Reads the stream a ``StreamProducer`` writes into shared memory
+    named ``name``, without copying it
+
+    :param name: Name of the shared memory
+    :type name: str
+
+    :raises ValueError: if the shared memory does not hold a stream
+    """
+
+    def __init__(self, name):
+        _require_shared_memory()
+        self.name = name
+        self._shm = _attach(name)
+        magic, version, dtype, capacity, xdelta = \
+            _LAYOUT.unpack_from(self._shm.buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._shm.close()
+            raise ValueError("%r is not a sigplot stream" % name)
+        self.capacity = capacity
+        self.dtype = np.dtype(dtype.rstrip(b"\0").decode("ascii"))
+        self.xdelta = xdelta
+        self._counts = np.ndarray(
+            2, dtype="<u8", buffer=self._shm.buf, offset=_COUNTS * 8
+        )
+        self._samples = np.ndarray(
+            2 * capacity, dtype=self.dtype, buffer=self._shm.buf,
+            offset=HEADER_SIZE,
+        )
+        self._samples.flags.writeable = False
+
+    @property
+    def count(self):
+        """Total number of samples the producer has written"""
+        return int(self._counts[0])
+
+    def latest(self, n=None):
+        """Return a view of the ``n`` most recent samples
+
+        The view aliases the shared memory, which the producer keeps
+        writing; check it with ``valid`` once it has been read.
+
+        :param n: Number of samples; defaults to all retained samples
+        :type n: Optional[int]
+
+        :return: A tuple (start, samples): the index of the first sample in
+                 the stream, and a read-only view of the samples
+        :rtype: Tuple[int, numpy.ndarray]
+        """
+        count = self.count
+        retained = min(count, self.capacity)
+        n = retained if n is None else min(n, retained)
+        start = count - n
+        offset = start % self.capacity
+        return start, self._samples[offset:offset + n]
+
+    def valid(self, start):
+        """Whether the samples from index ``start`` on, as returned by
+        ``latest``, were not overwritten while they were read"""
+        return int(self._counts[1]) - self.capacity <= start
+
+    def close(self):
+        """Detach from the shared memory"""
+        if self._shm is None:
+            return
+        self._counts = self._samples = None
+        _close(self._shm)
+        self._shm = None
+
+
+def _close(shm):
+    """Unmap ``shm``, unless views of it are still in use, in which case
+    it is unmapped once they are gone"""
+    try:
+        shm.close()
+    except BufferError:
+        pass
+
+
+def _attach(name):
+    """Attach to the existing shared memory ``name`` without having this
+    process remove it on exit, which only its producer should do"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13, attaching registers the memory with the
+        # resource tracker, which removes it once this process exits
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except (ImportError, AttributeError, KeyError):
+            pass
+        return shm
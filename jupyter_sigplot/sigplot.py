@@ -1,8 +1,21 @@
 #!/usr/bin/env python
 from __future__ import absolute_import, print_function
 import errno
+import hashlib
+import itertools
+import json
 import os
+import sys
+import threading
+import time
+import warnings
+import weakref
 
+try:
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+except ImportError:
+    # Python 2.x without the ``futures`` backport; files are read serially
+    ProcessPoolExecutor = None
 try:
     from pathlib import Path
 except ImportError:
@@ -13,8 +26,10 @@ try:
 except ImportError:
     # Python 2.x
     from urlparse import urlparse as urlsplit
+import base64
 import uuid
 
+from IPython import get_ipython
 from IPython.display import display, HTML
 import ipywidgets as widgets
 import numpy as np
@@ -23,38 +38,148 @@ import six
 from traitlets import Unicode, Bool, Dict, Float
 
 from ._version import __version__ as version_string
+from . import bluefile, dataserver, decimate, ingest, markers, render
+from .pipeline import Pipeline, PyramidView
+from .sharedstream import StreamReader
+from .pyramid import Pyramid
+from .tracing import Tracer, traced
+from .ringbuffer import RingBuffer
 
 
-class Plot(widgets.DOMWidget):
-    """Name and version information required by widgets"""
+class _PlotBase(object):
+    """Kernel side of a sigplot plot: prepares commands for the client and
+    keeps the state needed to render, budget and stream them.
 
-    _view_module_version = Unicode(version_string)
-    _view_name = Unicode("SigPlotView").tag(sync=True)
-    _model_name = Unicode("SigPlotModel").tag(sync=True)
-    _view_module = Unicode("jupyter_sigplot").tag(sync=True)
-    _model_module = Unicode("jupyter_sigplot").tag(sync=True)
-
-    """The command and arguments that will get sent"""
-    command_and_arguments = Dict().tag(sync=True)
-
-    """The plot_options dictionary in the JS
-    sigplot.Plot(dom_element, plot_options)"""
-    plot_options = Dict().tag(sync=True)
-
-    """Unique identifier for each SigPlot instance"""
-    uuid = Unicode().tag(sync=True)
-
-    """Progress information for the client"""
-    progress = Float().tag(sync=True)
-    done = Bool(False).tag(sync=True)
+    Subclasses display the plot and deliver its commands, by implementing
+    ``_send_message``; see ``Plot`` and ``grid.Panel``.
+    """
 
     """Sequence of callables used by ``_prepare_file_input``
     to resolve relative pathnames"""
     path_resolvers = []
 
-    def __init__(self, data_dir="", **kwargs):
-        super(Plot, self).__init__()
-
+    """Whether to rasterize the layers in the kernel after every command and
+    show the image in the placeholder output, e.g., for notebooks executed
+    headlessly by nbconvert or papermill, where no browser takes a
+    screenshot of the plot"""
+    static_render = False
+
+    """Whether to keep a min/max ``pyramid.Pyramid`` sidecar next to each
+    local file overlaid, so the kernel reads its extrema at the needed
+    resolution instead of rescanning the file; ``overlay_files`` then links
+    files into ``data_dir`` and keeps the sidecars there"""
+    pyramids = False
+
+    """``dataserver.DataServer`` through which the client fetches the files
+    prepared under ``data_dir``, instead of the notebook server; see
+    ``serve_data``"""
+    data_server = None
+
+    """Files larger than this many bytes are first shown as a coarse
+    overview, sent at once and refined while the file downloads, which the
+    client replaces with the file itself once it has loaded it; None to
+    always wait for the file"""
+    progressive_size = 16 * 2 ** 20
+
+    """Bytes the plot's layers may retain, in the kernel and in the client
+    together, or None for no limit; ``overlay_array`` layers that would
+    exceed it are degraded according to ``over_budget``, with a
+    ``MemoryBudgetWarning``"""
+    memory_budget = None
+
+    """Like ``memory_budget``, but for all plots together; set it on the
+    class"""
+    total_memory_budget = None
+
+    """How ``overlay_array`` degrades a layer that would exceed a memory
+    budget: 'decimate' sends min/max pairs of as many blocks as fit;
+    'quantize' sends 16-bit samples, which the client expands again;
+    'reference' sends the array as a file under ``data_dir``, as with
+    ``by_reference``. Layers that still don't fit are decimated, or, if
+    they have a ``subsize``, sent by reference."""
+    over_budget = "decimate"
+
+    """``tracing.Tracer`` recording the timeline of the plot's commands, or
+    None; see ``start_tracing``"""
+    tracer = None
+
+    """``trigger.Trigger`` applied to samples streamed with ``push``; if
+    None, every chunk pushed is shown"""
+    trigger = None
+
+    """Number of triggered frames kept on screen at once"""
+    persistence = 1
+
+    """Number of most recent samples shown by ``push`` without a trigger"""
+    stream_window = 8192
+
+    """Number of (min, max) bins that layers overlaid from a
+    ``pipeline.Pipeline`` are evaluated to; about the width of the plot in
+    pixels, or more"""
+    pipeline_bins = 2048
+
+    """How ``push`` updates the plot without a trigger: 'window' resends the
+    whole current window, 'delta' only sends the new samples, which sigplot
+    scrolls into its own copy of the window"""
+    stream_updates = "window"
+
+    def _init_plot(self, data_dir, kwargs):
+        """Set up the kernel-side state of the plot
+
+        :return: The ``kwargs`` left for sigplot.js's ``sigplot.Plot``
+        :rtype: dict
+        """
+        kwargs = self._configure(data_dir, kwargs)
+
+        # Kernel-side record of what has been sent, so the plot can be
+        # rendered without a browser
+        self._layers = []
+        self._layer_ids = itertools.count()
+        self._settings = dict(kwargs)
+
+        # Layers updated in place by ``push``, by slot, and the state of the
+        # stream feeding them
+        self._live_layers = {}
+        self._stream_xdelta = 1.0
+        self._frames_shown = 0
+
+        # Overview layers of files still being downloaded, and when they
+        # were last refreshed, by local name
+        self._overviews = {}
+        self._overview_times = {}
+
+        # Shared-memory streams shown, by name; see ``subscribe``. Their
+        # threads update the plot, so changes to its layers and messages
+        # are made holding ``_lock``
+        self._subscriptions = {}
+        self._lock = threading.RLock()
+
+        # Bytes of the binary arguments held by ``command_and_arguments``
+        self._message_bytes = 0
+        _plots.add(self)
+
+        # Id of the command being traced, while one is
+        self._trace_id = None
+
+        # Key of the plot in the ``get_or_create`` registry, if any; layers
+        # of the previous run of its cell not yet reused, while it runs
+        self._key = None
+        self._previous = None
+        self._markers_sent = False
+
+        # Markers on the plot, as (meta, buffer) batches of ``add_markers``
+        self._markers = []
+
+        # Set once the plot is closed; downloads in progress then stop
+        self._closed = threading.Event()
+        return kwargs
+
+    def _configure(self, data_dir, kwargs):
+        """Apply the options meant for the kernel side of the plot
+
+        :return: The ``kwargs`` left for sigplot.js's ``sigplot.Plot``
+        :rtype: dict
+        """
         # Where to look for data, and where to cache/symlink remote resources
         # that the server or client cannot access directly. Note that changing
         # the kernel's current directory affects data_dir if it is set as a
@@ -70,16 +195,12 @@ class Plot(widgets.DOMWidget):
             # resolvers per Python semantics.
             self.path_resolvers = kwargs.pop("path_resolvers")
 
-        # Whatever's left is meant for sigplot.js's ``sigplot.Plot``
-        self.plot_options = kwargs
-        self.uuid = str(uuid.uuid4())
+        if "static_render" in kwargs:
+            self.static_render = kwargs.pop("static_render")
 
-        # Display the interactive widget
-        display(self)
-
-        # Dummy container where the rendered Plot png
-        # will go on export as HTML or notebook close
-        display(HTML("<div id=\"%s\"></div>" % self.uuid))
+        if "pyramids" in kwargs:
+            self.pyramids = kwargs.pop("pyramids")
+        return kwargs
 
     def __getattr__(self, attr):
         """Enables a "thin-wrapper" around sigplot.Plot (JS)
@@ -119,7 +240,9 @@ class Plot(widgets.DOMWidget):
         """Available commands from Sigplot.js that Jupyter-SigPlot can call"""
         return ["change_settings", "overlay_href", "overlay_array"]
 
-    def send_command(self, command, arguments, **_):
+    @traced(lambda command, *_, **__: command.lower())
+    def send_command(self, command, arguments, by_reference=False,
+                     traces=None, **_):
         """Sends the Notebook client (JS) the SigPlot.js
         command and relevant arguments.
 
@@ -128,56 +251,1136 @@ class Plot(widgets.DOMWidget):
         :type command: str
 
         :param arguments: The tuple of the positional arguments and
-                          keyword arguments for SigPlot to run
+                          keyword arguments for SigPlot to run. The array
+                          of ``overlay_array`` may be a
+                          ``pipeline.Pipeline``, evaluated over the range
+                          the plot shows, at ``pipeline_bins`` bins, as it
+                          is zoomed and its operators change.
         :type arguments: list(Any)
 
+        :param by_reference: For ``overlay_array``, write the array to a
+                             BLUE file under ``data_dir`` and overlay that
+                             file instead of sending the array inline.
+                             Identical arrays are only written once.
+        :type by_reference: bool
+
+        :param traces: For ``overlay_array`` of a 2-D array, overlay each
+                       row as a trace of its own, all sent in one message;
+                       True, or a list with a dict of layer options (e.g.,
+                       ``name``, ``color``) per row, which take precedence
+                       over the layer options given in ``arguments``. This
+                       is the default for 2-D arrays sent inline without a
+                       ``subsize``. By reference, each row is written to a
+                       file of its own.
+        :type traces: Optional[Union[bool, list(dict)]]
+
         :Example:
         >>> from jupyter_sigplot.sigplot import Plot
         >>> plt = Plot()
         >>> plt.send_command('overlay_href', ['foo.tmp'])
+        >>> plt.send_command('overlay_array', [[1, 2, 3]], by_reference=True)
+        >>> plt.send_command('overlay_array', [[[1, 2], [3, 4]]],
+        ...                  traces=[{'name': 'I'}, {'name': 'Q'}])
         """
+        self._check_open()
         # lower the command, just so we're normalized
         command = command.lower()
 
+        key = None
+        if self._key is not None and command in ("overlay_array",
+                                                 "overlay_href"):
+            key = _command_key(command, arguments, by_reference, traces)
+            if self._reuse_layers(key):
+                return
+        first = len(self._layers)
+
         # we need to convert the array argument to numpy arrays
-        if command == "overlay_array":
-            array = np.array(arguments[0])
-            # make sure np.dtype is something sigplot can plot
-            if not np.issubdtype(array.dtype, np.number):
-                raise TypeError(
-                    "Array passed to overlay_array must be numeric type"
-                )
-            arguments[0] = memoryview(array.astype(np.float32))
+        if command == "overlay_array" and \
+                isinstance(arguments[0], Pipeline):
+            self._overlay_pipeline(arguments[0], _overrides_from(arguments),
+                                   _layer_options_from(arguments))
+        elif command == "overlay_array" and (traces or (
+                np.ndim(arguments[0]) == 2 and not by_reference and
+                not _overrides_from(arguments).get("subsize"))):
+            self._overlay_traces(arguments, traces, by_reference)
+        elif command == "overlay_array":
+            self._overlay_array(arguments, by_reference)
+        elif command == "overlay_href":
+            self._overlay_hrefs(arguments)
+        else:
+            if command == "change_settings" and arguments and \
+                    isinstance(arguments[0], dict):
+                self._settings.update(arguments[0])
             # cause the sync to happen
             self.sync_command_and_arguments(
                 {"command": command, "arguments": arguments}
             )
-        elif command == "overlay_href":
-            # we still need to download the hrefs locally
-            # to avoid CORS
-            href = arguments[0]
-            href_list = _prepare_href_input(
-                href, self.data_dir, self.progress, self.path_resolvers
+
+        if key is not None:
+            for layer in self._layers[first:]:
+                # Layers made by one command are reused together
+                layer.key = (key, self._layers[first].id)
+
+        if self.static_render:
+            self.render_static()
+
+    def _reuse_layers(self, key):
+        """Keep the layers that the previous run of the plot's cell made
+        with the command of digest ``key``, instead of sending it again
+
+        :return: Whether there were such layers
+        :rtype: bool
+        """
+        # Layers of commands without a digest, e.g., ``push`` and
+        # ``overlay_xy``, are never reused
+        match = next(
+            (layer for layer in self._previous
+             if layer.key is not None and layer.key[0] == key), None
+        ) if self._previous else None
+        if match is None:
+            return False
+        self._previous = [
+            layer for layer in self._previous if layer.key != match.key
+        ]
+        return True
+
+    @property
+    def closed(self):
+        """Whether the plot was closed"""
+        return self._closed.is_set()
+
+    def _check_open(self):
+        if self.closed:
+            raise ValueError("Plot is closed")
+
+    def _release(self):
+        """Stop the plot's downloads and streams and drop what the kernel
+        retains for it"""
+        self._closed.set()
+        for subscription in list(self._subscriptions.values()):
+            subscription.stop()
+        self._previous = []
+        self._end_run()
+        for layer in self._layers:
+            layer.detach()
+        self._layers = []
+        self._live_layers.clear()
+        self._overviews.clear()
+        self._overview_times.clear()
+        self._markers = []
+        self._message_bytes = 0
+        _plots.discard(self)
+        if self._key is not None and _keyed_plots.get(self._key) is self:
+            del _keyed_plots[self._key]
+
+    def _end_run(self, *_):
+        """Remove the layers that the previous run of the plot's cell made
+        and the latest run did not make again"""
+        previous, self._previous = self._previous, None
+        if previous is None:
+            return
+        ip = get_ipython()
+        if ip is not None:
+            try:
+                ip.events.unregister("post_run_cell", self._end_run)
+            except ValueError:
+                pass
+        for layer in previous:
+            self._remove_layer(layer)
+        if previous and self.static_render:
+            self.render_static()
+
+    def _overlay_array(self, arguments, by_reference):
+        """Overlay the array ``arguments[0]`` as a layer, within the memory
+        budgets; see ``send_command``"""
+        array = _numeric_array(arguments[0])
+        overrides = _overrides_from(arguments)
+        samples = array if by_reference else array.astype(np.float32)
+        envelope = render.layer_envelope(
+            samples,
+            overrides.get("xstart", 0.0),
+            overrides.get("xdelta", 1.0),
+            overrides.get("subsize", 0),
+        )
+        delivery = self._plan_delivery(
+            array, overrides, "reference" if by_reference else "inline",
+            _envelope_bytes(envelope),
+        )
+        if delivery != "reference":
+            array = samples.astype(np.float32, copy=False)
+        layer = self._add_layer("overlay_array", envelope=envelope)
+        layer.options = _layer_options_from(arguments)
+        if delivery == "reference":
+            # sigplot.Plot.overlay_href(href, onload, layerOptions);
+            # the overrides are stored in the file's header
+            href = _prepare_array_input(array, self.data_dir, overrides)
+            layer.href = href
+            layer.client_bytes = array.nbytes
+            self._sync_layer(
+                layer, "overlay_href",
+                [self._client_href(href), None] + list(arguments[2:3]),
             )
-            for href in href_list:
-                arguments[0] = href
-
-                # cause the sync to happen
-                # TODO: Figure out why the list comp works
-                #       but passing `arguments` doesn't;
-                #       perhaps it's an addressing issue?
-                self.sync_command_and_arguments(
-                    {
-                        "command": command,
-                        "arguments": [arg for arg in arguments]
-                    }
-                )
+        elif delivery == "quantize":
+            quantized, scale, offset = _quantize(array)
+            layer.sent = True
+            layer.client_bytes = array.nbytes
+            self.sync_command_and_arguments({
+                "command": "overlay_array",
+                "arguments": [memoryview(quantized)] + arguments[1:],
+                "quantized": {"scale": scale, "offset": offset},
+                "layer": layer.id,
+            })
         else:
+            if delivery == "decimate":
+                available = self._memory_available()
+                array, decimated = _decimate_to(array, overrides, available)
+                _check_decimated(2 * array.nbytes, available)
+                arguments[1:2] = [dict(overrides, **decimated)]
+            arguments[0] = memoryview(array)
             # cause the sync to happen
-            self.sync_command_and_arguments(
-                {"command": command, "arguments": arguments}
+            self._sync_layer(layer, "overlay_array", arguments)
+
+    def _overlay_hrefs(self, arguments):
+        """Overlay each of the files or URLs ``arguments[0]`` as a layer;
+        see ``send_command``"""
+        command = "overlay_href"
+        # we still need to download the hrefs locally
+        # to avoid CORS
+        href = arguments[0]
+        href_list = _prepare_href_input(
+            href, self.data_dir, self._on_download, self.path_resolvers
+        )
+        for href in href_list:
+            arguments[0] = self._client_href(href)
+            layer = self._overviews.pop(href, None)
+            self._overview_times.pop(href, None)
+            if layer is None and self._is_large(_file_size(href)):
+                layer = self._show_overview(href, complete=True)
+            if layer is not None:
+                # The client swaps the overview for the file once it
+                # has loaded it
+                layer.command, layer.href, layer.samples = \
+                    command, href, None
+                layer.pyramid = self.pyramids
+                layer.options = _layer_options_from(arguments)
+                layer.client_bytes = _file_size(href)
+                self._sync_layer(layer, command, list(arguments))
+                continue
+
+            layer = self._add_layer(command, href=href)
+            layer.pyramid = self.pyramids
+            layer.options = _layer_options_from(arguments)
+            layer.client_bytes = _file_size(href)
+
+            # cause the sync to happen
+            # TODO: Figure out why the list comp works
+            #       but passing `arguments` doesn't;
+            #       perhaps it's an addressing issue?
+            self._sync_layer(
+                layer, command, [arg for arg in arguments]
             )
 
+    def _overlay_traces(self, arguments, traces, by_reference):
+        """Overlay each row of the 2-D array ``arguments[0]`` as a layer;
+        see ``send_command``"""
+        array = _numeric_array(arguments[0])
+        if array.ndim != 2:
+            raise ValueError(
+                "traces need a 2-D array (got %d dimensions)" % array.ndim
+            )
+        count = array.shape[0]
+        if traces is None or traces is True:
+            traces = [{} for _ in range(count)]
+        elif len(traces) != count:
+            raise ValueError(
+                "Got %d trace options for %d traces" % (len(traces), count)
+            )
+        # Each row is a trace, not a raster of rows of ``subsize`` samples
+        overrides = dict(_overrides_from(arguments))
+        overrides.pop("subsize", None)
+        layer_options = _layer_options_from(arguments)
+
+        samples = array if by_reference else array.astype(np.float32)
+        envelopes = [
+            render.layer_envelope(
+                row,
+                overrides.get("xstart", 0.0),
+                overrides.get("xdelta", 1.0),
+            )
+            for row in samples
+        ]
+        delivery = self._plan_delivery(
+            array, overrides, "reference" if by_reference else "inline",
+            sum(_envelope_bytes(envelope) for envelope in envelopes),
+        )
+        if delivery != "reference":
+            array = samples.astype(np.float32, copy=False)
+        layers = [
+            self._add_layer("overlay_array", envelope=envelope)
+            for envelope in envelopes
+        ]
+        for layer, options in zip(layers, traces):
+            layer.options = dict(layer_options, **options)
+
+        if delivery == "reference":
+            for layer, row in zip(layers, array):
+                layer.href = _prepare_array_input(
+                    row, self.data_dir, overrides
+                )
+                layer.client_bytes = row.nbytes
+                self._sync_layer(layer, "overlay_href", [
+                    self._client_href(layer.href), None, layer.options,
+                ])
+            return
+
+        message = {"command": "overlay_array", "traces": list(traces)}
+        if delivery == "decimate":
+            available = self._memory_available()
+            reduced = [
+                _decimate_to(row, overrides, (available or 0) // count)
+                for row in array
+            ]
+            array = np.vstack([row for row, _ in reduced])
+            _check_decimated(2 * array.nbytes, available)
+            overrides = dict(overrides, **reduced[0][1])
+        # One contiguous buffer, which the client splits by trace
+        payload = np.ascontiguousarray(array).ravel()
+        if delivery == "quantize":
+            payload, scale, offset = _quantize(payload)
+            message["quantized"] = {"scale": scale, "offset": offset}
+        message["arguments"] = [memoryview(payload), overrides, layer_options]
+        message["layers"] = [layer.id for layer in layers]
+        for layer in layers:
+            layer.sent = True
+            layer.client_bytes = array[0].nbytes
+        self.sync_command_and_arguments(message)
+
+    def _overlay_pipeline(self, pipeline, overrides, layer_options):
+        """Overlay ``pipeline`` as a layer evaluated over the range the plot
+        shows; see ``pipeline.Pipeline``"""
+        layer = self._add_layer("overlay_array")
+        layer.pipeline = pipeline
+        layer.overrides = dict(overrides)
+        layer.options = dict(layer_options)
+        layer.on_change = lambda: self._evaluate_pipeline(layer)
+        pipeline.on_change(layer.on_change)
+        self._evaluate_pipeline(layer)
+
+    def _evaluate_pipeline(self, layer):
+        """Send the ``pipeline`` of ``layer`` evaluated over the range the
+        plot shows, at ``pipeline_bins`` bins"""
+        if self.closed or layer not in self._layers:
+            return
+        xmin, xmax = self._shown_range()
+        samples, overrides = layer.pipeline.evaluate(
+            xmin, xmax, self.pipeline_bins
+        )
+        overrides = dict(layer.overrides, **overrides)
+        layer.envelope = render.layer_envelope(
+            samples, overrides["xstart"], overrides["xdelta"]
+        )
+        if layer.sent:
+            self._sync_layer(layer, "reload", [memoryview(samples), overrides])
+        else:
+            self._sync_layer(layer, "overlay_array",
+                             [memoryview(samples), overrides, layer.options])
+
+        if self.static_render:
+            self.render_static()
+
+    def _evaluate_pipelines(self):
+        """Evaluate pipeline layers again over the range now shown"""
+        for layer in list(self._layers):
+            if layer.pipeline is not None:
+                self._evaluate_pipeline(layer)
+
+    def _shown_range(self):
+        """Range of abscissas (xmin, xmax) the plot shows; None for either
+        if the plot shows all of its layers"""
+        return None, None
+
+    def start_tracing(self, tracer=None):
+        """Record the timeline of the plot's commands from now on, in the
+        kernel and in its views: preparing each command, sending it, and
+        decoding, rendering and snapshotting it in the browser.
+
+        :param tracer: Tracer to record into, e.g., one shared with other
+                       plots; by default, a new one
+        :type tracer: Optional[tracing.Tracer]
+
+        :return: The tracer, whose ``export`` writes the timeline as a
+                 Chrome trace-event file
+        :rtype: tracing.Tracer
+        """
+        self.tracer = tracer if tracer is not None else Tracer()
+        return self.tracer
+
+    def stop_tracing(self):
+        """Stop recording the timeline
+
+        :return: The tracer that recorded it, if any
+        :rtype: Optional[tracing.Tracer]
+        """
+        tracer, self.tracer = self.tracer, None
+        return tracer
+
+    def serve_data(self, host="127.0.0.1", port=0):
+        """Serve the files prepared under ``data_dir`` from the kernel, and
+        have the client fetch files overlaid from now on from there.
+
+        Unlike the notebook server, the kernel's server works when the
+        kernel runs on another host, and supports byte ranges and
+        conditional requests. Plots sharing a ``data_dir`` share a server.
+
+        :param host: Interface to listen on; use '0.0.0.0' when the browser
+                     is on another host than the kernel
+        :type host: str
+
+        :param port: Port to listen on; 0 picks a free port
+        :type port: int
+
+        :return: The server
+        :rtype: dataserver.DataServer
+        """
+        self.data_server = dataserver.serve(self.data_dir, host, port)
+        return self.data_server
+
+    def _client_href(self, href):
+        """Return the href through which the client fetches the local file
+        ``href``"""
+        if self.data_server is None:
+            return href
+        try:
+            return self.data_server.url_for(href)
+        except ValueError:
+            # Not under data_dir; left to the notebook server
+            return href
+
+    def _is_large(self, size):
+        return self.progressive_size is not None and \
+            size > self.progressive_size
+
+    def _on_download(self, local_fname, wrote, total):
+        """Progress callback of ``_prepare_http_input``"""
+        if self.closed:
+            raise DownloadCancelled(
+                "Download of %s cancelled; the plot was closed" % local_fname
+            )
+        if total:
+            self.progress = min(1.0, wrote / float(total))
+        if wrote != total and self._is_large(max(wrote, total)):
+            now = time.time()
+            last = self._overview_times.get(local_fname)
+            if last is None or now - last >= _OVERVIEW_INTERVAL:
+                self._overview_times[local_fname] = now
+                self._show_overview(local_fname)
+
+    def _show_overview(self, path, complete=False):
+        """Send, or refresh, a coarse overview of the BLUE file at ``path``,
+        of which only a prefix may have been written so far.
+
+        The overview is read from the file's pyramid if ``pyramids`` is
+        set and the file is ``complete``, and otherwise from evenly spaced
+        strips of samples, which takes the same time whatever the file's
+        size.
+
+        :return: The overview layer, or None if ``path`` cannot be
+                 overviewed yet
+        :rtype: Optional[_Layer]
+        """
+        try:
+            header = bluefile.read_header(path)
+            if header["subsize"]:
+                return None
+            if complete and self.pyramids:
+                lo, hi, first, per_bin = \
+                    Pyramid.open(path).envelope(bins=render.ENVELOPE_SIZE)
+            else:
+                data = bluefile.read_data(path, header)
+                if data.ndim > 1:
+                    data = data[:, 0]
+                if not len(data):
+                    return None
+                lo, hi = decimate.strips(data, render.ENVELOPE_SIZE)
+                if np.iscomplexobj(lo):
+                    lo, hi = np.abs(lo), np.abs(hi)
+                first, per_bin = 0, len(data) / float(len(lo))
+        except (IOError, OSError, ValueError):
+            return None
+        samples, overrides = ingest.interleave(lo, hi, header, first, per_bin)
+
+        layer = self._overviews.get(path)
+        if layer is None:
+            layer = self._overviews[path] = self._add_layer(
+                "overlay_array", samples=samples
+            )
+            command = "overlay_array"
+        else:
+            layer.samples = samples
+            command = "reload"
+        layer.overrides = overrides
+        self._sync_layer(layer, command, [memoryview(samples), overrides])
+        if complete:
+            del self._overviews[path]
+        return layer
+
+    @traced()
+    def push(self, samples, xdelta=None):
+        """Stream the next chunk of samples to the plot.
+
+        Without a ``trigger``, a live layer shows the latest
+        ``stream_window`` samples; see ``stream_updates`` for how it is
+        updated. With one, only the frames around trigger events are sent,
+        each replacing the oldest of ``persistence`` live layers, with the
+        trigger at x = 0. When several frames complete within one chunk,
+        only those that would remain on screen are sent.
+
+        Samples are kept in buffers allocated when a live layer is created,
+        and sent from there, so steady streaming does not allocate per
+        update. Complex samples are shown as magnitude.
+
+        :param samples: Consecutive samples of the stream
+        :type samples: numpy.ndarray
+
+        :param xdelta: Abscissa spacing between samples; once given, it
+                       applies to later chunks too
+        :type xdelta: Optional[float]
+
+        :Example:
+        >>> from jupyter_sigplot.trigger import Trigger
+        >>> plot = Plot()
+        >>> plot.trigger = Trigger(level=0.5, pre=100, post=900)
+        >>> for chunk in stream:
+        ...     plot.push(chunk, xdelta=1e-6)
+        """
+        self._check_open()
+        samples = np.asarray(samples)
+        if not np.issubdtype(samples.dtype, np.number):
+            raise TypeError("Samples passed to push must be numeric type")
+        if np.iscomplexobj(samples):
+            samples = np.abs(samples)
+        if xdelta is not None:
+            self._stream_xdelta = xdelta
+
+        if self.trigger is None:
+            self._push_window(samples.ravel())
+        else:
+            self._push_frames(samples)
+
+        if self.static_render:
+            self.render_static()
+
+    def _push_window(self, samples):
+        """Append ``samples`` to the untriggered live layer"""
+        overrides = {"xstart": 0.0, "xdelta": self._stream_xdelta}
+        delta = self.stream_updates == "delta"
+        layer = self._live_layers.get("window")
+
+        if layer is None:
+            layer = self._live_layers["window"] = self._add_layer(
+                "overlay_pipe" if delta else "overlay_array",
+                samples=RingBuffer(self.stream_window),
+            )
+            if delta:
+                # sigplot keeps its own copy of the window, scrolling new
+                # samples in as they are pushed
+                self._sync_layer(layer, "overlay_pipe", _pipe_arguments(
+                    overrides, self.stream_window
+                ))
+        layer.overrides = overrides
+
+        ring = layer.samples
+        ring.write(samples)
+        if layer.command == "overlay_pipe":
+            self._sync_layer(layer, "push", [
+                memoryview(ring.latest(min(len(samples), len(ring))))
+            ])
+        else:
+            self._sync_layer(
+                layer,
+                "reload" if layer.sent else "overlay_array",
+                [memoryview(ring.latest()), dict(overrides)],
+            )
+
+    def _push_frames(self, samples):
+        """Feed ``samples`` to the ``trigger`` and show completed frames"""
+        xdelta = self._stream_xdelta
+        overrides = {"xstart": -self.trigger.pre * xdelta, "xdelta": xdelta}
+        persistence = max(self.persistence, 1)
+
+        for _, frame in self.trigger.process(samples)[-persistence:]:
+            slot = self._frames_shown % persistence
+            self._frames_shown += 1
+
+            layer = self._live_layers.get(slot)
+            if layer is None:
+                layer = self._live_layers[slot] = self._add_layer(
+                    "overlay_array"
+                )
+            if layer.samples is None or layer.samples.shape != frame.shape:
+                layer.samples = np.empty(frame.shape, dtype=np.float32)
+            np.copyto(layer.samples, frame, casting="unsafe")
+            layer.overrides = overrides
+
+            self._sync_layer(
+                layer,
+                "reload" if layer.sent else "overlay_array",
+                [memoryview(layer.samples), dict(overrides)],
+            )
+
+    def subscribe(self, name, fps=10.0, window=None):
+        """Show the live stream that a ``sharedstream.StreamProducer``
+        writes into the shared memory ``name``, e.g., in an acquisition
+        process; any number of plots, in any kernel of the machine, can
+        show the same stream.
+
+        The stream is read in place, without copying it. From a
+        background thread, at most ``fps`` times a second and only when
+        there are new samples, its latest ``window`` samples are min/max
+        decimated to ``pipeline_bins`` bins and sent to the plot as a live
+        layer.
+
+        :param name: Name of the shared memory
+        :type name: str
+
+        :param fps: Largest number of updates per second
+        :type fps: float
+
+        :param window: Number of most recent samples shown; defaults to
+                       ``stream_window``
+        :type window: Optional[int]
+
+        :return: The subscription; ``stop()`` it to stop updating the
+                 plot and remove the stream's layer, which closing the plot,
+                 or subscribing it to ``name`` again, also does
+        :rtype: Subscription
+
+        :Example:
+        >>> plot = Plot()
+        >>> plot.subscribe('rx0', fps=20, window=1 << 20)
+        """
+        self._check_open()
+        previous = self._subscriptions.get(name)
+        if previous is not None:
+            # Removes its layer too
+            previous.stop()
+        subscription = self._subscriptions[name] = Subscription(
+            self, StreamReader(name), fps, window or self.stream_window
+        )
+        subscription.start()
+        return subscription
+
+    def _sync_layer(self, layer, command, arguments):
+        """Send a command that creates or updates ``layer``"""
+        message = {
+            "command": command,
+            "arguments": arguments,
+            "layer": layer.id,
+        }
+        if command in ("push", "reload"):
+            # Updates may equal the last message, or alias the buffers it
+            # was sent from; numbering them has the widget send every one
+            layer.updates += 1
+            message["update"] = layer.updates
+        layer.sent = True
+        if command in ("overlay_array", "reload"):
+            layer.client_bytes = _payload_bytes(arguments)
+        elif command == "overlay_pipe":
+            layer.client_bytes = 4 * arguments[1].get("framesize", 0)
+        # ``layer`` lets the client find the layer again for later updates
+        self.sync_command_and_arguments(message)
+
+    def _scene(self):
+        """Commands that recreate the plot as it is now in a view that has
+        none of its history: its settings, its layers and its markers.
+
+        Layers backed by a file are overlaid by reference and live layers
+        from their current samples; other layers are overlaid from their
+        envelopes, since the kernel does not retain their data. Layers keep
+        their ids, so later updates reach them.
+
+        :rtype: list(dict)
+        """
+        scene = []
+        if self._settings:
+            scene.append({
+                "command": "change_settings",
+                "arguments": [dict(self._settings)],
+            })
+        for layer in self._layers:
+            if layer.command == "overlay_xy":
+                envelope = layer.get_envelope()
+                mid = envelope.xstart + \
+                    (np.arange(len(envelope.lo)) + 0.5) * envelope.xdelta
+                full = np.isfinite(envelope.lo)
+                scene.append(_xy_message(
+                    layer, np.repeat(mid[full], 2),
+                    np.column_stack(
+                        (envelope.lo[full], envelope.hi[full])
+                    ).ravel(),
+                ))
+            elif layer.href is not None and layer.samples is None:
+                scene.append({
+                    "command": "overlay_href",
+                    "arguments": [self._client_href(layer.href), None,
+                                  layer.options],
+                    "layer": layer.id,
+                })
+            elif isinstance(layer.samples, RingBuffer):
+                samples = layer.samples.latest()
+                if layer.command == "overlay_pipe":
+                    scene.append({
+                        "command": "overlay_pipe",
+                        "arguments": _pipe_arguments(
+                            layer.overrides, layer.samples.capacity
+                        ),
+                        "layer": layer.id,
+                    })
+                    scene.append({
+                        "command": "push",
+                        "arguments": [memoryview(samples)],
+                        "layer": layer.id,
+                    })
+                    continue
+                scene.append(_scene_array(
+                    layer, samples, layer.overrides
+                ))
+            elif layer.samples is not None:
+                scene.append(_scene_array(
+                    layer, layer.samples, layer.overrides
+                ))
+            else:
+                envelope = layer.get_envelope()
+                if envelope is not None:
+                    scene.append(_scene_array(
+                        layer, *_envelope_samples(envelope)
+                    ))
+        for meta, buffer in self._markers:
+            scene.append({
+                "command": "add_markers",
+                "arguments": [meta, memoryview(buffer)],
+            })
+        return scene
+
+    def _send_scene(self):
+        """Send the ``_scene`` of the plot, in one message, to the views
+        that asked for it"""
+        self.sync_command_and_arguments({
+            "command": "scene",
+            "arguments": [self._scene()],
+        })
+
+    @property
+    def memory_used(self):
+        """Bytes retained for the plot's layers, in the kernel and in the
+        client, as counted against ``memory_budget``"""
+        return self._message_bytes + sum(
+            layer.client_bytes + layer.kernel_bytes for layer in self._layers
+        )
+
+    def _memory_available(self):
+        """Bytes a new layer may use within the budgets, or None if there
+        is no budget; the message currently held is about to be replaced,
+        so it is counted as available. Layers already recorded, and their
+        envelopes, count as used."""
+        available = []
+        if self.memory_budget is not None:
+            available.append(
+                self.memory_budget - self.memory_used + self._message_bytes
+            )
+        if self.total_memory_budget is not None:
+            used = sum(plot.memory_used for plot in list(_plots))
+            available.append(
+                self.total_memory_budget - used + self._message_bytes
+            )
+        return min(available) if available else None
+
+    def _plan_delivery(self, array, overrides, delivery, reserved=0):
+        """Return how to deliver ``array``: ``delivery`` if it fits the
+        memory budgets, besides the ``reserved`` bytes its layers take
+        however it is delivered (their envelopes), or else a degraded
+        delivery, with a warning"""
+        available = self._memory_available()
+        if available is not None:
+            available -= reserved
+        if available is None or \
+                _delivery_bytes(array, delivery) <= available:
+            return delivery
+
+        degraded = self.over_budget
+        if degraded not in _DELIVERIES:
+            raise ValueError(
+                "over_budget must be one of %s (got %r)" %
+                (", ".join(_DELIVERIES), degraded)
+            )
+        if degraded == "inline" or \
+                _delivery_bytes(array, degraded) > available:
+            degraded = "decimate"
+        if degraded == "decimate" and overrides.get("subsize"):
+            # Decimating would break up the rows
+            degraded = "reference"
+        _warn_caller(
+            "A layer of %d bytes would exceed the memory budget (%d bytes "
+            "available); sending it with %s" % (
+                _delivery_bytes(array, delivery), max(available, 0),
+                {"decimate": "min/max decimation",
+                 "quantize": "16-bit quantization",
+                 "reference": "a file under data_dir"}[degraded],
+            ),
+            MemoryBudgetWarning,
+        )
+        return degraded
+
+    def _add_layer(self, command, envelope=None, href=None, samples=None):
+        """Record a new layer and return its ``_Layer``"""
+        with self._lock:
+            layer = _Layer(next(self._layer_ids), command, envelope, href,
+                           samples)
+            self._layers.append(layer)
+        return layer
+
+    def _remove_layer(self, layer):
+        """Forget ``layer`` and remove it from the client"""
+        with self._lock:
+            self._layers.remove(layer)
+            layer.detach()
+            self.sync_command_and_arguments({
+                "command": "remove_layer",
+                "arguments": [],
+                "layer": layer.id,
+            })
+
+    def add_markers(self, x, y, labels=None, styles=None, group="default",
+                    replace=False):
+        """Place many markers at once.
+
+        All markers are sent to the client in a single columnar binary
+        message and drawn with a single redraw, however many there are.
+
+        :param x: Marker abscissas
+        :type x: numpy.ndarray
+
+        :param y: Marker ordinates, the same length as ``x``
+        :type y: numpy.ndarray
+
+        :param labels: One label per marker, or a single label for all;
+                       markers without labels are drawn as dots
+        :type labels: Optional[Union[str, Sequence[str]]]
+
+        :param styles: sigplot annotation options (e.g., ``color``,
+                       ``font``, ``popup``), one dict per marker or a single
+                       dict for all
+        :type styles: Optional[Union[dict, Sequence[dict]]]
+
+        :param group: Name of the group the markers belong to, for
+                      ``clear_markers`` and ``replace``
+        :type group: str
+
+        :param replace: Whether to remove the group's existing markers first
+        :type replace: bool
+
+        :Example:
+        >>> plot = Plot()
+        >>> plot.add_markers(peaks_x, peaks_y, labels='peak',
+        ...                  styles={'color': 'red'}, group='peaks')
+        """
+        self._check_open()
+        meta, buffer = markers.encode_markers(x, y, labels, styles)
+        meta["group"] = group
+        meta["replace"] = replace
+        self._markers_sent = True
+        if replace:
+            self._markers = [
+                m for m in self._markers if m[0]["group"] != group
+            ]
+        self._markers.append((meta, buffer))
+        self.sync_command_and_arguments({
+            "command": "add_markers",
+            "arguments": [meta, memoryview(buffer)],
+        })
+
+    def clear_markers(self, group=None):
+        """Remove markers placed with ``add_markers``
+
+        :param group: Group to remove; all markers if None
+        :type group: Optional[str]
+        """
+        self._check_open()
+        self._markers = [
+            m for m in self._markers
+            if group is not None and m[0]["group"] != group
+        ]
+        self.sync_command_and_arguments({
+            "command": "clear_markers",
+            "arguments": [group],
+        })
+
+    @traced()
+    def overlay_table(self, table, y=None, x=None, overrides=None,
+                      layer_options=None):
+        """Overlay columns of a table as layers, all sent in one message.
+
+        Each column is sent as a binary buffer of its own dtype; numeric
+        columns that are contiguous in memory, as those of a DataFrame
+        usually are, are sent without being copied. 64-bit integers are
+        sent as 64-bit floats and 16-bit floats as 32-bit floats.
+
+        :param table: A pandas DataFrame, or a mapping of column names to
+                      1-D arrays
+        :type table: Union[pandas.DataFrame, Mapping[str, numpy.ndarray]]
+
+        :param y: Name of the column, or names of the columns, to overlay;
+                  by default, all but ``x``
+        :type y: Optional[Union[str, list(str)]]
+
+        :param x: Name of a column of evenly spaced abscissas, from which
+                  ``xstart`` and ``xdelta`` are set
+        :type x: Optional[str]
+
+        :param overrides: Header overrides, as for ``overlay_array``,
+                          common to all layers
+        :type overrides: Optional[dict]
+
+        :param layer_options: Layer options, common to all layers; each
+                              layer is named after its column
+        :type layer_options: Optional[dict]
+
+        :Example:
+        >>> plot = Plot()
+        >>> plot.overlay_table(telemetry, x='time', y=['voltage', 'current'])
+        """
+        self._check_open()
+        if y is None:
+            names = [name for name in table.keys() if name != x]
+        elif isinstance(y, six.string_types):
+            names = [y]
+        else:
+            names = list(y)
+        overrides = dict(overrides or {})
+        if x is not None:
+            overrides.update(_even_abscissas(_table_column(table, x), x))
+
+        columns, buffers, layers = [], [], []
+        for name in names:
+            column = _table_column(table, name)
+            layer = self._add_layer(
+                "overlay_table",
+                envelope=render.layer_envelope(
+                    column,
+                    overrides.get("xstart", 0.0),
+                    overrides.get("xdelta", 1.0),
+                ),
+            )
+            layer.options = dict({"name": str(name)}, **(layer_options or {}))
+            # The client converts columns to float32 samples
+            layer.client_bytes = 4 * len(column)
+            columns.append({"name": str(name), "dtype": column.dtype.str})
+            buffers.append(memoryview(column))
+            layers.append(layer.id)
+
+        self.sync_command_and_arguments({
+            "command": "overlay_table",
+            "arguments": [buffers, overrides, dict(layer_options or {})],
+            "columns": columns,
+            "layers": layers,
+        })
+
+        if self.static_render:
+            self.render_static()
+
+    @traced()
+    def overlay_xy(self, x, y, overrides=None, layer_options=None,
+                   bins=4096):
+        """Overlay points at the abscissas ``x``, e.g., irregularly sampled
+        or timestamped data, without resampling them.
+
+        ``x`` and ``y`` are sent as binary buffers of their own: 64-bit
+        integer abscissas (e.g., timestamps in ns) and 64-bit float
+        abscissas as they are, other abscissas as 64-bit floats, and
+        ordinates as 32-bit floats. Complex ordinates are shown as
+        magnitude. sigplot draws the layer in its 'IR' complex mode, as an
+        option of the layer; other layers keep the plot's ``cmode``.
+
+        Of more than ``2 * bins`` points, only those holding the minimum
+        and maximum of each of ``bins`` equal ranges of ``x`` are sent, so
+        that every extremum is still drawn where it happened.
+
+        :param x: Abscissas of the points, non-decreasing
+        :type x: numpy.ndarray
+
+        :param y: Ordinates of the points, the same length as ``x``
+        :type y: numpy.ndarray
+
+        :param overrides: Header overrides, as for ``overlay_array``
+        :type overrides: Optional[dict]
+
+        :param layer_options: Layer options, e.g., ``name``
+        :type layer_options: Optional[dict]
+
+        :param bins: Number of ranges of ``x`` to decimate to; None to send
+                     every point
+        :type bins: Optional[int]
+
+        :raises ValueError: if ``x`` is not sorted, or ``x`` and ``y``
+                            differ in length
+
+        :Example:
+        >>> plot = Plot()
+        >>> plot.overlay_xy(events['time_ns'], events['voltage'],
+        ...                 layer_options={'name': 'voltage'})
+        """
+        self._check_open()
+        x, y = _numeric_array(x).ravel(), _numeric_array(y).ravel()
+        if len(x) != len(y):
+            raise ValueError("x and y differ in length (%d and %d)" %
+                             (len(x), len(y)))
+        if x.dtype.kind in "iu" and x.dtype.itemsize == 8:
+            x = x.astype("<i8")
+        else:
+            x = x.astype("<f8")
+        if np.any(x[1:] < x[:-1]):
+            raise ValueError("x must be sorted in increasing order")
+        if np.iscomplexobj(y):
+            y = np.abs(y)
+
+        layer = self._add_layer(
+            "overlay_xy", envelope=render.xy_envelope(x, y)
+        )
+        layer.overrides = dict(overrides or {})
+        layer.options = dict(layer_options or {})
+        if bins is not None:
+            keep = decimate.xminmax(x, y, bins)
+            if len(keep) < len(x):
+                x, y = x[keep], y[keep]
+        layer.client_bytes = 16 * len(x)
+        self.sync_command_and_arguments(_xy_message(layer, x, y))
+
+        if self.static_render:
+            self.render_static()
+
+    @traced()
+    def overlay_files(self, paths, reduce="minmax", size=4096,
+                      max_workers=None):
+        """Overlay many local BLUE files, reading and reducing them in
+        parallel worker processes.
+
+        Each file is overlaid with ``overlay_array`` as soon as its worker
+        finishes, so layers appear in order of completion rather than in
+        the order given. With ``pyramids``, 'minmax' reductions of type 1000
+        files are overlaid as a ``pipeline.PyramidView`` instead: read from
+        the file's pyramid over the range the plot shows, at
+        ``pipeline_bins`` bins, again as the plot zooms.
+
+        :param paths: Filesystem paths, as a list or separated by '|';
+                      ``path_resolvers`` are applied as for ``overlay_href``
+        :type paths: Union[str, list(str)]
+
+        :param reduce: 'minmax' to keep the extrema of ``size`` blocks,
+                       'psd' for the average power spectrum with FFT size
+                       ``size``, None to load files in full, or a picklable
+                       callable; see ``ingest.reduce_file``
+        :type reduce: Optional[Union[str, function]]
+
+        :param size: Resolution of the reduction
+        :type size: int
+
+        :param max_workers: Number of worker processes; defaults to the
+                            number of CPUs. With 1, files are read in the
+                            kernel process.
+        :type max_workers: Optional[int]
+
+        :Example:
+        >>> plot = Plot()
+        >>> plot.overlay_files(['sin.tmp', 'pulse.tmp'], reduce='psd')
+        """
+        self._check_open()
+        if isinstance(paths, six.string_types):
+            paths = _split_inputs(paths)
+        paths = [_unravel_path(p, self.path_resolvers) for p in paths]
+        if self.pyramids:
+            # Sidecars live next to the files' names in data_dir
+            paths = [_prepare_file_input(p, self.data_dir) for p in paths]
+
+        if ProcessPoolExecutor is None or max_workers == 1 or \
+                len(paths) < 2:
+            for path in paths:
+                self._overlay_reduced(path, reduce, ingest.reduce_file(
+                    path, reduce, size, self.pyramids
+                ))
+            return
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = dict(
+                (executor.submit(
+                    ingest.reduce_file, path, reduce, size, self.pyramids
+                ), path)
+                for path in paths
+            )
+            for future in as_completed(futures):
+                self._overlay_reduced(futures[future], reduce,
+                                      future.result())
+
+    def _overlay_reduced(self, path, reduce, reduced):
+        """Overlay the reduction of the file at ``path``, or, see
+        ``overlay_files``, a view of its pyramid"""
+        if self.pyramids and reduce == "minmax":
+            try:
+                # The worker brought the sidecar up to date
+                view = PyramidView(Pyramid.open(path))
+            except ValueError:
+                # E.g., a type 2000 file
+                view = None
+            if view is not None:
+                self._overlay_pipeline(view, {}, {})
+                return
+        self.overlay_array(*reduced)
+
+    def to_png(self, width=800, height=350):
+        """Rasterize the current layers in the kernel, without a browser.
+
+        Each layer is drawn from a min/max envelope, so the cost does not
+        depend on how many samples were overlaid. Axis limits set through
+        ``xmin``, ``xmax``, ``ymin`` and ``ymax`` settings are honored.
+
+        :param width: Image width, in pixels
+        :type width: int
+
+        :param height: Image height, in pixels
+        :type height: int
+
+        :return: The PNG file contents
+        :rtype: bytes
+        """
+        envelopes = [
+            env for env in (layer.get_envelope() for layer in self._layers)
+            if env is not None
+        ]
+        limits = dict(
+            (k, self._settings[k]) for k in ("xmin", "xmax", "ymin", "ymax")
+            if self._settings.get(k) is not None
+        )
+        return render.render_png(envelopes, width, height, **limits)
+
+    def render_static(self, width=800, height=350):
+        """Rasterize the current layers in the kernel and show the image in
+        the placeholder output created along with the widget.
+
+        :param width: Image width, in pixels
+        :type width: int
+
+        :param height: Image height, in pixels
+        :type height: int
+
+        :return: The PNG file contents
+        :rtype: bytes
+        """
+        png = self.to_png(width, height)
+        _show_snapshot(
+            self._placeholder, "SigPlot plot",
+            _PNG_DATA_URL + base64.b64encode(png).decode("ascii"),
+        )
+        return png
+
     def sync_command_and_arguments(self, command_and_arguments):
         """
 
@@ -185,6 +1388,191 @@ class Plot(widgets.DOMWidget):
         :type command_and_arguments: dict
         :return:
         """
+        with self._lock:
+            self._message_bytes = _payload_bytes(
+                command_and_arguments.get("arguments", ())
+            )
+            if self.tracer is not None:
+                trace_id = self._trace_id
+                if trace_id is None:
+                    trace_id = self.tracer.next_id()
+                # ``trace`` has views report their spans for the command;
+                # serializing happens as the trait is set
+                command_and_arguments = dict(command_and_arguments,
+                                             trace=trace_id)
+                with self.tracer.span(
+                        "comm send", trace_id,
+                        command=command_and_arguments["command"],
+                        bytes=self._message_bytes):
+                    self._send_message(command_and_arguments)
+                return
+            self._send_message(command_and_arguments)
+
+
+class Plot(_PlotBase, widgets.DOMWidget):
+    """Name and version information required by widgets"""
+
+    _view_module_version = Unicode(version_string)
+    _view_name = Unicode("SigPlotView").tag(sync=True)
+    _model_name = Unicode("SigPlotModel").tag(sync=True)
+    _view_module = Unicode("jupyter_sigplot").tag(sync=True)
+    _model_module = Unicode("jupyter_sigplot").tag(sync=True)
+
+    """The command and arguments that will get sent"""
+    command_and_arguments = Dict().tag(sync=True)
+
+    """The plot_options dictionary in the JS
+    sigplot.Plot(dom_element, plot_options)"""
+    plot_options = Dict().tag(sync=True)
+
+    """Unique identifier for each SigPlot instance"""
+    uuid = Unicode().tag(sync=True)
+
+    """Progress information for the client"""
+    progress = Float().tag(sync=True)
+    done = Bool(False).tag(sync=True)
+
+    """Link group of the plot, see ``link_plots``"""
+    link = Dict().tag(sync=True)
+
+    """Axis ranges (``xmin``, ``xmax``, ``ymin``, ``ymax``) the plot was last
+    zoomed or panned to in a view, reported once they settle; observe it to
+    refresh layers at the resolution of the view"""
+    view_range = Dict()
+
+    def __init__(self, data_dir="", **kwargs):
+        super(Plot, self).__init__()
+        kwargs = self._init_plot(data_dir, kwargs)
+        self.on_msg(self._handle_custom_msg)
+        self._zoomed = False
+
+        # Whatever's left is meant for sigplot.js's ``sigplot.Plot``
+        self.plot_options = kwargs
+        self.uuid = str(uuid.uuid4())
+        self._display()
+
+    @classmethod
+    def get_or_create(cls, key, data_dir="", **kwargs):
+        """Return the plot registered under ``key``, displaying it again,
+        or a new plot, registered under ``key``
+
+        Meant for cells that are run again and again: instead of a new
+        widget every time, the cell gets the same plot back, and the
+        layers it overlays are only sent if they differ from those of its
+        previous run. Layers of the previous run that the cell does not
+        overlay again, and all markers, are removed when the cell ends.
+
+        :param key: Name of the plot, e.g., the purpose of its cell
+        :type key: Hashable
+
+        :param data_dir: See ``Plot``
+        :type data_dir: str
+
+        :param kwargs: See ``Plot``; they replace those the plot was
+                       created with
+        :type kwargs: dict
+
+        :rtype: Plot
+
+        :Example:
+        >>> plot = Plot.get_or_create('spectrum', autohide_panbars=True)
+        >>> plot.overlay_array(reference)  # only sent on the first run
+        >>> plot.overlay_array(estimate(samples))
+        """
+        plot = _keyed_plots.get(key)
+        if plot is None or plot.comm is None:
+            plot = _keyed_plots[key] = cls(data_dir, **kwargs)
+            plot._key = key
+            return plot
+
+        # A run that never ended, e.g., outside of IPython
+        plot._end_run()
+        kwargs = plot._configure(data_dir, kwargs)
+        plot._settings.update(kwargs)
+        plot.plot_options = kwargs
+        plot._previous = list(plot._layers)
+        plot._live_layers.clear()
+        if plot._markers_sent:
+            plot._markers_sent = False
+            plot.clear_markers()
+        plot._display()
+
+        ip = get_ipython()
+        if ip is not None:
+            ip.events.register("post_run_cell", plot._end_run)
+        return plot
+
+    def close(self):
+        """Close the plot.
+
+        Downloads in progress for it are cancelled, raising
+        ``DownloadCancelled``, and further commands raise ValueError. What
+        the kernel retains for the plot is released, its views destroy
+        their sigplot instances, and its placeholder output is cleared.
+        Closing a closed plot does nothing.
+
+        Plots are also closed on leaving a ``with`` block:
+
+        :Example:
+        >>> with Plot() as plot:
+        ...     plot.overlay_href('http://example.com/big.tmp')
+        """
+        if self.closed:
+            return
+        self._release()
+        self.done = True
+        if self._placeholder is not None:
+            self._placeholder.update(HTML(""))
+            self._placeholder = None
+        super(Plot, self).close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def _display(self):
+        """Display the interactive widget, and the placeholder output
+        for its snapshot"""
+        display(self)
+
+        # Dummy container where the rendered Plot png
+        # will go on export as HTML or notebook close
+        self._placeholder = display(
+            HTML("<div id=\"%s\"></div>" % self.uuid), display_id=True
+        )
+
+    def _handle_custom_msg(self, _, content, buffers):
+        """Handle messages from views, sent with ``model.send``"""
+        event = content.get("event")
+        if event == "trace" and self.tracer is not None:
+            self.tracer.add_view_spans(
+                content.get("view", ""), content.get("spans", [])
+            )
+        elif event == "snapshot":
+            # From views that cannot reach the placeholder output
+            # themselves, e.g., in JupyterLab
+            _show_snapshot(self._placeholder, "SigPlot plot",
+                           content.get("image"))
+        elif event == "view":
+            self._zoomed = content.get("level", 1) > 0
+            self.view_range = dict(
+                (k, content[k]) for k in ("xmin", "xmax", "ymin", "ymax")
+                if k in content
+            )
+            self._evaluate_pipelines()
+        elif event == "scene" and not self.closed:
+            # From views rendered without the plot's history, e.g., after
+            # a page refresh
+            self._send_scene()
+
+    def _shown_range(self):
+        if not self._zoomed:
+            return None, None
+        return self.view_range.get("xmin"), self.view_range.get("xmax")
+
+    def _send_message(self, command_and_arguments):
         self.command_and_arguments = command_and_arguments
 
 
@@ -192,6 +1580,528 @@ class Plot(widgets.DOMWidget):
 ###########################################################################
 
 
+_PNG_DATA_URL = "data:image/png;base64,"
+
+
+def _show_snapshot(placeholder, alt, image):
+    """Show the PNG data URL ``image`` in the ``placeholder`` display, if
+    there is one and ``image`` is a PNG data URL"""
+    if placeholder is None or not isinstance(image, six.string_types) or \
+            not image.startswith(_PNG_DATA_URL):
+        return
+    if "\"" in image or "<" in image:
+        return
+    placeholder.update(HTML(
+        "<img alt=\"%s\" src=\"%s\" width=\"100%%\">" % (alt, image)
+    ))
+
+
+def link_plots(plots, axes="x"):
+    """Link the zoom and pan of ``plots`` along ``axes``.
+
+    Linked plots follow one another in the browser, without a round trip
+    through the kernel; the kernel is only told the ranges of each plot
+    once they settle, in its ``view_range``. A plot is in at most one link
+    group; linking it again moves it to the new group.
+
+    :param plots: Plots to link
+    :type plots: Sequence[Plot]
+
+    :param axes: Linked axes: 'x', 'y' or 'xy'
+    :type axes: str
+
+    :return: Name of the link group
+    :rtype: str
+
+    :Example:
+    >>> channels = [Plot() for _ in range(4)]
+    >>> link_plots(channels, axes='x')
+    """
+    if axes not in ("x", "y", "xy"):
+        raise ValueError("axes must be 'x', 'y' or 'xy' (got %r)" % (axes,))
+    group = str(uuid.uuid4())
+    for plot in plots:
+        plot.link = {"group": group, "axes": axes}
+    return group
+
+
+def unlink_plots(plots):
+    """Remove ``plots`` from their link groups, see ``link_plots``
+
+    :param plots: Plots to unlink
+    :type plots: Sequence[Plot]
+    """
+    for plot in plots:
+        plot.link = {}
+
+
+class Subscription(object):
+    """A plot's subscription to a shared-memory stream; see
+    ``Plot.subscribe``"""
+
+    def __init__(self, plot, reader, fps, window):
+        self.plot = plot
+        self.reader = reader
+        self.window = int(window)
+        self.interval = 1.0 / fps
+        self.layer = plot._add_layer("overlay_array")
+        # Stream count when the plot was last updated
+        self._shown = None
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="sigplot-subscribe-%s" % reader.name
+        )
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        """Stop updating the plot, remove the stream's layer from it, and
+        detach from the stream"""
+        self._stopped.set()
+        if self._thread.is_alive() and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+        self.reader.close()
+        plot = self.plot
+        with plot._lock:
+            if plot._subscriptions.get(self.reader.name) is self:
+                del plot._subscriptions[self.reader.name]
+            # A closed plot drops its layers itself
+            if not plot.closed and self.layer in plot._layers:
+                plot._remove_layer(self.layer)
+
+    @property
+    def stopped(self):
+        return self._stopped.is_set()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        """Update the plot if the stream has new samples
+
+        :return: Whether the plot was updated
+        :rtype: bool
+        """
+        if self.stopped or self.plot.closed or \
+                self.reader.count == self._shown:
+            return False
+        bins = self.plot.pipeline_bins
+        for _ in range(3):
+            count = self.reader.count
+            start, view = self.reader.latest(self.window)
+            lo, hi = decimate.minmax(view, bins)
+            samples, overrides = ingest.interleave(
+                lo, hi, {"xstart": 0.0, "xdelta": self.reader.xdelta},
+                start, len(view) / float(max(len(lo), 1)),
+            )
+            # Copied out of the shared memory before it is checked
+            samples = np.array(samples, dtype=np.float32)
+            del view, lo, hi
+            if self.reader.valid(start):
+                break
+        else:
+            # The producer laps the reader; try again at the next frame
+            return False
+
+        layer = self.layer
+        with self.plot._lock:
+            # Stopped, or the plot closed, while the samples were read
+            if self.stopped or self.plot.closed:
+                return False
+            layer.samples, layer.overrides = samples, overrides
+            self._shown = count
+            self.plot._sync_layer(
+                layer, "reload" if layer.sent else "overlay_array",
+                [memoryview(samples), dict(overrides)],
+            )
+        return True
+
+
+class MemoryBudgetWarning(UserWarning):
+    """Issued when a layer is degraded to fit a ``Plot`` memory budget"""
+
+
+class DownloadCancelled(IOError):
+    """Raised by a download for a ``Plot`` that was closed meanwhile"""
+
+
+"""Live plots, for ``Plot.total_memory_budget``"""
+_plots = weakref.WeakSet()
+
+"""Plots made by ``Plot.get_or_create``, by key"""
+_keyed_plots = {}
+
+"""Ways ``overlay_array`` can deliver an array, see ``Plot.over_budget``"""
+_DELIVERIES = ("inline", "decimate", "quantize", "reference")
+
+"""Fewest min/max blocks a layer is decimated to, whatever the budget"""
+_MIN_DECIMATED_BLOCKS = 1024
+
+
+"""Directory of the package's modules, see ``_warn_caller``"""
+_PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _warn_caller(message, category):
+    """Issue a warning from the innermost frame outside of the package,
+    e.g., the user's cell, however deep within the package it is issued"""
+    frame, level = sys._getframe(1), 2
+    while frame.f_back is not None and \
+            os.path.dirname(os.path.abspath(frame.f_code.co_filename)) == \
+            _PACKAGE_DIR:
+        frame, level = frame.f_back, level + 1
+    warnings.warn(message, category, stacklevel=level)
+
+
+def _numeric_array(data):
+    """Return ``data`` as an array, making sure it is something sigplot can
+    plot"""
+    array = np.asarray(data)
+    if not np.issubdtype(array.dtype, np.number):
+        raise TypeError(
+            "Array passed to overlay_array must be numeric type"
+        )
+    return array
+
+
+def _command_key(command, arguments, by_reference, traces):
+    """Digest of an overlay command, equal for commands that make the same
+    layers"""
+    digest = hashlib.sha1()
+    digest.update(repr((command, by_reference)).encode("ascii"))
+    digest.update(json.dumps(traces, sort_keys=True, default=repr)
+                  .encode("utf-8"))
+    for arg in arguments:
+        if arg is None or isinstance(arg, (dict, bool, float) +
+                                     six.string_types + six.integer_types):
+            digest.update(json.dumps(arg, sort_keys=True, default=repr)
+                          .encode("utf-8"))
+            if command == "overlay_href" and \
+                    isinstance(arg, six.string_types) and os.path.isfile(arg):
+                # The file may have changed since
+                st = os.stat(arg)
+                digest.update(repr((st.st_mtime, st.st_size))
+                              .encode("ascii"))
+        else:
+            array = np.ascontiguousarray(arg)
+            digest.update(repr((array.dtype.str, array.shape))
+                          .encode("ascii"))
+            if array.dtype.hasobject:
+                digest.update(repr(arg).encode("utf-8"))
+            else:
+                digest.update(array.reshape(-1).view(np.uint8))
+    return digest.hexdigest()
+
+
+def _payload_bytes(arguments):
+    """Number of bytes in the binary arguments of a command, including
+    those in lists of arguments and in the commands of a scene"""
+    # Over all dimensions, as ``memoryview.nbytes``, which Python 2 lacks
+    return sum(
+        arg.itemsize * int(np.prod(arg.shape)) if isinstance(arg, memoryview)
+        else _payload_bytes(arg.get("arguments", ())) if isinstance(arg, dict)
+        else _payload_bytes(arg)
+        for arg in arguments
+        if isinstance(arg, (memoryview, list, dict))
+    )
+
+
+def _pipe_arguments(overrides, framesize):
+    """Arguments of the ``overlay_pipe`` of a live layer that sigplot
+    scrolls ``push``-ed samples into"""
+    return [
+        dict(overrides, type=1000, format="SF"),
+        {"framesize": framesize, "drawmode": "scrolling"},
+    ]
+
+
+def _envelope_samples(envelope):
+    """Lay out ``envelope`` as samples that draw as it
+
+    :return: A tuple (samples, overrides)
+    :rtype: Tuple[numpy.ndarray, dict]
+    """
+    lo, hi = envelope.lo, envelope.hi
+    if np.array_equal(lo, hi):
+        # One sample per bin: the samples themselves
+        return np.asarray(lo, dtype=np.float32), {
+            "xstart": envelope.xstart, "xdelta": envelope.xdelta,
+        }
+    return ingest.interleave(
+        lo, hi, {"xstart": envelope.xstart, "xdelta": envelope.xdelta / 2.0},
+        0, 2,
+    )
+
+
+def _xy_message(layer, x, y):
+    """The ``overlay_xy`` message of points (``x``, ``y``) as ``layer``"""
+    x = np.ascontiguousarray(x)
+    if x.dtype.kind not in "iu":
+        x = x.astype("<f8")
+    y = np.ascontiguousarray(y, dtype=np.float32)
+    return {
+        "command": "overlay_xy",
+        "arguments": [memoryview(x), memoryview(y), dict(layer.overrides),
+                      layer.options],
+        "dtypes": [x.dtype.str, y.dtype.str],
+        "layer": layer.id,
+    }
+
+
+def _scene_array(layer, samples, overrides):
+    """The ``overlay_array`` of ``samples`` as ``layer``, for a scene"""
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    return {
+        "command": "overlay_array",
+        "arguments": [memoryview(samples), dict(overrides), layer.options],
+        "layer": layer.id,
+    }
+
+
+def _table_column(table, name):
+    """Return column ``name`` of ``table`` as a contiguous little-endian
+    array of a dtype the client can view, copying it only if needed"""
+    try:
+        column = np.asarray(table[name])
+    except KeyError:
+        raise KeyError("No column %r in the table" % (name,))
+    if column.ndim != 1:
+        raise ValueError("Column %r is not 1-D" % (name,))
+    kind, itemsize = column.dtype.kind, column.dtype.itemsize
+    if kind == "b":
+        column = column.view(np.uint8)
+    elif kind in "iu" and itemsize == 8:
+        # JavaScript has no typed array of 64-bit integers as numbers
+        column = column.astype("<f8")
+    elif kind == "f" and itemsize not in (4, 8):
+        column = column.astype("<f4")
+    elif kind not in "iuf":
+        raise TypeError("Column %r is not numeric (dtype %s)" %
+                        (name, column.dtype))
+    if column.dtype.byteorder == ">":
+        column = column.astype(column.dtype.newbyteorder("<"))
+    return np.ascontiguousarray(column)
+
+
+def _even_abscissas(x, name):
+    """Return the ``xstart`` and ``xdelta`` overrides of the evenly spaced
+    abscissas ``x``"""
+    x = x.astype(np.float64)
+    if len(x) < 2:
+        return {"xstart": float(x[0]) if len(x) else 0.0, "xdelta": 1.0}
+    xdelta = (x[-1] - x[0]) / (len(x) - 1)
+    if not np.allclose(np.diff(x), xdelta, rtol=1e-6, atol=0):
+        raise ValueError("Column %r is not evenly spaced" % (name,))
+    return {"xstart": float(x[0]), "xdelta": float(xdelta)}
+
+
+def _delivery_bytes(array, delivery):
+    """Bytes, in the kernel and client together, that delivering ``array``
+    takes, besides its envelope"""
+    if delivery == "reference":
+        # Only the client loads the file
+        return array.nbytes
+    if delivery == "quantize":
+        # 16-bit in the message, expanded to 32-bit in the client
+        return 6 * array.size
+    if delivery == "decimate":
+        return 16 * _MIN_DECIMATED_BLOCKS
+    # 32-bit in the message and in the client
+    return 8 * array.size
+
+
+def _envelope_bytes(envelope):
+    """Bytes the kernel retains for ``envelope``"""
+    return envelope.lo.nbytes + envelope.hi.nbytes
+
+
+def _check_decimated(used, available):
+    """Warn if decimated layers taking ``used`` bytes, in the kernel and in
+    the client, still exceed the ``available`` bytes, at the fewest blocks
+    layers are decimated to"""
+    if available is not None and used > available:
+        _warn_caller(
+            "Decimated as far as it goes, a layer of %d bytes still "
+            "exceeds the memory budget (%d bytes available)" % (
+                used, max(available, 0),
+            ),
+            MemoryBudgetWarning,
+        )
+
+
+def _decimate_to(array, overrides, available):
+    """Reduce ``array`` to interleaved min/max pairs that fit in
+    ``available`` bytes, as for ``_delivery_bytes``
+
+    :return: A tuple (samples, overrides) for the reduced layer
+    :rtype: Tuple[numpy.ndarray, dict]
+    """
+    y = array.ravel()
+    if np.iscomplexobj(y):
+        y = np.abs(y)
+    blocks = max(_MIN_DECIMATED_BLOCKS, (available or 0) // 16)
+    lo, hi = decimate.minmax(y, min(blocks, max(len(y) // 2, 1)))
+    header = {
+        "xstart": overrides.get("xstart", 0.0),
+        "xdelta": overrides.get("xdelta", 1.0),
+    }
+    samples, decimated = ingest.interleave(
+        lo, hi, header, 0, len(y) / float(max(len(lo), 1))
+    )
+    return samples.astype(np.float32), decimated
+
+
+def _quantize(array):
+    """Quantize ``array`` to 16 bits
+
+    :return: A tuple (quantized, scale, offset), where ``array`` is
+             approximately ``quantized * scale + offset``
+    :rtype: Tuple[numpy.ndarray, float, float]
+    """
+    finite = array[np.isfinite(array)]
+    lo = float(finite.min()) if finite.size else 0.0
+    hi = float(finite.max()) if finite.size else 0.0
+    scale = (hi - lo) / 65535.0 or 1.0
+    offset = lo + 32768 * scale
+    quantized = np.round((np.nan_to_num(array) - offset) / scale)
+    return np.clip(quantized, -32768, 32767).astype("<i2"), scale, offset
+
+
+class _Layer(object):
+    """Kernel-side record of a layer overlaid on a ``Plot``
+
+    :param id: Identifier of the layer, unique within its ``Plot``
+    :type id: int
+
+    :param command: The command that created the layer
+    :type command: str
+
+    :param envelope: Min/max envelope of the layer's data, if known
+    :type envelope: Optional[render.Envelope]
+
+    :param href: Local file holding the layer's data, read on demand
+    :type href: Optional[str]
+
+    :param samples: Buffer holding the current data of a live layer
+    :type samples: Optional[Union[numpy.ndarray, RingBuffer]]
+    """
+
+    def __init__(self, id, command, envelope=None, href=None, samples=None):
+        self.id = id
+        self.command = command
+        self.envelope = envelope
+        self.href = href
+        self.samples = samples
+        # Overrides describing ``samples``
+        self.overrides = {}
+        # Whether the client has been told to create the layer
+        self.sent = False
+        # Number of ``push`` and ``reload`` updates sent
+        self.updates = 0
+        # Whether to read the envelope of ``href`` from a pyramid sidecar
+        self.pyramid = False
+        # Bytes the client retains for the layer
+        self.client_bytes = 0
+        # Layer options (e.g., ``name``) it was overlaid with
+        self.options = {}
+        # Pipeline the layer's data is evaluated from, if any, and the
+        # callback through which it has the layer evaluated again
+        self.pipeline = None
+        self.on_change = None
+        # Digest of the command that made the layer, and the id of the
+        # first layer it made, for ``Plot.get_or_create``
+        self.key = None
+
+    def detach(self):
+        """Stop the layer's pipeline, if any, from referring to the layer,
+        once the layer is removed"""
+        if self.pipeline is not None and self.on_change is not None:
+            self.pipeline.off_change(self.on_change)
+            self.on_change = None
+
+    @property
+    def kernel_bytes(self):
+        """Bytes the kernel retains for the layer"""
+        size = 0
+        if self.envelope is not None:
+            size += _envelope_bytes(self.envelope)
+        if isinstance(self.samples, RingBuffer):
+            size += self.samples.capacity * 2 * self.samples.dtype.itemsize
+        elif self.samples is not None:
+            size += self.samples.nbytes
+        return size
+
+    def get_envelope(self):
+        """Return the layer's envelope, reading it from ``href`` the first
+        time it is needed.
+
+        :return: The envelope, or None if the data cannot be read
+        :rtype: Optional[render.Envelope]
+        """
+        if self.samples is not None:
+            # Live layers change with every update; only compute the
+            # envelope when it is needed
+            samples = self.samples
+            if isinstance(samples, RingBuffer):
+                samples = samples.latest()
+            return render.layer_envelope(
+                samples,
+                self.overrides.get("xstart", 0.0),
+                self.overrides.get("xdelta", 1.0),
+            )
+        if self.envelope is None and self.href is not None:
+            try:
+                self.envelope = render.file_envelope(
+                    self.href, pyramid=self.pyramid
+                )
+            except (IOError, OSError, ValueError):
+                # Not a readable BLUE file; e.g., a .mat file or a
+                # path only the browser can resolve
+                return None
+        return self.envelope
+
+
+def _file_size(path):
+    """Size of the file at ``path`` in bytes, or 0 if it can't be read"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _layer_options_from(arguments):
+    """Return the layer options passed to ``overlay_array`` or
+    ``overlay_href``
+
+    :param arguments: Arguments to ``overlay_array`` or ``overlay_href``
+    :type arguments: list(Any)
+
+    :return: The layer options, or an empty dict if none were given
+    :rtype: dict
+    """
+    if len(arguments) > 2 and isinstance(arguments[2], dict):
+        return arguments[2]
+    return {}
+
+
+def _overrides_from(arguments):
+    """Return the ``overrides`` dict passed to ``overlay_array``
+
+    :param arguments: Arguments to ``overlay_array``
+    :type arguments: list(Any)
+
+    :return: The overrides, or an empty dict if none were given
+    :rtype: dict
+    """
+    if len(arguments) > 1 and isinstance(arguments[1], dict):
+        return arguments[1]
+    return {}
+
+
 def _require_dir(directory):
     # type: (Union[str, Path]) -> None
     """Creates the path ``d`` similar to ``mkdir -p``
@@ -266,6 +2176,14 @@ def _local_name_for_href(url, local_dir):
     return local_path
 
 
+"""Minimum time, in seconds, between progress reports of downloads"""
+_PROGRESS_INTERVAL = 0.25
+
+"""Minimum time, in seconds, between refreshes of the overview of a file
+being downloaded, which take longer to read and draw than progress reports"""
+_OVERVIEW_INTERVAL = 2.0
+
+
 def _prepare_http_input(url, local_dir, progress=None):
     """Given a URI, fetch the named resource to a file in ``local_dir``,
     to avoid CORS issues.
@@ -277,8 +2195,12 @@ def _prepare_http_input(url, local_dir, progress=None):
     :param local_dir: Local directory to where URL will be downloaded
     :type local_dir: str
 
-    :param progress: Progress traitlet that will sync with the client
-    :type progress: Optional[traitlets.Float]
+    :param progress: Called as ``progress(local_fname, wrote, total)``
+                     as the download proceeds, with the number of bytes
+                     written so far and expected in all (0 if unknown);
+                     last with ``wrote == total`` once it is complete. An
+                     exception it raises cancels the download.
+    :type progress: Optional[function]
 
     :return: A filename in the local filesystem, under <local_dir>
     """
@@ -294,23 +2216,41 @@ def _prepare_http_input(url, local_dir, progress=None):
     total_size = int(r.headers.get("content-length", 0))
 
     # we'll want to iterate over the file by chunks
-    block_size = 1024
+    block_size = 64 * 1024
 
     # how much we've written locally (kernel-side)
     wrote = 0
+    reported = time.time()
 
     # "stream" the remote asset to ``local_file``
-    with open(local_fname, "wb") as f:
-        for data in r.iter_content(block_size):
-            # keep track of how much we've written
-            f.write(data)
-            wrote += len(data)
-
-            # update the ``progress`` traitlet, which
-            # we will handle on the client-side in some loading
-            # notification (e.g., loading bar via tqdm?, spinny wheel, etc.)
-            if progress is not None:
-                progress = wrote / total_size
+    try:
+        with open(local_fname, "wb") as f:
+            for data in r.iter_content(block_size):
+                # keep track of how much we've written
+                f.write(data)
+                wrote += len(data)
+
+                # report progress, e.g., to update the ``progress``
+                # traitlet, at most every _PROGRESS_INTERVAL seconds so as
+                # not to flood the client with messages
+                if progress is not None and \
+                        time.time() - reported >= _PROGRESS_INTERVAL:
+                    # callers may read what has been written so far
+                    f.flush()
+                    progress(local_fname, wrote, total_size)
+                    reported = time.time()
+    except BaseException:
+        # E.g., ``progress`` cancelled the download; don't leave a partial
+        # file to be taken for the resource
+        r.close()
+        try:
+            os.remove(local_fname)
+        except OSError:
+            pass
+        raise
+
+    if progress is not None:
+        progress(local_fname, wrote, wrote)
 
     # TODO: Make sure we do the right thing if ``local_dir``
     #       is an absolute path or doesn't exist
@@ -381,9 +2321,15 @@ def _local_name_for_file(file_path, local_dir):
     if not file_path:
         raise ValueError("Path %r is not a valid filename" % file_path)
 
-    abs_file_path = os.path.realpath(file_path)
-    abs_local_dir = os.path.realpath(local_dir)
+    return _local_name_for_resolved(
+        os.path.realpath(file_path), os.path.realpath(local_dir), local_dir
+    )
+
 
+def _local_name_for_resolved(abs_file_path, abs_local_dir, local_dir):
+    """Like ``_local_name_for_file``, for callers that have already resolved
+    the file path and ``local_dir`` with ``realpath``.
+    """
     # A bit clunky but works okay for now
     if abs_file_path.startswith(abs_local_dir):
         is_local = True
@@ -424,21 +2370,251 @@ def _prepare_file_input(orig_file_name, local_dir, resolvers=None):
 
     # TODO: Handle errors more thoroughly
     #       * unable to make local path
-    #       * symlink already exists, to wrong target
     #       * original file does not exist / has bad perms
-    _require_dir(local_dir)
+    return _manifest_for(local_dir).prepare(input_path)
+
+
+"""Name of the file, in each ``data_dir``, that records the links created
+there by ``_prepare_file_input``"""
+_MANIFEST_NAME = ".sigplot_manifest.jsonl"
+
+"""``_FileManifest`` instances, by absolute ``data_dir``"""
+_manifests = {}
+
+
+def _manifest_for(local_dir):
+    """Return the ``_FileManifest`` for ``local_dir``, creating it if needed
+
+    :param local_dir: Directory where inputs are linked
+    :type local_dir: str
+
+    :rtype: _FileManifest
+    """
+    # abspath, unlike realpath, does not touch the filesystem
+    key = os.path.abspath(local_dir or ".")
+    manifest = _manifests.get(key)
+    if manifest is None:
+        manifest = _manifests[key] = _FileManifest(local_dir)
+    return manifest
+
+
+class _FileManifest(object):
+    """Persistent record of the files linked under a ``data_dir``
+
+    Each linked file is keyed by its resolved path and gets a link name that
+    is unique within the directory, so files that share a basename no longer
+    share a link. The mtime and size of each file are recorded so that
+    stale entries can be detected.
+
+    The first lookup of an input resolves it, links it if needed, and
+    records the result; repeated lookups of the same input are then
+    answered from memory, as long as the input keeps its mtime and size and
+    its link still exists.
+
+    The record is kept as an append-only JSON-lines file, so adding an entry
+    does not rewrite the others; later lines supersede earlier ones.
+
+    :param local_dir: Directory where inputs are linked
+    :type local_dir: str
+    """
 
-    # TODO (sat 2018-11-07): Do the right thing if ``local_dir`` is absolute
-    local_fname, is_local = _local_name_for_file(input_path, local_dir)
-    if not is_local:
+    def __init__(self, local_dir):
+        self.local_dir = local_dir
+        self.path = os.path.join(local_dir, _MANIFEST_NAME)
+
+        # resolved source path -> {"name": ..., "mtime": ..., "size": ...}
+        self.entries = {}
+        # link name -> resolved source path
+        self.names = {}
+
+        # absolute input path -> (prepared local file name, (mtime, size))
+        self._lookups = {}
+        self._abs_local_dir = None
+
+    def prepare(self, input_path):
+        """Return a name under ``local_dir`` for ``input_path``, linking it
+        there if it is not already a descendant.
+
+        :param input_path: Unraveled path of the input file
+        :type input_path: str
+
+        :return: A filename in the local filesystem, under ``local_dir``
+        :rtype: str
+        """
+        key = os.path.abspath(input_path)
+        stamp = _stat_stamp(key)
+        lookup = self._lookups.get(key)
+        if lookup is not None and stamp is not None and \
+                lookup[1] == stamp and os.path.exists(lookup[0]):
+            return lookup[0]
+
+        local_fname = self._prepare(input_path)
+        self._lookups[key] = (local_fname, stamp)
+        return local_fname
+
+    def _prepare(self, input_path):
+        if self._abs_local_dir is None:
+            self._load()
+
+        source = os.path.realpath(input_path)
+        local_fname, is_local = _local_name_for_resolved(
+            source, self._abs_local_dir, self.local_dir
+        )
+        if is_local:
+            return local_fname
+
+        try:
+            st = os.stat(source)
+            mtime, size = st.st_mtime, st.st_size
+        except OSError:
+            mtime = size = None
+
+        entry = self.entries.get(source)
+        if entry is not None:
+            link = os.path.join(self.local_dir, entry["name"])
+            if os.path.realpath(link) == source:
+                if (entry["mtime"], entry["size"]) != (mtime, size):
+                    self._record(source, entry["name"], mtime, size)
+                return link
+            # The link was removed or now points elsewhere
+            self._record(source, None)
+
+        # Note that ``_unravel_path`` keeps relative names like ../foo.tmp
+        # as is, only applying user specifications like ~someone,
+        # environment variables, and any explicit resolvers. Absolute names
+        # are linked as given, to keep links as human-comprehensible as
+        # possible; relative ones would be resolved against ``local_dir``
+        # rather than the kernel's directory, so they are linked resolved.
+        target = input_path if os.path.isabs(input_path) else source
+        name = self._link(target, source, os.path.basename(local_fname))
+        self._record(source, name, mtime, size)
+        return os.path.join(self.local_dir, name)
+
+    def _link(self, target, source, basename):
+        """Create a link to ``target`` under an unused name derived from
+        ``basename``, and return the name"""
+        stem, ext = os.path.splitext(basename)
+        for i in itertools.count():
+            name = basename if i == 0 else "%s_%d%s" % (stem, i, ext)
+            if self.names.get(name, source) != source:
+                continue
+            link = os.path.join(self.local_dir, name)
+            try:
+                os.symlink(target, link)
+                return name
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                if os.path.realpath(link) == source:
+                    # Left by an earlier session or another kernel
+                    return name
+
+    def _load(self):
+        _require_dir(self.local_dir)
+        self._abs_local_dir = os.path.realpath(self.local_dir)
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        self._apply(json.loads(line))
+                    except (ValueError, KeyError):
+                        # e.g., a line torn by a concurrent writer
+                        continue
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def _apply(self, record):
+        source = record["source"]
+        entry = self.entries.pop(source, None)
+        if entry is not None and self.names.get(entry["name"]) == source:
+            del self.names[entry["name"]]
+        if record["name"] is not None:
+            self.entries[source] = record
+            self.names[record["name"]] = source
+
+    def _record(self, source, name, mtime=None, size=None):
+        record = {"source": source, "name": name,
+                  "mtime": mtime, "size": size}
+        self._apply(record)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def _stat_stamp(path):
+    """The (mtime, size) of ``path``, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+"""``overlay_array`` overrides that are stored in a BLUE file header"""
+_BLUE_HEADER_KEYS = (
+    "xstart", "xdelta", "xunits", "subsize", "ystart", "ydelta", "yunits"
+)
+
+
+def _prepare_array_input(array, local_dir, overrides=None):
+    """Write ``array`` to a BLUE file under ``local_dir``, so it can be
+    overlaid by reference instead of being sent inline.
+
+    The file is named after a hash of its contents, so overlaying the same
+    array again reuses the existing file instead of writing a new one.
+
+    :param array: Numeric samples; 64-bit integers are stored as float64,
+                  which sigplot reads, and other dtypes without a BLUE
+                  equivalent as float32
+    :type array: numpy.ndarray
+
+    :param local_dir: Directory where the file will be written
+    :type local_dir: str
+
+    :param overrides: ``overlay_array`` overrides; ``xstart``, ``xdelta``,
+                      ``subsize`` and the like are stored in the file header
+    :type overrides: Optional[dict]
+
+    :return: A filename in the local filesystem, under ``local_dir``
+    :rtype: str
+    """
+    array = np.asarray(array)
+    if array.dtype.kind in "iu" and array.dtype.itemsize == 8:
+        # sigplot cannot read 64-bit integer ('X') files; doubles keep
+        # integers exact up to 2**53
+        array = array.astype(np.float64)
+    else:
+        try:
+            bluefile.format_for_dtype(array.dtype)
+        except ValueError:
+            array = array.astype(np.float32)
+    array = np.ascontiguousarray(array)
+
+    overrides = overrides or {}
+    header = dict((k, overrides[k]) for k in _BLUE_HEADER_KEYS
+                  if k in overrides)
+    if array.ndim == 2 and "subsize" not in header:
+        header["subsize"] = array.shape[1]
+
+    digest = hashlib.sha1()
+    digest.update(repr((array.dtype.str, sorted(header.items())))
+                  .encode("ascii"))
+    digest.update(array)
+
+    _require_dir(local_dir)
+    local_fname = os.path.join(local_dir, "sigplot-%s.tmp" %
+                               digest.hexdigest())
+    if not os.path.exists(local_fname):
+        # Write under a temporary name so a partially-written file is never
+        # mistaken for a complete one
+        partial_fname = "%s.%s.partial" % (local_fname, uuid.uuid4().hex)
+        bluefile.write(partial_fname, array, **header)
         try:
-            # Note that ``_unravel_path`` keeps relative names like ../foo.tmp
-            # will as is, only applying user specifications like ~someone,
-            # environment variables, and any explicit resolvers. This is
-            # intended to make links as human-comprehensible as possible.
-            os.symlink(input_path, local_fname)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
+            os.rename(partial_fname, local_fname)
+        except OSError:
+            # Lost a race with another writer of the same contents
+            os.remove(partial_fname)
+            if not os.path.exists(local_fname):
                 raise
 
     return local_fname
@@ -478,9 +2654,9 @@ def _prepare_href_input(orig_inputs, local_dir, progress=None, resolvers=None):
     :param local_dir: Directory where the ``orig_inputs`` will end up
     :type local_dir: Optional[str]
 
-    :param progress: Optional progress traitlet to provide
-                     feedback to the client
-    :type progress: Optional[traitlets.Float]
+    :param progress: Optional progress callback for downloads; see
+                     ``_prepare_http_input``
+    :type progress: Optional[function]
 
     :param resolvers: sequence of callables to be applied, in order, to
                       ``orig_file_name``. Could be used to normalize case,
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+"""Timelines of plot commands across the kernel and the browser.
+
+A ``Tracer`` records a span for each step a command goes through: preparing
+it in the kernel, sending it over the comm, and, as reported back by the
+view, decoding it, rendering it with sigplot and saving the snapshot. Spans
+of a command share its id. The timeline exports as a Chrome trace-event
+file, to open in chrome://tracing or https://ui.perfetto.dev.
+"""
+from __future__ import absolute_import, print_function
+from contextlib import contextmanager
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+
+
+"""Process id under which spans reported by views are shown"""
+BROWSER_PID = 0
+
+
+def _now_us():
+    """Microseconds since the epoch, the clock views report spans on"""
+    return time.time() * 1e6
+
+
+def traced(command=None):
+    """Decorate a method of a plot so that, while its ``tracer`` records,
+    each call is the "prepare" span of a command of its own, whose id the
+    messages sent meanwhile carry; calls it makes to other traced methods
+    are part of the same command
+
+    :param command: Name of the command, or a function returning it from
+                    the method's arguments; by default, the method's name
+    :type command: Optional[Union[str, function]]
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(plot, *args, **kwargs):
+            tracer = plot.tracer
+            if tracer is None or plot._trace_id is not None:
+                return method(plot, *args, **kwargs)
+            if command is None:
+                name = method.__name__
+            elif callable(command):
+                name = command(*args, **kwargs)
+            else:
+                name = command
+            plot._trace_id = tracer.next_id()
+            try:
+                with tracer.span("prepare", plot._trace_id, command=name):
+                    return method(plot, *args, **kwargs)
+            finally:
+                plot._trace_id = None
+        return wrapper
+    return decorator
+
+
+class Tracer(object):
+    """Records the spans of traced commands
+
+    :Example:
+    >>> from jupyter_sigplot.sigplot import Plot
+    >>> plot = Plot()
+    >>> tracer = plot.start_tracing()
+    >>> plot.overlay_array(range(100))
+    >>> tracer.export('overlay.trace.json')
+    """
+
+    def __init__(self):
+        self.events = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        # Thread ids of views, by view id
+        self._views = {}
+
+    def next_id(self):
+        """Return a new command id"""
+        with self._lock:
+            return next(self._ids)
+
+    @contextmanager
+    def span(self, name, command_id, **args):
+        """Record the kernel-side span of the ``with`` block
+
+        :param name: Name of the step
+        :type name: str
+
+        :param command_id: Id of the command the step belongs to
+        :type command_id: int
+        """
+        start = _now_us()
+        try:
+            yield
+        finally:
+            self._add({
+                "name": name,
+                "cat": "kernel",
+                "ph": "X",
+                "ts": start,
+                "dur": _now_us() - start,
+                "pid": os.getpid(),
+                "tid": threading.current_thread().ident,
+                "args": dict(args, command_id=command_id),
+            })
+
+    def add_view_spans(self, view, spans):
+        """Record spans reported by a view
+
+        :param view: Identifier of the view that reports them
+        :type view: str
+
+        :param spans: Dicts with the ``name`` of each step, the ``id`` of
+                      its command and its start ``ts`` and duration
+                      ``dur``, in microseconds since the epoch
+        :type spans: list(dict)
+        """
+        with self._lock:
+            tid = self._views.setdefault(view, len(self._views) + 1)
+        for span in spans:
+            self._add({
+                "name": span["name"],
+                "cat": "browser",
+                "ph": "X",
+                "ts": span["ts"],
+                "dur": span["dur"],
+                "pid": BROWSER_PID,
+                "tid": tid,
+                "args": {"command_id": span["id"], "view": view},
+            })
+
+    def _add(self, event):
+        with self._lock:
+            self.events.append(event)
+
+    def to_dict(self):
+        """Return the timeline in the Chrome trace-event format
+
+        :rtype: dict
+        """
+        with self._lock:
+            events = list(self.events)
+            views = sorted(self._views.items(), key=lambda item: item[1])
+        metadata = [
+            {"name": "process_name", "ph": "M", "pid": os.getpid(),
+             "args": {"name": "kernel"}},
+            {"name": "process_name", "ph": "M", "pid": BROWSER_PID,
+             "args": {"name": "browser"}},
+        ]
+        metadata.extend(
+            {"name": "thread_name", "ph": "M", "pid": BROWSER_PID,
+             "tid": tid, "args": {"name": "view %s" % view}}
+            for view, tid in views
+        )
+        return {"traceEvents": metadata + events, "displayTimeUnit": "ms"}
+
+    def export(self, path):
+        """Write the timeline to ``path`` as Chrome trace-event JSON
+
+        :param path: Output file name, conventionally ending in .json
+        :type path: str
+        """
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+"""Oscilloscope-style triggering of sample streams.
+
+A ``Trigger`` is fed consecutive chunks of a stream and returns only the
+frames around trigger events, so a plot of a bursty stream only needs to be
+sent those frames.
+"""
+from __future__ import absolute_import, print_function
+
+import numpy as np
+
+from .ringbuffer import RingBuffer
+
+
+"""Trigger modes accepted by ``Trigger``"""
+MODES = ("edge", "level", "threshold")
+
+"""Trigger slopes accepted by ``Trigger``"""
+SLOPES = ("rising", "falling", "both")
+
+
+class Trigger(object):
+    """Detects trigger events in a stream and cuts frames around them
+
+    :param level: Trigger level
+    :type level: float
+
+    :param mode: 'edge' fires where the signal crosses ``level``;
+                 'level' fires wherever the signal is beyond ``level``;
+                 'threshold' fires where the magnitude of the signal rises
+                 to ``level``. Complex samples are compared by their real
+                 part, except in 'threshold' mode.
+    :type mode: str
+
+    :param slope: 'rising', 'falling', or, for 'edge' mode, 'both'
+    :type slope: str
+
+    :param pre: Number of samples before the trigger in each frame
+    :type pre: int
+
+    :param post: Number of samples from the trigger on in each frame
+    :type post: int
+
+    :param holdoff: Number of samples after a trigger during which further
+                    events are ignored; defaults to the frame length, so
+                    frames do not overlap
+    :type holdoff: Optional[int]
+    """
+
+    def __init__(self, level=0.0, mode="edge", slope="rising",
+                 pre=256, post=768, holdoff=None):
+        if mode not in MODES:
+            raise ValueError("mode must be one of %s (got %r)" %
+                             (", ".join(MODES), mode))
+        if slope not in SLOPES or (slope == "both" and mode != "edge"):
+            raise ValueError("slope %r is not valid in %r mode" %
+                             (slope, mode))
+        if pre < 0 or post < 1:
+            raise ValueError("Frames need pre >= 0 and post >= 1")
+
+        self.level = level
+        self.mode = mode
+        self.slope = slope
+        self.pre = int(pre)
+        self.post = int(post)
+        self.holdoff = self.frame_size if holdoff is None else int(holdoff)
+        self.reset()
+
+    @property
+    def frame_size(self):
+        """Number of samples in each frame"""
+        return self.pre + self.post
+
+    def reset(self):
+        """Forget the stream seen so far"""
+        self._history = None
+        self._previous = None
+        self._armed_at = 0
+        self._pending = []
+
+    def _condition(self, samples):
+        if self.mode == "threshold":
+            return np.abs(samples) >= self.level
+        samples = np.real(samples)
+        if self.slope == "falling":
+            return samples <= self.level
+        return samples >= self.level
+
+    def _events(self, samples, offset):
+        """Absolute indices of the events in ``samples``, which start at
+        absolute index ``offset``, before holdoff is applied"""
+        condition = self._condition(samples)
+        if self.mode == "level":
+            return np.flatnonzero(condition) + offset
+
+        previous = np.empty_like(condition)
+        previous[1:] = condition[:-1]
+        # The first sample of a stream can't be an edge
+        previous[0] = condition[0] if self._previous is None \
+            else self._previous
+        self._previous = condition[-1]
+
+        if self.slope == "both":
+            edges = condition != previous
+        else:
+            edges = condition & ~previous
+        return np.flatnonzero(edges) + offset
+
+    def process(self, samples):
+        """Feed the next chunk of the stream
+
+        :param samples: Consecutive samples of the stream
+        :type samples: numpy.ndarray
+
+        :return: A list of (index, frame) tuples, one per trigger whose
+                 frame is now complete, oldest first; ``index`` is the
+                 absolute index of the trigger sample in the stream, which
+                 is at ``frame[pre]``
+        :rtype: list(Tuple[int, numpy.ndarray])
+        """
+        samples = np.asarray(samples).ravel()
+        if self._history is None:
+            # Room for a full frame, plus a chunk of up to a frame whose
+            # triggers may need samples from before it
+            self._history = RingBuffer(
+                2 * self.frame_size, np.result_type(samples, np.float32)
+            )
+
+        frames = []
+        for start in range(0, len(samples), self.frame_size):
+            chunk = samples[start:start + self.frame_size]
+            offset = self._history.count
+            self._history.write(chunk)
+
+            events = self._events(chunk, offset)
+            # Applying holdoff is sequential, but only over events, not over
+            # samples: skip straight to the first event past each holdoff
+            i = np.searchsorted(events, max(self._armed_at, self.pre))
+            while i < len(events):
+                self._pending.append(int(events[i]))
+                self._armed_at = events[i] + max(self.holdoff, 1)
+                i = np.searchsorted(events, self._armed_at, side="left")
+
+            count = self._history.count
+            while self._pending and self._pending[0] + self.post <= count:
+                index = self._pending.pop(0)
+                # Copied, since later chunks overwrite the history
+                frames.append((index, self._history.window(
+                    index - self.pre, self.frame_size
+                ).copy()))
+        return frames
@@ -0,0 +1,164 @@
+#!/usr/bin/env pytest
+import os
+
+import pytest
+from IPython.testing.globalipapp import get_ipython
+
+ip = get_ipython()
+
+from jupyter_sigplot import dataserver  # noqa: E402
+from jupyter_sigplot.dataserver import DataServer  # noqa: E402
+from jupyter_sigplot.sigplot import Plot  # noqa: E402
+
+try:
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+except ImportError:
+    # Python 2.x
+    from urllib2 import HTTPError, Request, urlopen
+
+
+@pytest.fixture
+def server(tmpdir):
+    tmpdir.join('data.tmp').write_binary(bytes(bytearray(range(256))) * 4)
+    server = DataServer(str(tmpdir))
+    server.start()
+    yield server
+    server.stop()
+
+
+def _get(url, method='GET', **headers):
+    request = Request(url, headers=headers)
+    request.get_method = lambda: method
+    try:
+        response = urlopen(request)
+    except HTTPError as e:
+        return e.code, e.headers, b''
+    return response.getcode(), response.headers, response.read()
+
+
+def test_parse_range():
+    cases = [
+        # header            # expected
+        ('bytes=0-99',      (0, 100)),
+        ('bytes=100-',      (100, 1000)),
+        ('bytes=-10',       (990, 1000)),
+        ('bytes=900-2000',  (900, 1000)),
+        ('bytes=0-1,5-6',   None),
+        ('items=0-1',       None),
+    ]
+    for header, expected in cases:
+        assert dataserver._parse_range(header, 1000) == expected
+    unsatisfiable = [
+        # header            # size
+        ('bytes=1000-',     1000),
+        ('bytes=-0',        1000),
+        ('bytes=0-',        0),
+        ('bytes=-10',       0),
+    ]
+    for header, size in unsatisfiable:
+        with pytest.raises(ValueError):
+            dataserver._parse_range(header, size)
+
+
+def test_get(server, tmpdir):
+    url = server.url_for(str(tmpdir.join('data.tmp')))
+    status, headers, body = _get(url)
+    assert status == 200
+    assert len(body) == 1024
+    assert headers['Accept-Ranges'] == 'bytes'
+    assert headers['Access-Control-Allow-Origin'] == '*'
+    assert headers['Cache-Control'] == 'no-cache'
+
+    status, headers, body = _get(url, 'HEAD')
+    assert status == 200
+    assert headers['Content-Length'] == '1024'
+    assert body == b''
+
+
+def test_range(server, tmpdir):
+    url = server.url_for(str(tmpdir.join('data.tmp')))
+    status, headers, body = _get(url, Range='bytes=256-259')
+    assert status == 206
+    assert headers['Content-Range'] == 'bytes 256-259/1024'
+    assert body == b'\x00\x01\x02\x03'
+
+    status, headers, _ = _get(url, Range='bytes=2048-')
+    assert status == 416
+    assert headers['Content-Range'] == 'bytes */1024'
+
+    status, headers, _ = _get(url, Range='bytes=-0')
+    assert status == 416
+    assert headers['Content-Range'] == 'bytes */1024'
+
+    # A stale If-Range gets the whole file
+    status, _, body = _get(url, Range='bytes=0-3', **{'If-Range': '"old"'})
+    assert status == 200
+    assert len(body) == 1024
+
+
+def test_range_empty(server, tmpdir):
+    tmpdir.join('empty.tmp').write_binary(b'')
+    url = server.url_for(str(tmpdir.join('empty.tmp')))
+    status, headers, _ = _get(url, Range='bytes=-10')
+    assert status == 416
+    assert headers['Content-Range'] == 'bytes */0'
+
+    status, headers, body = _get(url)
+    assert status == 200
+    assert headers['Content-Length'] == '0'
+    assert body == b''
+
+
+def test_conditional(server, tmpdir):
+    url = server.url_for(str(tmpdir.join('data.tmp')))
+    _, headers, _ = _get(url)
+    etag = headers['ETag']
+
+    status, _, body = _get(url, **{'If-None-Match': etag})
+    assert status == 304
+    assert body == b''
+    status, _, _ = _get(
+        url, **{'If-Modified-Since': headers['Last-Modified']}
+    )
+    assert status == 304
+
+    tmpdir.join('data.tmp').write_binary(b'changed')
+    os.utime(str(tmpdir.join('data.tmp')), (0, 0))
+    status, _, body = _get(url, **{'If-None-Match': etag})
+    assert status == 200
+    assert body == b'changed'
+
+
+def test_not_served(server, tmpdir):
+    tmpdir.join('sub').mkdir().join('x.tmp').write('x')
+    base = 'http://127.0.0.1:%d' % server.port
+    for path in [
+        '/%s/missing.tmp' % server.token,
+        '/wrongtoken/data.tmp',
+        '/%s/../data.tmp' % server.token,
+        '/%s/sub/%%2E%%2E/data.tmp' % server.token,
+        '/%s/' % server.token,
+    ]:
+        assert _get(base + path)[0] == 404
+    assert _get(server.url_for(str(tmpdir.join('sub', 'x.tmp'))))[0] == 200
+
+    with pytest.raises(ValueError):
+        server.url_for(str(tmpdir.dirpath('elsewhere.tmp')))
+
+
+def test_serve_data(tmpdir):
+    data_dir = str(tmpdir)
+    plot = Plot(data_dir=data_dir)
+    server = plot.serve_data()
+    try:
+        assert Plot(data_dir=data_dir).serve_data() is server
+
+        plot.overlay_array([1, 2, 3], by_reference=True)
+        url = plot.command_and_arguments['arguments'][0]
+        assert url.startswith('http://127.0.0.1:%d/' % server.port)
+        status, _, body = _get(url)
+        assert status == 200
+        assert body[:4] == b'BLUE'
+    finally:
+        server.stop()
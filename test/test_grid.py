@@ -0,0 +1,78 @@
+#!/usr/bin/env pytest
+import numpy as np
+import pytest
+from IPython.testing.globalipapp import get_ipython
+
+ip = get_ipython()
+
+from jupyter_sigplot.grid import PlotGrid  # noqa: E402
+
+
+def test_layout():
+    grid = PlotGrid(2, 3, panel_height=120, autohide_panbars=True)
+    assert len(grid) == 6
+    assert grid[1, 2] is grid[5] is list(grid)[5]
+    assert grid[1, 2].index == 5
+    assert grid.panel_options == [{'autohide_panbars': True}] * 6
+    assert grid.panel_height == 120
+    with pytest.raises(IndexError):
+        grid[2, 0]
+    with pytest.raises(ValueError):
+        PlotGrid(0, 3)
+
+
+def test_commands_routed_by_panel():
+    grid = PlotGrid(1, 2)
+    grid[1].change_settings({'ymin': -1})
+    assert grid.commands == {
+        'seq': 1,
+        'commands': [{
+            'command': 'change_settings',
+            'arguments': [{'ymin': -1}],
+            'panel': 1,
+        }],
+    }
+    assert grid[1].command_and_arguments == {
+        'command': 'change_settings',
+        'arguments': [{'ymin': -1}],
+    }
+
+
+def test_batch():
+    grid = PlotGrid(2, 2)
+    with grid.batch():
+        for i, panel in enumerate(grid):
+            panel.overlay_array(np.arange(10) * i)
+        with grid.batch():
+            grid[0].change_settings({'ymax': 10})
+        # Not sent until the outermost batch ends
+        assert grid.commands == {}
+    commands = grid.commands['commands']
+    assert grid.commands['seq'] == 1
+    assert [c['panel'] for c in commands] == [0, 1, 2, 3, 0]
+    assert [c['command'] for c in commands] == ['overlay_array'] * 4 + [
+        'change_settings'
+    ]
+    assert bytes(commands[2]['arguments'][0]) == \
+        (np.arange(10) * 2).astype(np.float32).tobytes()
+
+    # An empty batch sends nothing
+    with grid.batch():
+        pass
+    assert grid.commands['seq'] == 1
+
+
+def test_panel_tracing():
+    grid = PlotGrid(1, 2)
+    tracer = grid[1].start_tracing()
+    grid[1].overlay_array(np.arange(4))
+    assert grid.commands['commands'][0]['trace'] == 0
+
+    spans = [{'name': 'render', 'id': 0, 'ts': 1e15, 'dur': 5.0}]
+    grid._handle_custom_msg(grid, {'event': 'trace', 'panel': 1,
+                                   'view': 'c1/1', 'spans': spans}, [])
+    grid._handle_custom_msg(grid, {'event': 'trace', 'panel': 0,
+                                   'view': 'c1/0', 'spans': spans}, [])
+    browser = [e for e in tracer.events if e['cat'] == 'browser']
+    assert len(browser) == 1
+    assert browser[0]['args']['view'] == 'c1/1'
@@ -0,0 +1,56 @@
+#!/usr/bin/env pytest
+import os
+
+import numpy as np
+import pytest
+from IPython.testing.globalipapp import get_ipython
+
+ip = get_ipython()
+
+from jupyter_sigplot import bluefile, ingest  # noqa: E402
+from jupyter_sigplot.sigplot import Plot  # noqa: E402
+
+here = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(here, '..', 'example', 'data')
+files = [os.path.join(data_dir, f) for f in ('sin.tmp', 'pulse.tmp')]
+
+
+def test_reduce_minmax(tmpdir):
+    path = str(tmpdir.join('ramp.tmp'))
+    bluefile.write(path, np.arange(1000, dtype=np.float64), xdelta=0.1)
+
+    samples, overrides = ingest.reduce_file(path, 'minmax', 10)
+    assert samples.dtype == np.float32
+    assert list(samples[:4]) == [0, 99, 100, 199]
+    assert overrides == {'xstart': 0.0, 'xdelta': 5.0}
+
+    # Short files are kept as is
+    samples, overrides = ingest.reduce_file(path, 'minmax', 1000)
+    assert len(samples) == 1000
+    assert overrides['xdelta'] == 0.1
+
+
+def test_reduce_psd(tmpdir):
+    path = str(tmpdir.join('tone.tmp'))
+    t = np.arange(8192) * 1e-3
+    bluefile.write(path, np.exp(2j * np.pi * 125 * t), xdelta=1e-3)
+
+    samples, overrides = ingest.reduce_file(path, 'psd', 64)
+    assert len(samples) == 64
+    assert overrides == {'xstart': -500.0, 'xdelta': 1000.0 / 64}
+    peak = overrides['xstart'] + np.argmax(samples) * overrides['xdelta']
+    assert peak == 125
+
+
+def test_reduce_file_bad_reduction():
+    with pytest.raises(ValueError):
+        ingest.reduce_file(files[0], 'foobar')
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_overlay_files(max_workers):
+    plot = Plot()
+    plot.overlay_files('|'.join(files), size=64, max_workers=max_workers)
+    assert len(plot._layers) == 2
+    assert plot.command_and_arguments['command'] == 'overlay_array'
+    assert len(plot.command_and_arguments['arguments'][0]) == 2 * 64
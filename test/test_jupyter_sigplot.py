@@ -1,7 +1,7 @@
 #!/usr/bin/env pytest
 import os
 
-from mock import patch
+from mock import Mock, patch
 import numpy as np
 import pytest
 from IPython.testing.globalipapp import get_ipython
@@ -94,6 +94,7 @@ def test_overlay_array():
     assert plot.command_and_arguments == {
         'command': 'overlay_array',
         'arguments': [memoryview(np.array(lst, dtype=np.float32))],
+        'layer': 0,
     }
 
 
@@ -111,6 +112,7 @@ def test_overlay_array_numpy():
     assert plot.command_and_arguments == {
         'command': 'overlay_array',
         'arguments': [memoryview(lst.astype(np.float32))],
+        'layer': 0,
     }
 
 
@@ -391,7 +393,8 @@ def test_instance_level_resolver():
     assert p.path_resolvers == [to_foo]
     assert p.command_and_arguments == {
         'command': 'overlay_href',
-        'arguments': ['foo']
+        'arguments': ['foo'],
+        'layer': 0,
     }
 
     # Resolver specified after construction
@@ -401,7 +404,8 @@ def test_instance_level_resolver():
     assert p.path_resolvers == [to_foo]
     assert p.command_and_arguments == {
         'command': 'overlay_href',
-        'arguments': ['foo']
+        'arguments': ['foo'],
+        'layer': 0,
     }
 
 
@@ -516,3 +520,781 @@ def test_prepare_href_input(prepare_http_input_mock,
     )
     assert prepare_http_input_mock.call_count == 2
     assert prepare_file_input_mock.call_count == 3
+
+
+def test_static_render():
+    plot = Plot(static_render=True)
+    assert plot.plot_options == {}
+
+    plot._placeholder = Mock()
+    plot.overlay_array(np.arange(100))
+    plot.change_settings({'ymin': -1, 'ymax': 1})
+    assert plot._settings['ymin'] == -1
+    assert plot._placeholder.update.call_count == 2
+    html = plot._placeholder.update.call_args[0][0].data
+    assert html.startswith('<img alt="SigPlot plot" src="data:image/png;')
+
+    # Not rendered unless asked for
+    plot = Plot()
+    plot._placeholder = Mock()
+    plot.overlay_array(np.arange(100))
+    plot._placeholder.update.assert_not_called()
+    assert plot.to_png().startswith(b'\x89PNG')
+
+
+def test_overlay_array_by_reference(tmpdir):
+    from jupyter_sigplot import bluefile
+
+    data_dir = str(tmpdir)
+    plot = Plot(data_dir=data_dir)
+    arr = np.arange(12, dtype=np.int16).reshape(3, 4)
+    plot.overlay_array(arr, {'xdelta': 0.5}, by_reference=True)
+
+    command = plot.command_and_arguments['command']
+    href = plot.command_and_arguments['arguments'][0]
+    assert command == 'overlay_href'
+    assert os.path.dirname(href) == data_dir
+    assert os.listdir(data_dir) == [os.path.basename(href)]
+
+    header = bluefile.read_header(href)
+    assert header['format'] == 'SI'
+    assert header['xdelta'] == 0.5
+    assert header['subsize'] == 4
+    assert (bluefile.read_data(href, header) == arr.ravel()).all()
+
+    # Identical contents are written once
+    mtime = os.path.getmtime(href)
+    plot.overlay_array(arr.copy(), {'xdelta': 0.5}, by_reference=True)
+    assert plot.command_and_arguments['arguments'][0] == href
+    assert os.path.getmtime(href) == mtime
+    assert len(os.listdir(data_dir)) == 1
+
+    # ... but different header values are not identical
+    plot.overlay_array(arr, {'xdelta': 1}, by_reference=True)
+    assert len(os.listdir(data_dir)) == 2
+
+
+def test_overlay_array_by_reference_int64(tmpdir):
+    from jupyter_sigplot import bluefile
+
+    plot = Plot(data_dir=str(tmpdir), path_resolvers=[])
+    for dtype in (np.int64, np.uint64):
+        arr = np.arange(2 ** 40, 2 ** 40 + 10, dtype=dtype)
+        plot.overlay_array(arr, by_reference=True)
+        href = plot.command_and_arguments['arguments'][0]
+        # Stored as doubles, which sigplot reads, without losing precision
+        header = bluefile.read_header(href)
+        assert header['format'] == 'SD'
+        assert (bluefile.read_data(href, header) == arr).all()
+
+
+def test_prepare_file_input_deconflicts_names(tmpdir):
+    from jupyter_sigplot.sigplot import _prepare_file_input
+
+    local_dir = str(tmpdir.mkdir('data'))
+    sources = []
+    for d in ('a', 'b'):
+        f = tmpdir.mkdir(d).join('foo.tmp')
+        f.write(d)
+        sources.append(str(f))
+
+    a = _prepare_file_input(sources[0], local_dir)
+    b = _prepare_file_input(sources[1], local_dir)
+    assert a == os.path.join(local_dir, 'foo.tmp')
+    assert b == os.path.join(local_dir, 'foo_1.tmp')
+    assert open(a).read() == 'a'
+    assert open(b).read() == 'b'
+
+
+def test_prepare_file_input_manifest(tmpdir):
+    from jupyter_sigplot.sigplot import _FileManifest, _manifest_for
+
+    local_dir = str(tmpdir.mkdir('data'))
+    source = tmpdir.join('foo.tmp')
+    source.write('foo')
+
+    manifest = _manifest_for(local_dir)
+    link = manifest.prepare(str(source))
+
+    # Repeated lookups of an unchanged file don't resolve or link it again
+    with patch('os.path.realpath') as realpath_mock, \
+            patch('os.symlink') as symlink_mock:
+        assert manifest.prepare(str(source)) == link
+        realpath_mock.assert_not_called()
+        symlink_mock.assert_not_called()
+
+    # ... but a changed file is recorded again
+    source.write('foobar')
+    assert manifest.prepare(str(source)) == link
+    assert manifest.entries[os.path.realpath(str(source))]['size'] == 6
+
+    # ... and a removed link is made again
+    os.remove(link)
+    assert manifest.prepare(str(source)) == link
+    assert open(link).read() == 'foobar'
+
+    # A new session picks up the existing link from the manifest
+    assert _FileManifest(local_dir).prepare(str(source)) == link
+
+    # A stale link is replaced
+    os.remove(link)
+    os.symlink(str(tmpdir), link)
+    fresh = _FileManifest(local_dir).prepare(str(source))
+    assert fresh != link
+    assert open(fresh).read() == 'foobar'
+
+
+def test_overlay_href_progressive(tmpdir):
+    from jupyter_sigplot import bluefile
+
+    path = str(tmpdir.join('big.tmp'))
+    bluefile.write(path, np.arange(100000, dtype=np.float32), xdelta=0.5)
+    plot = Plot(data_dir=str(tmpdir), path_resolvers=[])
+    plot.progressive_size = 1000
+
+    with patch.object(Plot, 'sync_command_and_arguments') as sync_mock:
+        plot.overlay_href(path)
+    overview, href = [c[0][0] for c in sync_mock.call_args_list]
+    assert overview['command'] == 'overlay_array'
+    samples, overrides = overview['arguments']
+    assert len(samples) == 2 * 4096
+    assert overrides['xdelta'] == 0.5 * 100000 / (2 * 4096)
+    # The file replaces the overview
+    assert href == {
+        'command': 'overlay_href',
+        'arguments': [path],
+        'layer': overview['layer'],
+    }
+    assert len(plot._layers) == 1
+    assert plot._layers[0].get_envelope().hi.max() == 99999
+
+
+def _mock_download(get_mock, tmpdir):
+    from jupyter_sigplot import bluefile
+
+    source = str(tmpdir.join('source.tmp'))
+    bluefile.write(source, np.arange(100000, dtype=np.float32))
+    with open(source, 'rb') as f:
+        contents = f.read()
+    response = get_mock.return_value
+    response.headers = {'content-length': str(len(contents))}
+    response.iter_content.side_effect = lambda size: (
+        contents[i:i + size] for i in range(0, len(contents), size)
+    )
+
+
+@patch('jupyter_sigplot.sigplot._OVERVIEW_INTERVAL', 0)
+@patch('jupyter_sigplot.sigplot._PROGRESS_INTERVAL', 0)
+@patch('requests.get')
+def test_prepare_http_input_progress(get_mock, tmpdir):
+    _mock_download(get_mock, tmpdir)
+
+    data_dir = str(tmpdir.mkdir('data'))
+    plot = Plot(data_dir=data_dir)
+    plot.progressive_size = 1000
+    progress = []
+    plot.observe(lambda change: progress.append(change['new']), 'progress')
+    with patch.object(Plot, 'sync_command_and_arguments') as sync_mock:
+        plot.overlay_href('http://example.com/source.tmp')
+
+    assert progress[-1] == 1.0
+    assert progress == sorted(progress) and len(progress) > 2
+    commands = [c[0][0]['command'] for c in sync_mock.call_args_list]
+    # Overviews of the downloaded prefix, refined, then the file
+    assert commands[0] == 'overlay_array'
+    assert set(commands[1:-1]) == {'reload'}
+    assert commands[-1] == 'overlay_href'
+    assert len(set(c[0][0]['layer'] for c in sync_mock.call_args_list)) == 1
+    lengths = [
+        c[0][0]['arguments'][1]['xdelta'] * len(c[0][0]['arguments'][0])
+        for c in sync_mock.call_args_list[:-1]
+    ]
+    assert lengths == sorted(lengths)
+
+
+@patch('jupyter_sigplot.sigplot._PROGRESS_INTERVAL', 0)
+@patch('requests.get')
+def test_prepare_http_input_overview_interval(get_mock, tmpdir):
+    _mock_download(get_mock, tmpdir)
+
+    plot = Plot(data_dir=str(tmpdir.mkdir('data')))
+    plot.progressive_size = 1000
+    progress = []
+    plot.observe(lambda change: progress.append(change['new']), 'progress')
+    with patch.object(Plot, 'sync_command_and_arguments') as sync_mock:
+        plot.overlay_href('http://example.com/source.tmp')
+
+    # Progress is reported at every block, the overview refreshed less often
+    assert len(progress) > 2
+    commands = [c[0][0]['command'] for c in sync_mock.call_args_list]
+    assert commands == ['overlay_array', 'overlay_href']
+
+
+def test_memory_budget(tmpdir):
+    import warnings
+    from jupyter_sigplot.sigplot import MemoryBudgetWarning
+
+    plot = Plot(data_dir=str(tmpdir))
+    plot.memory_budget = 200000
+
+    # Within budget: sent as is
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        plot.overlay_array(np.zeros(1000))
+    assert len(plot.command_and_arguments['arguments'][0]) == 1000
+    used = plot.memory_used
+    assert used >= 8000
+
+    # Every dimension of a raster counts
+    raster = Plot()
+    raster.overlay_array(np.zeros((3, 4)), {'subsize': 4})
+    assert raster._layers[0].client_bytes == 48
+    assert raster._message_bytes == 48
+
+    # Over budget: decimated to min/max pairs that fit
+    with pytest.warns(MemoryBudgetWarning):
+        plot.overlay_array(np.arange(100000), {'xdelta': 2.0})
+    samples, overrides = plot.command_and_arguments['arguments']
+    assert len(samples) * 8 <= 200000 - used
+    assert samples[-1] == 99999
+    assert overrides['xdelta'] == 2.0 * 100000 / len(samples)
+
+    # Quantized
+    plot = Plot(data_dir=str(tmpdir))
+    plot.memory_budget = 1000000
+    plot.over_budget = 'quantize'
+    array = np.linspace(-1, 1, 150000)
+    with pytest.warns(MemoryBudgetWarning):
+        plot.overlay_array(array)
+    message = plot.command_and_arguments
+    quantized = np.frombuffer(message['arguments'][0], dtype='<i2')
+    expanded = (quantized * message['quantized']['scale'] +
+                message['quantized']['offset'])
+    assert np.abs(expanded - array).max() < 1e-4
+
+    # By reference
+    plot.over_budget = 'reference'
+    with pytest.warns(MemoryBudgetWarning):
+        plot.overlay_array(np.zeros(50000, dtype=np.float32))
+    assert plot.command_and_arguments['command'] == 'overlay_href'
+
+
+def test_memory_budget_envelopes():
+    from jupyter_sigplot.sigplot import MemoryBudgetWarning
+
+    plot = Plot()
+    plot.memory_budget = 100000
+    # The kernel keeps the layer's envelope besides the decimated samples
+    with pytest.warns(MemoryBudgetWarning):
+        plot.overlay_array(np.arange(1000000))
+    assert plot.memory_used <= plot.memory_budget
+
+    # Even decimated as far as it goes, the next layer does not fit
+    with pytest.warns(MemoryBudgetWarning) as record:
+        plot.overlay_array(np.arange(1000000))
+    assert len(record) == 2
+    assert 'still exceeds' in str(record[1].message)
+    assert plot.memory_used > plot.memory_budget
+
+
+def test_memory_budget_warning_location():
+    from jupyter_sigplot.sigplot import MemoryBudgetWarning
+
+    plot = Plot()
+    plot.memory_budget = 1000
+    calls = [
+        lambda: plot.overlay_array(np.zeros(10000)),
+        lambda: plot.overlay_array(np.zeros((2, 10000))),
+        lambda: plot.send_command('overlay_array', [np.zeros(10000)]),
+    ]
+    for tracing in (False, True):
+        if tracing:
+            plot.start_tracing()
+        for call in calls:
+            with pytest.warns(MemoryBudgetWarning) as record:
+                call()
+            # Attributed to the caller, not to the package
+            assert record[0].filename == __file__
+
+
+def test_total_memory_budget():
+    from jupyter_sigplot.sigplot import MemoryBudgetWarning
+
+    first = Plot()
+    first.overlay_array(np.zeros(10000))
+    with patch.object(Plot, 'total_memory_budget',
+                      first.memory_used + 50000):
+        second = Plot()
+        with pytest.warns(MemoryBudgetWarning):
+            second.overlay_array(np.zeros(10000))
+    assert len(second.command_and_arguments['arguments'][0]) < 10000
+
+
+def test_overlay_array_traces(tmpdir):
+    from jupyter_sigplot import bluefile
+
+    plot = Plot(data_dir=str(tmpdir))
+    array = np.arange(12).reshape(3, 4)
+    plot.overlay_array(array, {'xdelta': 0.5}, {'line': 3},
+                       traces=[{'name': 'a'}, {'name': 'b'}, {'name': 'c'}])
+
+    message = plot.command_and_arguments
+    samples, overrides, layer_options = message['arguments']
+    assert np.frombuffer(samples, dtype=np.float32).tolist() == \
+        list(range(12))
+    assert overrides == {'xdelta': 0.5}
+    assert layer_options == {'line': 3}
+    assert message['traces'] == [{'name': 'a'}, {'name': 'b'}, {'name': 'c'}]
+    assert message['layers'] == [layer.id for layer in plot._layers]
+    assert [layer.get_envelope().hi.max() for layer in plot._layers] == \
+        [3, 7, 11]
+
+    # Traces by default, unless the rows are frames of a raster
+    plot.overlay_array(array)
+    assert plot.command_and_arguments['traces'] == [{}, {}, {}]
+    plot.overlay_array(array, {'subsize': 4})
+    assert 'traces' not in plot.command_and_arguments
+    # Unless traces are asked for; each is then drawn as a trace
+    plot.overlay_array(array, {'subsize': 4, 'xdelta': 0.5}, traces=True)
+    message = plot.command_and_arguments
+    assert message['traces'] == [{}, {}, {}]
+    assert message['arguments'][1] == {'xdelta': 0.5}
+
+    with pytest.raises(ValueError):
+        plot.overlay_array(array, traces=[{}])
+
+    # By reference, a file per trace
+    with patch.object(Plot, 'sync_command_and_arguments') as sync_mock:
+        plot.overlay_array(array, {'subsize': 4}, traces=True,
+                           by_reference=True)
+    assert [c[0][0]['command'] for c in sync_mock.call_args_list] == \
+        ['overlay_href'] * 3
+    assert len(os.listdir(str(tmpdir))) == 3
+    for name in os.listdir(str(tmpdir)):
+        header = bluefile.read_header(str(tmpdir.join(name)))
+        assert header['type'] == 1000
+
+
+def test_get_or_create(tmpdir):
+    path = str(tmpdir.join('input.tmp'))
+    with open(path, 'wb') as f:
+        f.write(b'0' * 16)
+    data_dir = str(tmpdir.mkdir('data'))
+    plot = Plot.get_or_create('test_get_or_create', data_dir, ymin=-1)
+    assert plot.plot_options == {'ymin': -1}
+    with patch.object(Plot, 'sync_command_and_arguments') as sync_mock:
+        plot.overlay_array([1, 2, 3])
+        plot.overlay_array([[1, 2], [3, 4]])
+        plot.overlay_array([4, 5, 6])
+        plot.overlay_array([7, 8], by_reference=True)
+        plot.overlay_href(path)
+        plot.add_markers([1], [1])
+    first_ids = [layer.id for layer in plot._layers]
+    assert len(first_ids) == 6
+    # Every layer is created under its id, by which the client removes it
+    sent_ids = []
+    for c in sync_mock.call_args_list[:-1]:
+        message = c[0][0]
+        sent_ids += message.get('layers', [message.get('layer')])
+    assert sent_ids == first_ids
+
+    # The cell runs again, with one array changed and one dropped
+    with patch.object(Plot, 'sync_command_and_arguments') as sync_mock:
+        again = Plot.get_or_create('test_get_or_create', data_dir, ymin=-2)
+        assert again is plot
+        assert plot.plot_options == {'ymin': -2}
+        plot.overlay_array([[1, 2], [3, 4]])
+        plot.overlay_href(path)
+        plot.overlay_array([1, 2, 3])
+        plot.overlay_array([4, 5, 7])
+        ip.events.trigger('post_run_cell', None)
+    messages = [c[0][0] for c in sync_mock.call_args_list]
+    assert [m['command'] for m in messages] == [
+        'clear_markers', 'overlay_array', 'remove_layer', 'remove_layer',
+    ]
+    assert [m['layer'] for m in messages[2:]] == first_ids[3:5]
+    assert [layer.id for layer in plot._layers] == \
+        first_ids[:3] + first_ids[5:] + [6]
+
+    # Other keys get plots of their own
+    assert Plot.get_or_create('test_get_or_create_other') is not plot
+    # Closed plots are replaced
+    plot.close()
+    assert Plot.get_or_create('test_get_or_create') is not plot
+
+
+def test_get_or_create_unkeyed_layers():
+    key = 'test_get_or_create_unkeyed_layers'
+    plot = Plot.get_or_create(key)
+    plot.overlay_xy([1, 2, 3], [4, 5, 6])
+    plot.overlay_array([1, 2, 3])
+    plot.push(np.zeros(4))
+    xy, array, live = plot._layers
+    ip.events.trigger('post_run_cell', None)
+
+    # Layers made without a digest are not reused, nor mistaken for any
+    with patch.object(Plot, 'sync_command_and_arguments') as sync_mock:
+        assert Plot.get_or_create(key) is plot
+        plot.overlay_array([1, 2, 3])
+        plot.overlay_xy([1, 2, 3], [4, 5, 6])
+        ip.events.trigger('post_run_cell', None)
+    messages = [c[0][0] for c in sync_mock.call_args_list]
+    assert [m['command'] for m in messages] == [
+        'overlay_xy', 'remove_layer', 'remove_layer',
+    ]
+    assert [m['layer'] for m in messages[1:]] == [xy.id, live.id]
+    assert plot._layers[0] is array
+    plot.close()
+
+
+def test_overlay_table():
+    plot = Plot()
+    t = np.arange(0.0, 1.0, 0.25)
+    volts = np.array([1.0, 2.0, 3.0, 4.0])
+    table = {
+        'time': t,
+        'volts': volts,
+        'count': np.array([5, 6, 7, 8], dtype=np.int64),
+        'flag': np.array([True, False, True, False]),
+    }
+    plot.overlay_table(table, x='time', layer_options={'line': 3})
+
+    message = plot.command_and_arguments
+    assert message['command'] == 'overlay_table'
+    assert message['columns'] == [
+        {'name': 'volts', 'dtype': '<f8'},
+        {'name': 'count', 'dtype': '<f8'},
+        {'name': 'flag', 'dtype': '|u1'},
+    ]
+    buffers, overrides, layer_options = message['arguments']
+    assert overrides == {'xstart': 0.0, 'xdelta': 0.25}
+    assert layer_options == {'line': 3}
+    # Contiguous columns are sent without a copy
+    assert np.shares_memory(np.frombuffer(buffers[0], dtype='<f8'), volts)
+    assert message['layers'] == [layer.id for layer in plot._layers]
+    assert plot._message_bytes == 8 * 4 + 8 * 4 + 4
+    assert [layer.get_envelope().hi.max() for layer in plot._layers] == \
+        [4, 8, 1]
+
+    plot.overlay_table(table, y='volts')
+    assert plot.command_and_arguments['arguments'][1] == {}
+    assert len(plot.command_and_arguments['columns']) == 1
+
+    with pytest.raises(ValueError):
+        # Unevenly spaced abscissas
+        plot.overlay_table({'x': np.array([0, 1, 3]), 'y': np.zeros(3)},
+                           x='x')
+    with pytest.raises(KeyError):
+        plot.overlay_table(table, y=['missing'])
+    with pytest.raises(TypeError):
+        plot.overlay_table({'s': np.array(['a', 'b'])})
+
+
+def test_close():
+    from jupyter_sigplot.sigplot import _plots
+
+    with Plot() as plot:
+        placeholder = plot._placeholder = Mock()
+        plot.overlay_array(np.arange(100))
+        plot.push(np.zeros(10))
+        assert plot.memory_used > 0
+    assert plot.closed
+    assert plot.done
+    assert plot.comm is None
+    assert plot.memory_used == 0
+    assert plot._layers == [] and plot._live_layers == {}
+    assert plot not in _plots
+    placeholder.update.assert_called_once()
+    assert placeholder.update.call_args[0][0].data == ""
+
+    for command in [lambda: plot.overlay_array([1, 2]),
+                    lambda: plot.push(np.zeros(10)),
+                    lambda: plot.overlay_files([]),
+                    lambda: plot.clear_markers()]:
+        with pytest.raises(ValueError):
+            command()
+    # Closing again does nothing
+    plot.close()
+
+
+@patch('jupyter_sigplot.sigplot._PROGRESS_INTERVAL', 0)
+@patch('requests.get')
+def test_close_cancels_download(get_mock, tmpdir):
+    from jupyter_sigplot.sigplot import DownloadCancelled
+
+    data_dir = tmpdir.mkdir('data')
+    plot = Plot(data_dir=str(data_dir))
+    blocks = []
+
+    def iter_content(size):
+        for i in range(10):
+            blocks.append(i)
+            if i == 2:
+                # e.g., from another thread
+                plot.close()
+            yield b'\0' * size
+
+    response = get_mock.return_value
+    response.headers = {'content-length': str(10 * 64 * 1024)}
+    response.iter_content.side_effect = iter_content
+    with pytest.raises(DownloadCancelled):
+        plot.overlay_href('http://example.com/big.tmp')
+    assert len(blocks) == 3
+    response.close.assert_called_once_with()
+    assert data_dir.listdir() == []
+
+
+def test_link_plots():
+    from jupyter_sigplot.sigplot import link_plots, unlink_plots
+
+    plots = [Plot(), Plot(), Plot()]
+    group = link_plots(plots[:2], axes='xy')
+    assert plots[0].link == plots[1].link == {'group': group, 'axes': 'xy'}
+    assert plots[2].link == {}
+    assert link_plots(plots[1:], axes='x') != group
+    assert plots[1].link == plots[2].link
+    unlink_plots(plots)
+    assert all(plot.link == {} for plot in plots)
+    with pytest.raises(ValueError):
+        link_plots(plots, axes='z')
+
+    ranges = []
+    plots[0].observe(lambda change: ranges.append(change['new']),
+                     'view_range')
+    plots[0]._handle_custom_msg(plots[0], {
+        'event': 'view', 'xmin': 1, 'xmax': 2, 'ymin': -1, 'ymax': 1,
+        'level': 1,
+    }, [])
+    assert ranges == [{'xmin': 1, 'xmax': 2, 'ymin': -1, 'ymax': 1}]
+
+
+def test_snapshot_from_view():
+    plot = Plot()
+    plot._placeholder = Mock()
+    image = 'data:image/png;base64,iVBORw0KGgo='
+    plot._handle_custom_msg(plot, {'event': 'snapshot', 'image': image}, [])
+    plot._placeholder.update.assert_called_once()
+    html = plot._placeholder.update.call_args[0][0].data
+    assert html == '<img alt="SigPlot plot" src="%s" width="100%%">' % image
+
+    # Only PNG data URLs are shown
+    for image in ['javascript:alert(1)', 'data:image/png;base64,"><script>',
+                  None]:
+        plot._handle_custom_msg(plot, {'event': 'snapshot', 'image': image},
+                                [])
+    assert plot._placeholder.update.call_count == 1
+
+
+def test_scene_for_new_view():
+    plot = Plot(autohide_panbars=True, path_resolvers=[])
+    plot.change_settings({'ymin': -1})
+    plot.overlay_array(np.arange(100000, dtype=np.float32), {}, {'name': 'a'})
+    plot.send_command('overlay_array', [np.ones((2, 10))],
+                      traces=[{'name': 'I'}, {'name': 'Q'}])
+    plot.add_markers([1, 2], [3, 4], group='peaks')
+    plot.add_markers([5], [6], group='peaks', replace=True)
+    plot.add_markers([7], [8], group='other')
+    plot.clear_markers('other')
+    plot.stream_updates = 'delta'
+    plot.push(np.arange(10))
+
+    plot._handle_custom_msg(plot, {'event': 'scene'}, [])
+    message = plot.command_and_arguments
+    assert message['command'] == 'scene'
+    scene = message['arguments'][0]
+    assert [cmd['command'] for cmd in scene] == [
+        'change_settings', 'overlay_array', 'overlay_array', 'overlay_array',
+        'overlay_pipe', 'push', 'add_markers',
+    ]
+    assert scene[0]['arguments'] == [{'autohide_panbars': True, 'ymin': -1}]
+
+    # Layers keep their ids and options; inline data is reduced to its
+    # envelope, which draws over the same abscissas
+    layers = [layer.id for layer in plot._layers]
+    assert [cmd.get('layer') for cmd in scene[1:6]] == \
+        layers[:3] + layers[3:] * 2
+    big = scene[1]['arguments']
+    assert big[2] == {'name': 'a'}
+    samples = np.frombuffer(big[0], dtype=np.float32)
+    assert len(samples) < 100000
+    assert samples.min() == 0 and samples.max() == 99999
+    assert big[1]['xstart'] == 0
+    assert big[1]['xdelta'] * len(samples) == pytest.approx(100000, rel=1e-3)
+    assert [cmd['arguments'][2] for cmd in scene[2:4]] == \
+        [{'name': 'I'}, {'name': 'Q'}]
+    np.testing.assert_array_equal(
+        np.frombuffer(scene[2]['arguments'][0], dtype=np.float32),
+        np.ones(10)
+    )
+
+    # Live layers come with their current samples
+    np.testing.assert_array_equal(
+        np.frombuffer(scene[5]['arguments'][0], dtype=np.float32),
+        np.arange(10)
+    )
+    assert scene[6]['arguments'][0]['count'] == 1
+    assert plot._message_bytes == sum(
+        arg.nbytes for cmd in scene for arg in cmd['arguments']
+        if isinstance(arg, memoryview)
+    )
+
+
+def test_scene_by_reference(tmpdir):
+    plot = Plot(data_dir=str(tmpdir), path_resolvers=[])
+    plot.overlay_array(np.arange(10), by_reference=True)
+    plot._handle_custom_msg(plot, {'event': 'scene'}, [])
+    (cmd,) = plot.command_and_arguments['arguments'][0]
+    assert cmd['command'] == 'overlay_href'
+    assert cmd['layer'] == plot._layers[0].id
+    assert os.path.exists(os.path.join(str(tmpdir), cmd['arguments'][0]))
+
+
+def test_overlay_xy():
+    plot = Plot(path_resolvers=[])
+    t = 10 ** 18 + np.cumsum(np.random.randint(1, 1000, 100000))
+    y = np.random.randn(len(t))
+    plot.overlay_xy(t, y, layer_options={'name': 'v'}, bins=1000)
+
+    message = plot.command_and_arguments
+    assert message['command'] == 'overlay_xy'
+    assert message['dtypes'] == ['<i8', '<f4']
+    x_sent = np.frombuffer(message['arguments'][0], dtype='<i8')
+    y_sent = np.frombuffer(message['arguments'][1], dtype='<f4')
+    assert len(x_sent) == len(y_sent) <= 2000
+    assert set(x_sent) <= set(t)
+    assert y_sent.max() == np.float32(y.max())
+    assert y_sent.min() == np.float32(y.min())
+    assert message['arguments'][3] == {'name': 'v'}
+    assert message['layer'] == plot._layers[0].id
+    # Drawn as points by the layer itself; other layers are left alone
+    assert 'cmode' not in plot._settings
+
+    # Few points are sent as they are, with float abscissas
+    plot.overlay_xy([0, 0.5, 3], [1, 2, 3])
+    x_sent = np.frombuffer(plot.command_and_arguments['arguments'][0],
+                           dtype='<f8')
+    assert list(x_sent) == [0, 0.5, 3]
+
+    # The scene redraws the layer from its envelope, still as points
+    plot._handle_custom_msg(plot, {'event': 'scene'}, [])
+    scene = plot.command_and_arguments['arguments'][0]
+    assert [cmd['command'] for cmd in scene] == ['overlay_xy', 'overlay_xy']
+    assert plot.to_png().startswith(b'\x89PNG')
+
+    with pytest.raises(ValueError):
+        plot.overlay_xy([1, 0], [1, 2])
+    with pytest.raises(ValueError):
+        plot.overlay_xy([0, 1], [1, 2, 3])
+
+
+def test_overlay_pipeline():
+    from jupyter_sigplot.pipeline import Source, bandpass, mag_db
+
+    plot = Plot(path_resolvers=[])
+    plot.pipeline_bins = 100
+    band = bandpass(0.05, 0.1)
+    source = Source(np.random.randn(10 ** 5), xdelta=0.01)
+    plot.overlay_array(source.pipe(band, mag_db()), {}, {'name': 'band'})
+
+    message = plot.command_and_arguments
+    assert message['command'] == 'overlay_array'
+    assert message['arguments'][2] == {'name': 'band'}
+    assert len(message['arguments'][0]) == 200
+    layer = plot._layers[0]
+    assert message['layer'] == layer.id
+
+    # Zooming in evaluates the range shown, at the same resolution
+    plot._handle_custom_msg(plot, {
+        'event': 'view', 'xmin': 100, 'xmax': 110, 'ymin': 0, 'ymax': 1,
+        'level': 1,
+    }, [])
+    message = plot.command_and_arguments
+    assert message['command'] == 'reload'
+    assert message['layer'] == layer.id
+    assert message['arguments'][1]['xstart'] == pytest.approx(100)
+    assert len(message['arguments'][0]) == 200
+
+    # So does changing a parameter
+    band.update(high=0.2)
+    assert plot.command_and_arguments['arguments'][1]['xstart'] == \
+        pytest.approx(100)
+
+    # Unzoomed, the whole source
+    plot._handle_custom_msg(plot, {
+        'event': 'view', 'xmin': 100, 'xmax': 110, 'ymin': 0, 'ymax': 1,
+        'level': 0,
+    }, [])
+    assert plot.command_and_arguments['arguments'][1]['xstart'] == 0
+    assert plot.to_png().startswith(b'\x89PNG')
+
+    # Neither a removed layer nor a closed plot stays reachable from the
+    # operators
+    second = Plot.get_or_create('test_overlay_pipeline')
+    second.overlay_array(source.pipe(band))
+    ip.events.trigger('post_run_cell', None)
+    assert Plot.get_or_create('test_overlay_pipeline') is second
+    ip.events.trigger('post_run_cell', None)
+    assert second._layers == []
+    assert len(band._listeners) == 1
+
+    plot.close()
+    assert band._listeners == []
+    with patch.object(Plot, 'sync_command_and_arguments') as sync_mock:
+        band.update(high=0.3)
+    assert not sync_mock.called
+    second.close()
+
+
+def test_subscribe():
+    import time
+    import uuid
+    from jupyter_sigplot import sharedstream
+    if sharedstream.shared_memory is None:
+        pytest.skip("needs multiprocessing.shared_memory")
+
+    name = 'sigplot-test-%s' % uuid.uuid4().hex[:12]
+    with sharedstream.StreamProducer(name, capacity=10000,
+                                     xdelta=0.1) as producer:
+        producer.write(np.arange(5000))
+        plot = Plot(path_resolvers=[])
+        plot.pipeline_bins = 100
+        subscription = plot.subscribe(name, fps=100, window=1000)
+        deadline = time.time() + 5
+        while plot.command_and_arguments.get('command') != 'overlay_array' \
+                and time.time() < deadline:
+            time.sleep(0.01)
+        message = plot.command_and_arguments
+        subscription.stop()
+
+        # Stopping removes the stream's layer
+        assert plot.command_and_arguments == {
+            'command': 'remove_layer', 'arguments': [],
+            'layer': subscription.layer.id,
+        }
+        assert subscription.layer not in plot._layers
+        assert message['command'] == 'overlay_array'
+        assert message['layer'] == subscription.layer.id
+        samples = np.frombuffer(message['arguments'][0], dtype=np.float32)
+        assert len(samples) == 200
+        assert samples.min() == 4000 and samples.max() == 4999
+        assert message['arguments'][1]['xstart'] == pytest.approx(400)
+
+        # Nothing new, nothing sent
+        assert not subscription.poll()
+        producer.write(np.arange(5000, 5500))
+        assert subscription.stopped and not subscription.poll()
+
+        subscription = plot.subscribe(name, fps=1e-3, window=1000)
+        assert subscription.poll()
+        assert plot.command_and_arguments['command'] == 'overlay_array'
+        assert np.frombuffer(plot.command_and_arguments['arguments'][0],
+                             dtype=np.float32).max() == 5499
+
+        # Subscribing again replaces the subscription and its layer
+        again = plot.subscribe(name, fps=1e-3, window=1000)
+        assert subscription.stopped
+        assert [layer.id for layer in plot._layers] == [again.layer.id]
+        subscription = again
+        plot.close()
+        assert subscription.stopped
+        assert not plot._subscriptions
@@ -0,0 +1,81 @@
+#!/usr/bin/env pytest
+import numpy as np
+import pytest
+from IPython.testing.globalipapp import get_ipython
+
+ip = get_ipython()
+
+from jupyter_sigplot.markers import encode_markers  # noqa: E402
+from jupyter_sigplot.sigplot import Plot  # noqa: E402
+
+
+def decode(meta, buffer):
+    """Python mirror of ``decode_markers`` in js/src/utils.js"""
+    n = meta['count']
+    buffer = buffer.tobytes()
+    x = np.frombuffer(buffer, '<f8', n, 0)
+    y = np.frombuffer(buffer, '<f8', n, 8 * n)
+    offsets = np.frombuffer(buffer, '<u4', n + 1, 16 * n)
+    styles = np.frombuffer(buffer, '<u2', n, 20 * n + 4)
+    blob = buffer[22 * n + 4:]
+    assert len(blob) == offsets[-1]
+    labels = [blob[offsets[i]:offsets[i + 1]].decode('utf-8')
+              for i in range(n)]
+    return x, y, labels, [meta['styles'][i] for i in styles]
+
+
+def test_encode_markers():
+    styles = [{'color': 'red'}, {'color': 'blue'}, {'color': 'red'}]
+    meta, buffer = encode_markers(
+        [1, 2, 3], np.array([4, 5, 6], dtype=np.int8),
+        labels=['a', u'été', ''], styles=styles,
+    )
+    assert meta == {
+        'count': 3,
+        'styles': [{'color': 'red'}, {'color': 'blue'}],
+        'labels': True,
+    }
+    x, y, labels, decoded_styles = decode(meta, buffer)
+    assert list(x) == [1, 2, 3]
+    assert list(y) == [4, 5, 6]
+    assert labels == ['a', u'été', '']
+    assert decoded_styles == styles
+
+
+def test_encode_markers_defaults():
+    meta, buffer = encode_markers(np.arange(10000), np.zeros(10000),
+                                  labels='peak', styles={'color': 'red'})
+    assert meta['styles'] == [{'color': 'red'}]
+    x, y, labels, styles = decode(meta, buffer)
+    assert len(x) == 10000
+    assert set(labels) == {'peak'}
+
+    meta, buffer = encode_markers([], [])
+    assert meta == {'count': 0, 'styles': [{}], 'labels': False}
+
+
+def test_encode_markers_bad_lengths():
+    for kwargs in [
+        {'x': [1, 2], 'y': [1]},
+        {'x': [1, 2], 'y': [1, 2], 'labels': ['a']},
+        {'x': [1, 2], 'y': [1, 2], 'styles': [{}]},
+    ]:
+        with pytest.raises(ValueError):
+            encode_markers(**kwargs)
+
+
+def test_add_and_clear_markers():
+    plot = Plot()
+    plot.add_markers([1, 2], [3, 4], group='peaks', replace=True)
+    command = plot.command_and_arguments
+    assert command['command'] == 'add_markers'
+    meta, buffer = command['arguments']
+    assert meta['group'] == 'peaks'
+    assert meta['replace']
+    assert isinstance(buffer, memoryview)
+
+    plot.clear_markers()
+    assert plot.command_and_arguments == {
+        'command': 'clear_markers',
+        'arguments': [None],
+    }
@@ -0,0 +1,92 @@
+#!/usr/bin/env pytest
+import numpy as np
+
+from jupyter_sigplot.pipeline import (
+    Operator, Source, bandpass, detrend, mag_db, magnitude
+)
+
+
+def test_evaluates_only_the_range_shown():
+    calls = []
+
+    def record(block):
+        calls.append(len(block))
+        return block * 2
+
+    source = Source(np.arange(10 ** 6, dtype=np.float32), xstart=100,
+                    xdelta=0.5)
+    pipeline = source.pipe(Operator(record))
+    pipeline.block_size = 1000
+
+    samples, overrides = pipeline.evaluate(xmin=200, xmax=299.5, bins=1000)
+    # Samples 200 to 399, all in the first block of 1000 samples
+    assert sum(calls) == 1000
+    np.testing.assert_array_equal(samples, 2 * np.arange(200, 400))
+    assert overrides == {'xstart': 200, 'xdelta': 0.5}
+
+    # Cached
+    pipeline.evaluate(xmin=200, xmax=299.5, bins=1000)
+    assert sum(calls) == 1000
+
+    # Reduced to the resolution of the plot, keeping extrema
+    samples, overrides = pipeline.evaluate(xmin=200, xmax=1199.5, bins=100)
+    assert len(samples) == 200
+    assert samples.min() == 400 and samples.max() == 2 * 2199
+    assert overrides['xdelta'] == 0.5 * 2000 / 100 / 2
+
+
+def test_long_ranges_in_strips():
+    pipeline = Source(np.arange(10 ** 6)).pipe(magnitude())
+    pipeline.max_samples = 10000
+    samples, overrides = pipeline.evaluate(bins=100)
+    assert len(samples) == 200
+    assert samples[0] == 0 and samples[-2] == 990000
+    assert overrides['xdelta'] == 10 ** 6 / 100 / 2
+
+
+def test_update_recomputes():
+    band = bandpass(0.0, 0.1)
+    pipeline = Source(np.random.randn(1000)).pipe(band, mag_db())
+    changes = []
+    pipeline.on_change(lambda: changes.append(True))
+    before, _ = pipeline.evaluate()
+    band.update(high=0.4)
+    assert changes == [True]
+    after, _ = pipeline.evaluate()
+    assert not np.allclose(before, after)
+
+
+def test_off_change():
+    band = bandpass(0.0, 0.1)
+    pipeline = Source(np.random.randn(1000)).pipe(band)
+    changes = []
+    callback = lambda: changes.append(True)  # noqa: E731
+    pipeline.on_change(callback)
+    before, _ = pipeline.evaluate()
+    pipeline.off_change(callback)
+    assert band._listeners == []
+
+    # Unobserved changes still reach evaluations
+    band.update(high=0.4)
+    assert changes == []
+    after, _ = pipeline.evaluate()
+    assert not np.allclose(before, after)
+
+
+def test_operators():
+    tone = np.cos(2 * np.pi * 0.25 * np.arange(4000))
+    dc = np.ones(4000)
+    # Blocks are evaluated with margins, so they join up seamlessly
+    pipeline = Source(tone + dc).pipe(bandpass(0.2, 0.3))
+    pipeline.block_size = 1000
+    samples, _ = pipeline.evaluate(bins=4000)
+    np.testing.assert_allclose(samples[200:-200], tone[200:-200], atol=1e-2)
+
+    samples, _ = Source(np.arange(100.0) + 5).pipe(detrend(11)).evaluate()
+    np.testing.assert_allclose(samples[5:-5], 0, atol=1e-5)
+
+    samples, _ = Source(np.array([1, 10, 0])).pipe(mag_db(-50)).evaluate()
+    np.testing.assert_allclose(samples, [0, 20, -50])
+
+    samples, _ = Source(np.array([3 + 4j])).pipe().evaluate()
+    assert list(samples) == [5]
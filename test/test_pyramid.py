@@ -0,0 +1,158 @@
+#!/usr/bin/env pytest
+import os
+
+import numpy as np
+import pytest
+from mock import patch
+from IPython.testing.globalipapp import get_ipython
+
+ip = get_ipython()
+
+from jupyter_sigplot import bluefile, ingest, pyramid, render  # noqa: E402
+from jupyter_sigplot.pyramid import Pyramid  # noqa: E402
+from jupyter_sigplot.sigplot import Plot  # noqa: E402
+
+
+def _write(path, data, mtime):
+    bluefile.write(path, data, xstart=1.0, xdelta=0.5)
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def noise():
+    return np.random.RandomState(0).randn(2 ** 17 + 100).astype(np.float32)
+
+
+def test_levels(tmpdir, noise):
+    path = str(tmpdir.join('noise.tmp'))
+    _write(path, noise, 1000)
+
+    pyr = Pyramid.open(path)
+    assert os.path.exists(pyramid.sidecar_path(path))
+    assert pyr.samples == len(noise)
+    assert [len(level) for level in pyr.levels] == [2049, 256]
+
+    blocks = noise[:2 ** 17].reshape(-1, 512)
+    assert np.array_equal(pyr.levels[1][:, 0], blocks.min(axis=1))
+    assert np.array_equal(pyr.levels[1][:, 1], blocks.max(axis=1))
+
+
+def test_envelope(tmpdir, noise):
+    path = str(tmpdir.join('noise.tmp'))
+    _write(path, noise, 1000)
+    pyr = Pyramid.open(path)
+
+    # The whole file resolves to the coarsest level, plus the tail, reduced
+    # to the bins asked for; the tail counts for the samples it spans
+    lo, hi, first, per_bin = pyr.envelope(bins=200)
+    assert (first, per_bin) == (0, len(noise) / 200.0)
+    assert len(lo) == 200
+    assert lo.min() == noise.min() and hi.max() == noise.max()
+
+    # A zoomed range reads a finer level
+    lo, hi, first, per_bin = pyr.envelope(1000, 20000, bins=100)
+    assert (first, per_bin) == (960, (20032 - 960) / 100.0)
+    assert len(lo) == 100
+    assert hi[0] == noise[960:1152].max()
+    assert hi.max() == noise[960:20032].max()
+
+    # Too short for any level: read from the file
+    lo, hi, first, per_bin = pyr.envelope(100, 200, bins=100)
+    assert (first, per_bin) == (100, 1)
+    assert np.array_equal(lo, noise[100:200])
+
+
+def test_reuse(tmpdir, noise):
+    path = str(tmpdir.join('noise.tmp'))
+    _write(path, noise, 1000)
+    Pyramid.open(path)
+
+    with patch.object(pyramid, '_scan') as scan:
+        assert Pyramid.open(path).samples == len(noise)
+    assert not scan.called
+
+
+def test_growth(tmpdir, noise):
+    path = str(tmpdir.join('noise.tmp'))
+    _write(path, noise[:50000], 1000)
+    Pyramid.open(path)
+
+    _write(path, noise, 2000)
+    with patch.object(pyramid, '_scan', wraps=pyramid._scan) as scan:
+        pyr = Pyramid.open(path)
+    # Only the samples after the last complete block are scanned
+    scan.assert_called_once()
+    assert scan.call_args[0][1:] == (49984, 2 ** 17 + 64)
+
+    fresh = str(tmpdir.join('fresh.tmp'))
+    _write(fresh, noise, 2000)
+    expected = Pyramid.open(fresh)
+    for level, other in zip(pyr.levels, expected.levels):
+        assert np.array_equal(level, other)
+
+
+def test_invalidation(tmpdir, noise):
+    path = str(tmpdir.join('noise.tmp'))
+    _write(path, noise, 1000)
+    Pyramid.open(path)
+
+    # Same size, but rewritten
+    _write(path, -noise, 2000)
+    pyr = Pyramid.open(path)
+    assert pyr.levels[0][0, 1] == (-noise[:64]).max()
+
+    # Truncated
+    _write(path, noise[:1000], 3000)
+    assert len(Pyramid.open(path).levels[0]) == 15
+
+
+def test_type_2000(tmpdir):
+    path = str(tmpdir.join('raster.tmp'))
+    bluefile.write(path, np.zeros(32, dtype=np.float32), subsize=8)
+    with pytest.raises(ValueError):
+        Pyramid.open(path)
+
+
+def test_file_envelope(tmpdir, noise):
+    path = str(tmpdir.join('noise.tmp'))
+    _write(path, noise, 1000)
+
+    env = render.file_envelope(path, size=200, pyramid=True)
+    assert (env.xstart, env.xdelta) == (1.0, 0.5 * len(noise) / 200)
+    assert env.hi.max() == noise.max()
+
+
+def test_reduce_file(tmpdir, noise):
+    path = str(tmpdir.join('noise.tmp'))
+    _write(path, noise, 1000)
+
+    samples, overrides = ingest.reduce_file(path, 'minmax', 200, True)
+    assert len(samples) == 2 * 200
+    assert overrides == {'xstart': 1.0, 'xdelta': 0.25 * len(noise) / 200}
+    assert samples.max() == noise.max()
+
+
+def test_overlay_files(tmpdir, noise):
+    archive = tmpdir.mkdir('archive')
+    path = str(archive.join('noise.tmp'))
+    _write(path, noise, 1000)
+    data_dir = str(tmpdir.mkdir('data'))
+
+    plot = Plot(data_dir=data_dir, pyramids=True, path_resolvers=[])
+    plot.overlay_files([path], size=200)
+    assert os.path.exists(os.path.join(data_dir, 'noise.tmp.pyr'))
+    assert not os.path.exists(pyramid.sidecar_path(path))
+    assert len(plot.command_and_arguments['arguments'][0]) == \
+        2 * plot.pipeline_bins
+
+    # Zooming reads the range shown from the pyramid
+    plot._handle_custom_msg(
+        plot, {'event': 'view', 'xmin': 1000.0, 'xmax': 3000.0, 'level': 1},
+        []
+    )
+    message = plot.command_and_arguments
+    assert message['command'] == 'reload'
+    samples, overrides = message['arguments']
+    assert overrides['xstart'] <= 1000.0
+    assert overrides['xstart'] + len(samples) * overrides['xdelta'] >= 3000.0
+    assert max(samples) == noise[1998:5999].max()
@@ -0,0 +1,112 @@
+#!/usr/bin/env pytest
+import os
+import struct
+
+import numpy as np
+
+from jupyter_sigplot import render
+from jupyter_sigplot.decimate import minmax, strips, xminmax
+
+here = os.path.dirname(os.path.abspath(__file__))
+data_dir = os.path.join(here, '..', 'example', 'data')
+
+
+def test_minmax():
+    lo, hi = minmax(np.array([1, 5, 2, 0, 3, 3, np.nan, 7]), 4)
+    assert list(lo) == [1, 0, 3, 7]
+    assert list(hi) == [5, 2, 3, 7]
+
+    # Nothing to reduce
+    y = np.arange(3)
+    lo, hi = minmax(y, 10)
+    assert lo is y and hi is y
+
+
+def test_layer_envelope_preserves_extrema():
+    y = np.zeros(10 ** 6, dtype=np.float32)
+    y[123457] = 5
+    y[876543] = -3
+    env = render.layer_envelope(y, xstart=10, xdelta=0.5, size=1000)
+    assert len(env.lo) == len(env.hi) == 1000
+    assert env.xstart == 10
+    assert env.xdelta == 0.5 * 1000
+    assert env.hi.max() == 5
+    assert env.lo.min() == -3
+
+
+def test_layer_envelope_subsize():
+    rows = np.array([[0, 1, 2], [3, -1, 5]])
+    env = render.layer_envelope(rows, subsize=3)
+    assert list(env.lo) == [0, -1, 2]
+    assert list(env.hi) == [3, 1, 5]
+
+
+def test_file_envelope():
+    env = render.file_envelope(os.path.join(data_dir, 'penny.prm'))
+    # penny.prm is a type 2000 file with a subsize of 128
+    assert len(env.lo) == 128
+
+
+def test_render_png():
+    envs = [
+        render.layer_envelope(np.sin(np.arange(10 ** 5) / 100.)),
+        render.layer_envelope([1, 2, 3]),
+    ]
+    png = render.render_png(envs, 320, 200)
+    assert png.startswith(b'\x89PNG\r\n\x1a\n')
+    width, height = struct.unpack('>II', png[16:24])
+    assert (width, height) == (320, 200)
+
+    image = render.rasterize(envs, 320, 200)
+    # Every column is covered by the first layer
+    assert (image != 0).any(axis=2).any(axis=0).all()
+
+
+def test_rasterize_empty():
+    image = render.rasterize([], 10, 5)
+    assert image.shape == (5, 10, 3)
+    assert not image.any()
+
+
+def test_strips():
+    y = np.arange(10000.0)
+    lo, hi = strips(y, 10, width=4)
+    assert list(lo) == list(range(0, 10000, 1000))
+    assert list(hi) == list(range(3, 10000, 1000))
+
+    # Short inputs are reduced exactly
+    lo, hi = strips(y[:30], 10, width=4)
+    assert (list(lo), list(hi)) == (list(range(0, 30, 3)),
+                                    list(range(2, 30, 3)))
+
+
+def test_xminmax_bins_by_x_range():
+    # Dense bursts between sparse points: blocks of equal numbers of points
+    # would lump the sparse points together
+    x = np.concatenate([np.linspace(0, 1, 10000), [50, 60, 70],
+                        np.linspace(99, 100, 10000)])
+    y = np.zeros(len(x))
+    y[1234] = 7
+    y[10001] = -2
+    y[-10] = np.nan
+    keep = xminmax(x, y, 100)
+    assert len(keep) <= 200
+    assert (np.diff(keep) > 0).all()
+    # Every sparse point and every extremum is kept
+    assert {1234, 10000, 10001, 10002} <= set(keep)
+    assert y[keep].max() == 7 and np.nanmin(y[keep]) == -2
+
+    # Few enough points are all kept
+    assert list(xminmax(x[:10], y[:10], 5)) == list(range(10))
+
+    # 64-bit timestamps
+    t = np.array([1, 2, 3, 4, 5, 6], dtype=np.int64) + 10 ** 18
+    assert list(xminmax(t, np.array([0, 2, 1, 1, 3, 0]), 2)) == [0, 1, 4, 5]
+
+
+def test_xy_envelope():
+    x = np.array([0.0, 1.0, 1.5, 10.0])
+    env = render.xy_envelope(x, np.array([1, 2, 3, -1]), size=5)
+    assert env.xstart == 0 and env.xdelta == 2
+    np.testing.assert_array_equal(env.lo, [1, np.nan, np.nan, np.nan, -1])
+    np.testing.assert_array_equal(env.hi, [3, np.nan, np.nan, np.nan, -1])
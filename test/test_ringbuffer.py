@@ -0,0 +1,58 @@
+#!/usr/bin/env pytest
+import numpy as np
+import pytest
+
+from jupyter_sigplot.ringbuffer import RingBuffer
+
+
+def test_write_and_latest():
+    rb = RingBuffer(4, dtype=np.int32)
+    assert len(rb) == 0
+    assert list(rb.latest()) == []
+
+    rb.write([1, 2, 3])
+    assert len(rb) == 3
+    assert list(rb.latest()) == [1, 2, 3]
+
+    rb.write([4, 5])
+    assert len(rb) == 4
+    assert rb.count == 5
+    assert list(rb.latest()) == [2, 3, 4, 5]
+    assert list(rb.latest(2)) == [4, 5]
+
+    # More than the capacity at once
+    rb.write(np.arange(10, 20))
+    assert list(rb.latest()) == [16, 17, 18, 19]
+    assert rb.count == 15
+
+
+def test_views_do_not_copy():
+    rb = RingBuffer(5)
+    storage = rb._buffer
+    stream = []
+    for i in range(7):
+        rb.write(np.arange(i, i + 3))
+        stream.extend(range(i, i + 3))
+        window = rb.latest()
+        assert window.base is storage
+        assert window.flags['C_CONTIGUOUS']
+        assert not window.flags['WRITEABLE']
+        assert list(window) == stream[-5:]
+    assert rb._buffer is storage
+
+
+def test_window():
+    rb = RingBuffer(4)
+    rb.write(np.arange(10))
+    assert list(rb.window(7, 2)) == [7, 8]
+    for start, n in [(5, 2), (8, 3), (7, -1)]:
+        with pytest.raises(IndexError):
+            rb.window(start, n)
+
+    rb.clear()
+    assert len(rb) == 0
+
+
+def test_bad_capacity():
+    with pytest.raises(ValueError):
+        RingBuffer(0)
@@ -0,0 +1,60 @@
+#!/usr/bin/env pytest
+import uuid
+
+import numpy as np
+import pytest
+
+from jupyter_sigplot import sharedstream
+from jupyter_sigplot.sharedstream import StreamProducer, StreamReader
+
+pytestmark = pytest.mark.skipif(sharedstream.shared_memory is None,
+                                reason="needs multiprocessing.shared_memory")
+
+
+@pytest.fixture
+def name():
+    return 'sigplot-test-%s' % uuid.uuid4().hex[:12]
+
+
+def test_write_and_read(name):
+    with StreamProducer(name, capacity=8, dtype=np.int16,
+                        xdelta=0.5) as producer:
+        reader = StreamReader(name)
+        assert (reader.capacity, reader.dtype, reader.xdelta) == \
+            (8, np.dtype('<i2'), 0.5)
+        start, samples = reader.latest()
+        assert (start, list(samples)) == (0, [])
+
+        producer.write(np.arange(5))
+        producer.write(np.arange(5, 11))
+        assert reader.count == 11
+        start, samples = reader.latest()
+        # Wrapped around, still contiguous and not copied
+        assert (start, list(samples)) == (3, list(range(3, 11)))
+        assert not samples.flags.owndata and not samples.flags.writeable
+        assert reader.valid(start)
+
+        start, samples = reader.latest(2)
+        assert (start, list(samples)) == (9, [9, 10])
+
+        # More than the capacity at once keeps the latest
+        producer.write(np.arange(100))
+        assert list(reader.latest()[1]) == list(range(92, 100))
+
+        # Overwritten while read
+        start, samples = reader.latest()
+        producer.write([1])
+        assert not reader.valid(start)
+        del samples
+        reader.close()
+
+
+def test_not_a_stream(name):
+    from multiprocessing import shared_memory
+    shm = shared_memory.SharedMemory(name=name, create=True, size=128)
+    try:
+        with pytest.raises(ValueError):
+            StreamReader(name)
+    finally:
+        shm.close()
+        shm.unlink()
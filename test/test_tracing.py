@@ -0,0 +1,104 @@
+#!/usr/bin/env pytest
+import json
+
+import numpy as np
+from IPython.testing.globalipapp import get_ipython
+
+ip = get_ipython()
+
+from jupyter_sigplot.sigplot import Plot  # noqa: E402
+from jupyter_sigplot.tracing import BROWSER_PID, Tracer  # noqa: E402
+
+
+def test_kernel_spans():
+    plot = Plot()
+    tracer = plot.start_tracing()
+    plot.overlay_array(np.arange(100))
+    plot.change_settings({'ymin': -1})
+
+    first, second = [
+        e for e in tracer.events if e['name'] == 'prepare'
+    ]
+    assert first['args'] == {'command_id': 0, 'command': 'overlay_array'}
+    assert second['args']['command_id'] == 1
+    send = [e for e in tracer.events if e['name'] == 'comm send'][0]
+    assert send['args'] == {
+        'command_id': 0, 'command': 'overlay_array', 'bytes': 400,
+    }
+    # The send happens within the prepare span
+    assert first['ts'] <= send['ts']
+    assert send['ts'] + send['dur'] <= first['ts'] + first['dur']
+    assert plot.command_and_arguments['trace'] == 1
+
+    assert plot.stop_tracing() is tracer
+    plot.change_settings({'ymin': -2})
+    assert 'trace' not in plot.command_and_arguments
+    assert len(tracer.events) == 4
+
+
+def test_push_spans():
+    plot = Plot()
+    tracer = plot.start_tracing()
+    plot.push(np.zeros(10))
+    plot.push(np.zeros(10))
+    ids = set(e['args']['command_id'] for e in tracer.events)
+    assert ids == {0, 1}
+    names = sorted(e['name'] for e in tracer.events)
+    assert names == ['comm send'] * 2 + ['prepare'] * 2
+
+
+def test_method_spans():
+    plot = Plot()
+    tracer = plot.start_tracing()
+    plot.overlay_table({'a': np.arange(4.0)})
+    plot.overlay_xy([1, 2], [3, 4])
+    prepares = [e['args'] for e in tracer.events if e['name'] == 'prepare']
+    assert prepares == [
+        {'command_id': 0, 'command': 'overlay_table'},
+        {'command_id': 1, 'command': 'overlay_xy'},
+    ]
+    assert plot._trace_id is None
+
+
+def test_overlay_files_spans(tmpdir):
+    from jupyter_sigplot import bluefile
+
+    paths = [str(tmpdir.join('%d.tmp' % i)) for i in range(2)]
+    for path in paths:
+        bluefile.write(path, np.arange(100, dtype=np.float32))
+    plot = Plot(path_resolvers=[])
+    tracer = plot.start_tracing()
+    plot.overlay_files(paths, max_workers=1)
+
+    # One command, whatever the number of files
+    prepare, = [e for e in tracer.events if e['name'] == 'prepare']
+    assert prepare['args'] == {'command_id': 0, 'command': 'overlay_files'}
+    sends = [e for e in tracer.events if e['name'] == 'comm send']
+    assert [e['args']['command_id'] for e in sends] == [0, 0]
+
+
+def test_view_spans_and_export(tmpdir):
+    tracer = Tracer()
+    plot = Plot()
+    plot.start_tracing(tracer)
+    plot.overlay_array(np.arange(100))
+
+    spans = [
+        {'name': 'decode', 'id': 0, 'ts': 1e15, 'dur': 10.0},
+        {'name': 'render', 'id': 0, 'ts': 1e15 + 10, 'dur': 500.0},
+    ]
+    plot._handle_custom_msg(plot, {'event': 'trace', 'view': 'c1',
+                                   'spans': spans}, [])
+    plot._handle_custom_msg(plot, {'event': 'other'}, [])
+
+    path = str(tmpdir.join('trace.json'))
+    tracer.export(path)
+    with open(path) as f:
+        trace = json.load(f)
+    events = trace['traceEvents']
+    browser = [e for e in events if e['pid'] == BROWSER_PID and
+               e['ph'] == 'X']
+    assert [e['name'] for e in browser] == ['decode', 'render']
+    assert browser[1]['args'] == {'command_id': 0, 'view': 'c1'}
+    names = [e['args']['name'] for e in events if e['ph'] == 'M']
+    assert names == ['kernel', 'browser', 'view c1']
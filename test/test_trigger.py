@@ -0,0 +1,164 @@
+#!/usr/bin/env pytest
+import numpy as np
+import pytest
+from IPython.testing.globalipapp import get_ipython
+
+ip = get_ipython()
+
+from jupyter_sigplot.sigplot import Plot  # noqa: E402
+from jupyter_sigplot.trigger import Trigger  # noqa: E402
+
+
+def square_wave(n, period):
+    return ((np.arange(n) // (period // 2)) % 2).astype(np.float32)
+
+
+def test_edge_trigger():
+    trigger = Trigger(level=0.5, pre=2, post=3, holdoff=0)
+    frames = trigger.process(square_wave(40, 10))
+    assert [i for i, _ in frames] == [5, 15, 25, 35]
+    for _, frame in frames:
+        assert list(frame) == [0, 0, 1, 1, 1]
+
+    trigger = Trigger(level=0.5, slope='falling', pre=2, post=3, holdoff=0)
+    # The drop at 40 needs samples that haven't arrived yet
+    assert [i for i, _ in trigger.process(square_wave(40, 10))] == \
+        [10, 20, 30]
+
+    trigger = Trigger(level=0.5, slope='both', pre=2, post=3, holdoff=0)
+    assert [i for i, _ in trigger.process(square_wave(40, 10))] == \
+        [5, 10, 15, 20, 25, 30, 35]
+
+    # The stream can't start with an edge
+    trigger = Trigger(level=0.5, slope='falling', pre=0, post=1)
+    assert trigger.process(square_wave(10, 10)) == []
+
+
+def test_trigger_across_chunks():
+    signal = square_wave(1000, 100)
+    expected = Trigger(level=0.5, pre=30, post=70).process(signal)
+    assert [i for i, _ in expected] == list(range(50, 950, 100))
+
+    trigger = Trigger(level=0.5, pre=30, post=70)
+    frames = []
+    for chunk in np.array_split(signal, 37):
+        frames.extend(trigger.process(chunk))
+    assert [i for i, _ in frames] == [i for i, _ in expected]
+    for (_, actual), (_, frame) in zip(frames, expected):
+        assert (actual == frame).all()
+
+
+def test_holdoff():
+    signal = square_wave(100, 10)
+    trigger = Trigger(level=0.5, pre=0, post=1, holdoff=25)
+    assert [i for i, _ in trigger.process(signal)] == [5, 35, 65, 95]
+
+
+def test_threshold_and_level_modes():
+    signal = np.zeros(20, dtype=np.complex64)
+    signal[5:8] = 2j
+    trigger = Trigger(level=1, mode='threshold', pre=1, post=1)
+    assert [i for i, _ in trigger.process(signal)] == [5]
+
+    trigger = Trigger(level=0.5, mode='level', pre=0, post=1, holdoff=2)
+    assert [i for i, _ in trigger.process(square_wave(20, 10))] == \
+        [5, 7, 9, 15, 17, 19]
+
+
+def test_bad_trigger_args():
+    for kwargs in [
+        {'mode': 'foo'},
+        {'slope': 'foo'},
+        {'mode': 'level', 'slope': 'both'},
+        {'post': 0},
+    ]:
+        with pytest.raises(ValueError):
+            Trigger(**kwargs)
+
+
+def test_push():
+    plot = Plot()
+    plot.push(np.arange(10), xdelta=0.5)
+    assert plot.command_and_arguments['command'] == 'overlay_array'
+    layer = plot.command_and_arguments['layer']
+    plot.push(np.arange(10))
+    assert plot.command_and_arguments['command'] == 'reload'
+    assert plot.command_and_arguments['layer'] == layer
+    assert plot.command_and_arguments['arguments'][1]['xdelta'] == 0.5
+    assert len(plot._layers) == 1
+
+
+def test_push_triggered():
+    plot = Plot()
+    plot.trigger = Trigger(level=0.5, pre=2, post=3)
+    plot.persistence = 2
+    sent = []
+    plot.sync_command_and_arguments = sent.append
+
+    plot.push(square_wave(5, 10))
+    assert sent == []
+
+    # Four frames complete at once; only the last two are shown
+    plot.push(square_wave(45, 10)[5:])
+    assert [c['command'] for c in sent] == ['overlay_array', 'overlay_array']
+    assert sent[0]['layer'] != sent[1]['layer']
+    assert sent[0]['arguments'][1] == {'xstart': -2.0, 'xdelta': 1.0}
+
+    plot.push(square_wave(60, 10)[45:])
+    assert [c['command'] for c in sent[2:]] == ['reload', 'reload']
+    assert [c['layer'] for c in sent[2:]] == [c['layer'] for c in sent[:2]]
+
+
+def test_push_window():
+    plot = Plot()
+    plot.stream_window = 4
+    plot.push(np.arange(3))
+    layer = plot._live_layers['window']
+    storage = layer.samples._buffer
+    plot.push(np.arange(3, 6))
+    assert plot.command_and_arguments['command'] == 'reload'
+    window = plot.command_and_arguments['arguments'][0]
+    assert list(window) == [2, 3, 4, 5]
+    # Sent straight from the ring buffer
+    assert window.obj.base is storage
+
+
+@pytest.mark.parametrize('triggered', [False, True])
+def test_push_reaches_trait(triggered):
+    plot = Plot(path_resolvers=[])
+    plot.stream_window = 4
+    if triggered:
+        plot.trigger = Trigger(level=0.5, pre=2, post=3)
+    changes = []
+    plot.observe(changes.append, 'command_and_arguments')
+
+    # Five pushes, each completing a frame when triggered
+    for _ in range(5):
+        plot.push(square_wave(10, 10))
+    assert len(changes) == 5
+    assert [c['new'].get('update') for c in changes] == [None, 1, 2, 3, 4]
+
+
+def test_push_delta():
+    plot = Plot()
+    plot.stream_window = 4
+    plot.stream_updates = 'delta'
+    sent = []
+
+    def record(command_and_arguments):
+        # Sent buffers alias the ring buffer; keep what was sent at the time
+        command_and_arguments['arguments'] = [
+            list(arg) if isinstance(arg, memoryview) else arg
+            for arg in command_and_arguments['arguments']
+        ]
+        sent.append(command_and_arguments)
+    plot.sync_command_and_arguments = record
+
+    plot.push(np.arange(3))
+    plot.push(np.arange(3, 9))
+    assert [c['command'] for c in sent] == ['overlay_pipe', 'push', 'push']
+    assert sent[0]['arguments'][1]['framesize'] == 4
+    assert sent[1]['arguments'][0] == [0, 1, 2]
+    # Only what is still in the window is sent
+    assert sent[2]['arguments'][0] == [5, 6, 7, 8]
+    assert len(set(c['layer'] for c in sent)) == 1